@@ -0,0 +1,99 @@
+"""titiler.xarray benchmarks configuration."""
+
+import os
+
+import numpy
+import pytest
+import xarray
+from generate_dataset import generate
+
+from titiler.xarray import cache, reader
+
+# Grid and time steps of the generated datasets
+RESOLUTION = float(os.environ.get("TITILER_XARRAY_BENCHMARK_RESOLUTION", "1.0"))
+TIMES = int(os.environ.get("TITILER_XARRAY_BENCHMARK_TIMES", "365"))
+
+
+@pytest.fixture(scope="session")
+def large_store(tmp_path_factory):
+    """Global 0.125 degree grid, 4 times and 2 levels, in 1x1x512x512 chunks."""
+    res = 0.125
+    lon = numpy.arange(-180 + res / 2, 180, res)
+    lat = numpy.arange(90 - res / 2, -90, -res)
+    time = numpy.arange("2022-01-01", "2022-01-05", dtype="datetime64[D]")
+    level = numpy.array(["surface", "upper"])
+    data = numpy.random.default_rng(0).random(
+        (len(time), len(level), len(lat), len(lon)), dtype="float32"
+    )
+    ds = xarray.Dataset(
+        {"var": (("time", "level", "lat", "lon"), data)},
+        coords={"time": time, "level": level, "lat": lat, "lon": lon},
+    )
+    src_path = str(tmp_path_factory.mktemp("benchmarks") / "large.zarr")
+    ds.to_zarr(src_path, encoding={"var": {"chunks": (1, 1, 512, 512)}})
+    return src_path
+
+
+@pytest.fixture(scope="session")
+def lon360_store(tmp_path_factory):
+    """Generated dataset with 0 to 360 longitudes."""
+    directory = tmp_path_factory.mktemp("benchmarks")
+    return generate(
+        str(directory / "lon360.zarr"), resolution=RESOLUTION, times=1, lon360=True
+    )
+
+
+@pytest.fixture(scope="session")
+def generated(tmp_path_factory):
+    """Generated datasets, by chunking and format."""
+    directory = tmp_path_factory.mktemp("benchmarks")
+    options = {"resolution": RESOLUTION, "times": TIMES}
+    return {
+        "space-major": generate(
+            str(directory / "space.zarr"), chunks="space-major", **options
+        ),
+        "time-major": generate(
+            str(directory / "time.zarr"), chunks="time-major", **options
+        ),
+        "netcdf-balanced": generate(
+            str(directory / "balanced.nc"),
+            format="netcdf",
+            chunks="balanced",
+            **options,
+        ),
+        "reference-sharded": generate(
+            str(directory / "sharded.json"),
+            format="reference",
+            chunks="space-major",
+            shard_size=16,
+            **options,
+        ),
+    }
+
+
+@pytest.fixture
+def datasets(large_store, generated):
+    """Datasets benchmarked, by name: (path, variable, options)."""
+    return {
+        "zarr": ("tests/fixtures/test_zarr_store.zarr", "CDD0", {}),
+        "netcdf": ("tests/fixtures/testfile.nc", "data", {}),
+        "large": (large_store, "var", {"drop_dim": "level=surface"}),
+        **{
+            name: (src_path, "var", {"reference": name.startswith("reference")})
+            for name, src_path in generated.items()
+        },
+    }
+
+
+@pytest.fixture
+def caches(monkeypatch):
+    """Empty caches, all enabled (redis is fakeredis)."""
+    monkeypatch.setattr(reader.api_settings, "enable_cache", True)
+    monkeypatch.setattr(reader.api_settings, "enable_dataset_cache", True)
+    monkeypatch.setattr(reader.api_settings, "enable_chunk_cache", True)
+    monkeypatch.setattr(
+        reader, "dataset_cache", cache.DatasetCache(maxsize=1024**3, ttl=3600)
+    )
+    monkeypatch.setattr(reader, "chunk_cache", cache.ChunkCache(maxsize=1024**3))
+    reader.cache_client.flushall()
+    return reader.api_settings
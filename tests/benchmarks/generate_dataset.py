@@ -0,0 +1,345 @@
+"""Generate large synthetic datasets, to benchmark production-scale access patterns.
+
+The variable `var(time, lat, lon)` of a global regular grid is written chunk
+by chunk (one chunk in memory at a time) as a zarr store, a NetCDF file or a
+kerchunk reference. Reference chunks are packed `shard_size` chunks per file
+and referenced by byte range, like the shards of a sharded store.
+
+Usage: `python tests/benchmarks/generate_dataset.py OUTPUT --resolution 0.25 --times 1000`
+"""
+
+import argparse
+import base64
+import itertools
+import json
+import math
+import os
+import sys
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import fsspec
+import numpy
+import xarray
+import zarr
+
+# Chunk shapes (time, lat, lon), the time chunk being capped by the times
+CHUNK_PRESETS = {
+    "time-major": (512, 32, 32),
+    "space-major": (1, 512, 512),
+    "balanced": (24, 256, 256),
+}
+
+FORMATS = ("zarr", "netcdf", "reference")
+
+
+def chunk_shape(chunks: str, shape: Tuple[int, int, int]) -> Tuple[int, int, int]:
+    """Chunk shape from a preset name or `time,lat,lon`, capped by the shape."""
+    if chunks in CHUNK_PRESETS:
+        sizes = CHUNK_PRESETS[chunks]
+    else:
+        sizes = tuple(int(size) for size in chunks.split(","))  # type: ignore
+        if len(sizes) != 3:
+            raise ValueError(f"Invalid chunks: {chunks}")
+
+    return tuple(min(size, dim) for size, dim in zip(sizes, shape))  # type: ignore
+
+
+def coords(
+    resolution: float,
+    times: int,
+    lon360: bool = False,
+    calendar: str = "standard",
+) -> Dict[str, Any]:
+    """Daily times from 2000-01-01 and pixel centers of a global grid."""
+    if calendar == "standard":
+        time: Any = numpy.arange(times).astype("timedelta64[D]") + numpy.datetime64(
+            "2000-01-01"
+        )
+    else:
+        time = xarray.cftime_range(
+            "2000-01-01", periods=times, freq="D", calendar=calendar
+        )
+
+    west = 0 if lon360 else -180
+    return {
+        "time": time,
+        "lat": 90 - (numpy.arange(round(180 / resolution)) + 0.5) * resolution,
+        "lon": west + (numpy.arange(round(360 / resolution)) + 0.5) * resolution,
+    }
+
+
+def blocks(
+    shape: Tuple[int, ...], chunks: Tuple[int, ...]
+) -> Iterator[Tuple[Tuple[int, ...], Tuple[slice, ...]]]:
+    """Index and slices of the chunks of an array, in C order."""
+    counts = [math.ceil(size / chunk) for size, chunk in zip(shape, chunks)]
+    for index in itertools.product(*(range(count) for count in counts)):
+        yield index, tuple(
+            slice(i * chunk, min((i + 1) * chunk, size))
+            for i, chunk, size in zip(index, chunks, shape)
+        )
+
+
+def block_data(
+    grid: Dict[str, Any],
+    window: Tuple[slice, ...],
+    dtype: str = "float32",
+    seed: int = 0,
+) -> numpy.ndarray:
+    """
+    Smooth seasonal field plus noise, with NaN over a polar cap (nodata).
+
+    The noise is an integer hash of the element indices, so that the values
+    do not depend on the chunking.
+    """
+    t, i, j = numpy.ix_(*(numpy.arange(s.start, s.stop) for s in window))
+    lat = numpy.radians(grid["lat"][window[1]])[None, :, None]
+    lon = numpy.radians(grid["lon"][window[2]])[None, None, :]
+    noise = (t * 73856093 ^ i * 19349663 ^ j * 83492791 ^ seed) % 1024 / 1024
+    data = (
+        15 * numpy.cos(lat)
+        + 5 * numpy.sin(2 * math.pi * t / 365) * numpy.sin(lat)
+        + numpy.cos(3 * lon)
+        + 2 * noise
+    )
+    data[:, numpy.degrees(lat[0, :, 0]) < -80, :] = numpy.nan
+    return data.astype(dtype)
+
+
+def write_coords(store: Any, grid: Dict[str, Any], calendar: str = "standard") -> None:
+    """Write the coordinates of a zarr store."""
+    encoding = {}
+    if calendar != "standard":
+        encoding["time"] = {"units": "days since 2000-01-01", "calendar": calendar}
+    ds = xarray.Dataset(coords=grid)
+    ds.to_zarr(store, mode="w", consolidated=False, encoding=encoding)
+
+
+def create_variable(
+    store: Any,
+    variable: str,
+    shape: Tuple[int, ...],
+    chunks: Tuple[int, ...],
+    dtype: str,
+) -> zarr.Array:
+    """Create the (empty) variable array of a zarr store."""
+    group = zarr.open_group(store, mode="r+")
+    array = group.create(
+        variable, shape=shape, chunks=chunks, dtype=dtype, fill_value=numpy.nan
+    )
+    array.attrs.update({"_ARRAY_DIMENSIONS": ["time", "lat", "lon"]})
+    return array
+
+
+def write_zarr(
+    output: str,
+    grid: Dict[str, Any],
+    variable: str,
+    chunks: Tuple[int, ...],
+    dtype: str,
+    calendar: str,
+    seed: int,
+    progress: Callable[[int], None],
+) -> None:
+    """Write a zarr store, chunk by chunk."""
+    store = fsspec.get_mapper(output)
+    write_coords(store, grid, calendar=calendar)
+    shape = tuple(len(grid[dim]) for dim in ("time", "lat", "lon"))
+    array = create_variable(store, variable, shape, chunks, dtype)
+    for _, window in blocks(shape, chunks):
+        array[window] = block_data(grid, window, dtype=dtype, seed=seed)
+        progress(1)
+
+    zarr.consolidate_metadata(store)
+
+
+def write_netcdf(
+    output: str,
+    grid: Dict[str, Any],
+    variable: str,
+    chunks: Tuple[int, ...],
+    dtype: str,
+    calendar: str,
+    seed: int,
+    progress: Callable[[int], None],
+) -> None:
+    """Write a NetCDF (HDF5) file with chunked and compressed data, chunk by chunk."""
+    import h5netcdf
+
+    encoding = {}
+    if calendar != "standard":
+        encoding["time"] = {"units": "days since 2000-01-01", "calendar": calendar}
+    xarray.Dataset(coords=grid).to_netcdf(output, engine="h5netcdf", encoding=encoding)
+
+    shape = tuple(len(grid[dim]) for dim in ("time", "lat", "lon"))
+    with h5netcdf.File(output, "a") as f:
+        var = f.create_variable(
+            variable,
+            ("time", "lat", "lon"),
+            dtype,
+            chunks=chunks,
+            fillvalue=numpy.nan,
+            compression="gzip",
+            compression_opts=1,
+        )
+        for _, window in blocks(shape, chunks):
+            var[window] = block_data(grid, window, dtype=dtype, seed=seed)
+            progress(1)
+
+
+def write_reference(
+    output: str,
+    grid: Dict[str, Any],
+    variable: str,
+    chunks: Tuple[int, ...],
+    dtype: str,
+    calendar: str,
+    seed: int,
+    progress: Callable[[int], None],
+    shard_size: int = 1,
+) -> None:
+    """
+    Write a kerchunk reference (version 1) to `output` and its chunks in shards.
+
+    The metadata and the coordinates are inlined, the variable chunks are
+    encoded as zarr would and appended to the `{output}.data/N.bin` shards.
+    """
+    store: Dict[str, bytes] = {}
+    write_coords(store, grid, calendar=calendar)
+    shape = tuple(len(grid[dim]) for dim in ("time", "lat", "lon"))
+    array = create_variable(store, variable, shape, chunks, dtype)
+    zarr.consolidate_metadata(store)
+
+    refs: Dict[str, Any] = {
+        key: (
+            value.decode()
+            if key.rsplit("/", 1)[-1].startswith(".")
+            else "base64:" + base64.b64encode(value).decode()
+        )
+        for key, value in store.items()
+    }
+
+    directory = os.path.abspath(f"{output}.data")
+    os.makedirs(directory, exist_ok=True)
+    shard: Optional[Any] = None
+    for n, (index, window) in enumerate(blocks(shape, chunks)):
+        if n % shard_size == 0:
+            if shard is not None:
+                shard.close()
+            path = os.path.join(directory, f"{n // shard_size}.bin")
+            shard = open(path, "wb")
+
+        # edge chunks are padded to the chunk shape, as zarr stores them
+        chunk = numpy.full(chunks, numpy.nan, dtype=dtype)
+        data = block_data(grid, window, dtype=dtype, seed=seed)
+        chunk[tuple(slice(0, size) for size in data.shape)] = data
+        encoded = array.compressor.encode(chunk)
+        key = f"{variable}/{'.'.join(str(i) for i in index)}"
+        refs[key] = [path, shard.tell(), len(encoded)]  # type: ignore
+        shard.write(encoded)  # type: ignore
+        progress(1)
+
+    if shard is not None:
+        shard.close()
+
+    with open(output, "w") as f:
+        json.dump({"version": 1, "refs": refs}, f)
+
+
+def generate(
+    output: str,
+    format: str = "zarr",
+    resolution: float = 0.25,
+    times: int = 365,
+    lon360: bool = False,
+    calendar: str = "standard",
+    chunks: str = "space-major",
+    shard_size: int = 1,
+    variable: str = "var",
+    dtype: str = "float32",
+    seed: int = 0,
+    log: Optional[Callable[[str], None]] = None,
+) -> str:
+    """
+    Generate a dataset, returns `output`.
+
+    `chunks` is a preset (see `CHUNK_PRESETS`) or `time,lat,lon` sizes,
+    `shard_size` the chunks per shard file of the `reference` format.
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Invalid format: {format}")
+
+    grid = coords(resolution, times, lon360=lon360, calendar=calendar)
+    shape = (times, len(grid["lat"]), len(grid["lon"]))
+    chunk_sizes = chunk_shape(chunks, shape)
+    total = math.prod(math.ceil(s / c) for s, c in zip(shape, chunk_sizes))
+    written: List[int] = [0]
+
+    def progress(count: int) -> None:
+        written[0] += count
+        if log and (written[0] % 1000 == 0 or written[0] == total):
+            log(f"{written[0]}/{total} chunks")
+
+    options: Dict[str, Any] = {}
+    if format == "reference":
+        options["shard_size"] = shard_size
+
+    writer = {"zarr": write_zarr, "netcdf": write_netcdf, "reference": write_reference}
+    writer[format](
+        output,
+        grid,
+        variable,
+        chunk_sizes,
+        dtype,
+        calendar,
+        seed,
+        progress,
+        **options,
+    )
+    return output
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    """Command line interface of the dataset generator."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("output", help="Zarr store, NetCDF file or reference JSON")
+    parser.add_argument("--format", default="zarr", choices=FORMATS)
+    parser.add_argument("--resolution", type=float, default=0.25, help="Degrees")
+    parser.add_argument("--times", type=int, default=365, help="Daily time steps")
+    parser.add_argument("--lon360", action="store_true", help="0 to 360 longitudes")
+    parser.add_argument(
+        "--calendar",
+        default="standard",
+        help="CF calendar (e.g. noleap, 360_day, julian), decoded with cftime",
+    )
+    parser.add_argument(
+        "--chunks",
+        default="space-major",
+        help=f"{', '.join(CHUNK_PRESETS)} or time,lat,lon sizes",
+    )
+    parser.add_argument(
+        "--shard-size", type=int, default=1, help="Chunks per shard (reference)"
+    )
+    parser.add_argument("--variable", default="var")
+    parser.add_argument("--dtype", default="float32")
+    parser.add_argument("--seed", type=int, default=0)
+    options = parser.parse_args(args)
+
+    generate(
+        options.output,
+        format=options.format,
+        resolution=options.resolution,
+        times=options.times,
+        lon360=options.lon360,
+        calendar=options.calendar,
+        chunks=options.chunks,
+        shard_size=options.shard_size,
+        variable=options.variable,
+        dtype=options.dtype,
+        seed=options.seed,
+        log=lambda message: print(message, file=sys.stderr),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,483 @@
+"""Load test the tile endpoints against a local S3 server.
+
+Generated datasets are uploaded to an in-process S3-compatible server (moto),
+with an optional latency injected in every S3 request, and served through the
+`s3://` code path of the reader. Tile-browsing traces (users panning and
+zooming a map viewport) are replayed against the ASGI app, or a running
+server, with a number of concurrent users, and the latency percentiles and
+throughput are reported.
+
+Usage: `python tests/benchmarks/load_test.py --latency 0.02 --users 8 --sessions 32`
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+import morecantile
+import numpy
+import s3fs
+from generate_dataset import CHUNK_PRESETS, generate
+from morecantile import Tile
+
+# Default rendering query of the tiles
+QUERY = "rescale=0,20&colormap_name=viridis"
+
+# Credentials and region accepted by the local S3 server
+S3_ENVIRONMENT = {
+    "AWS_ACCESS_KEY_ID": "testing",
+    "AWS_SECRET_ACCESS_KEY": "testing",
+    "AWS_DEFAULT_REGION": "us-east-1",
+}
+
+
+class S3Server:
+    """
+    Local S3-compatible (moto) server, in a thread.
+
+    `latency` seconds are added to every request, as a stand-in for the
+    round trip to S3.
+    """
+
+    def __init__(self, latency: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        """Set the server options, the server is started by `start`."""
+        self.latency = latency
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self._server: Optional[Any] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def endpoint_url(self) -> str:
+        """URL of the server."""
+        return f"http://{self.host}:{self.port}"
+
+    def app(self, environ, start_response):
+        """Moto WSGI application, after the injected latency."""
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self._app(environ, start_response)
+
+    def start(self) -> "S3Server":
+        """Start the server and point the S3 clients to it."""
+        from moto.moto_server.werkzeug_app import (
+            DomainDispatcherApplication,
+            create_backend_app,
+        )
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        class RequestHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+
+        self._app = DomainDispatcherApplication(create_backend_app)
+        self._server = make_server(
+            self.host,
+            self.port,
+            self.app,
+            threaded=True,
+            request_handler=RequestHandler,
+        )
+        self.port = self._server.server_port
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+        os.environ.update({**S3_ENVIRONMENT, "AWS_ENDPOINT_URL": self.endpoint_url})
+        # filesystems are cached with the endpoint they were created with
+        s3fs.S3FileSystem.clear_instance_cache()
+        return self
+
+    def stop(self) -> None:
+        """Stop the server."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._thread.join()  # type: ignore
+            self._server = None
+
+        os.environ.pop("AWS_ENDPOINT_URL", None)
+        s3fs.S3FileSystem.clear_instance_cache()
+
+    def __enter__(self):
+        """Start the server."""
+        return self.start()
+
+    def __exit__(self, *args):
+        """Stop the server."""
+        self.stop()
+
+
+def upload_dataset(src_path: str, bucket: str, format: str = "zarr") -> str:
+    """
+    Upload a generated dataset to `bucket`, returns its URL for the reader.
+
+    Reference chunks are uploaded and the reference, pointing to them, stays
+    local (the reader opens references with `reference=True`). The bucket is
+    public, references being read anonymously.
+    """
+    fs = s3fs.S3FileSystem()
+    if not fs.exists(bucket):
+        fs.mkdir(bucket, acl="public-read")
+
+    name = os.path.basename(src_path.rstrip("/"))
+    if format != "reference":
+        fs.put(src_path, f"{bucket}/{name}", recursive=format == "zarr")
+        return f"s3://{bucket}/{name}"
+
+    directory = os.path.abspath(f"{src_path}.data")
+    fs.put(directory, f"{bucket}/{name}.data", recursive=True)
+    with open(src_path) as f:
+        references = json.load(f)
+    for value in references["refs"].values():
+        if isinstance(value, list):
+            value[0] = value[0].replace(directory, f"s3://{bucket}/{name}.data")
+
+    with open(src_path, "w") as f:
+        json.dump(references, f)
+    return src_path
+
+
+def viewport_tiles(
+    tms: morecantile.TileMatrixSet, center: Tile, size: Tuple[int, int]
+) -> List[Tile]:
+    """Tiles of a `size` (columns, rows) viewport, from its center outwards."""
+    matrix = tms.matrix(center.z)
+    tiles = []
+    for row in range(center.y - size[1] // 2, center.y + (size[1] + 1) // 2):
+        if not 0 <= row < matrix.matrixHeight:
+            continue
+        for col in range(center.x - size[0] // 2, center.x + (size[0] + 1) // 2):
+            tiles.append(Tile(col % matrix.matrixWidth, row, center.z))
+
+    return sorted(
+        set(tiles), key=lambda t: (abs(t.x - center.x) + abs(t.y - center.y), t)
+    )
+
+
+def browse_trace(
+    tms: morecantile.TileMatrixSet,
+    sessions: int,
+    steps: int,
+    minzoom: int = 1,
+    maxzoom: int = 5,
+    bounds: Tuple[float, float, float, float] = (-180, -60, 180, 60),
+    viewport: Tuple[int, int] = (4, 3),
+    seed: int = 0,
+) -> List[List[List[Tile]]]:
+    """
+    Tile-browsing sessions, as lists of viewports.
+
+    A session starts at a random zoom and location within `bounds`, then pans
+    by one or two tiles (60%), zooms in (20%) or zooms out (20%) at each step.
+    """
+    rng = random.Random(seed)
+    trace = []
+    for _ in range(sessions):
+        zoom = rng.randint(minzoom, max(minzoom, maxzoom - 1))
+        lng = rng.uniform(bounds[0], bounds[2])
+        lat = rng.uniform(bounds[1], bounds[3])
+        center = tms.tile(lng, lat, zoom)
+        session = [viewport_tiles(tms, center, viewport)]
+        for _ in range(steps - 1):
+            action = rng.random()
+            if action < 0.6 or not minzoom <= center.z + 1 <= maxzoom:
+                dx, dy = rng.choice([(1, 0), (-1, 0), (0, 1), (0, -1), (2, 0), (-2, 0)])
+                matrix = tms.matrix(center.z)
+                center = Tile(
+                    (center.x + dx) % matrix.matrixWidth,
+                    min(max(center.y + dy, 0), matrix.matrixHeight - 1),
+                    center.z,
+                )
+            elif action < 0.8 and center.z < maxzoom:
+                center = tms.children(center)[rng.randrange(4)]
+            elif center.z > minzoom:
+                center = tms.parent(center)[0]
+
+            session.append(viewport_tiles(tms, center, viewport))
+        trace.append(session)
+
+    return trace
+
+
+@dataclass
+class Sample:
+    """A tile request of the load test."""
+
+    session: int
+    step: int
+    z: int
+    x: int
+    y: int
+    status: int
+    latency: float
+    size: int
+
+
+async def replay(
+    client: httpx.AsyncClient,
+    path: str,
+    params: Dict[str, Any],
+    trace: Sequence[Sequence[Sequence[Tile]]],
+    users: int = 8,
+    connections: int = 6,
+    think_time: float = 0.0,
+) -> List[Sample]:
+    """
+    Replay the sessions of a trace with `users` concurrent users.
+
+    The tiles of a viewport are requested concurrently, at most `connections`
+    at a time (as browsers do per host), and the next viewport once they are
+    all loaded.
+    """
+    samples: List[Sample] = []
+    sessions: asyncio.Queue = asyncio.Queue()
+    for item in enumerate(trace):
+        sessions.put_nowait(item)
+
+    async def fetch(index: int, step: int, tile: Tile, limit: asyncio.Semaphore):
+        async with limit:
+            start = time.perf_counter()
+            response = await client.get(
+                path.format(z=tile.z, x=tile.x, y=tile.y), params=params
+            )
+            latency = time.perf_counter() - start
+        samples.append(
+            Sample(
+                index,
+                step,
+                tile.z,
+                tile.x,
+                tile.y,
+                response.status_code,
+                latency,
+                len(response.content),
+            )
+        )
+
+    async def user():
+        limit = asyncio.Semaphore(connections)
+        while not sessions.empty():
+            index, session = sessions.get_nowait()
+            for step, tiles in enumerate(session):
+                await asyncio.gather(
+                    *(fetch(index, step, tile, limit) for tile in tiles)
+                )
+                if think_time:
+                    await asyncio.sleep(think_time)
+
+    await asyncio.gather(*(user() for _ in range(users)))
+    return samples
+
+
+def latency_stats(latencies: Sequence[float]) -> Dict[str, float]:
+    """Latency mean, percentiles and maximum, in milliseconds."""
+    if not len(latencies):
+        return {}
+
+    values = numpy.asarray(latencies) * 1000
+    p50, p95, p99 = numpy.percentile(values, [50, 95, 99])
+    return {
+        "mean": round(float(values.mean()), 2),
+        "p50": round(float(p50), 2),
+        "p95": round(float(p95), 2),
+        "p99": round(float(p99), 2),
+        "max": round(float(values.max()), 2),
+    }
+
+
+def report(samples: Sequence[Sample], duration: float) -> Dict[str, Any]:
+    """Throughput, errors and latency statistics, overall and by zoom."""
+    latencies = [sample.latency for sample in samples]
+    zooms = sorted({sample.z for sample in samples})
+    return {
+        "requests": len(samples),
+        "errors": sum(sample.status >= 400 for sample in samples),
+        "duration": round(duration, 3),
+        "throughput": round(len(samples) / duration, 2) if duration else 0.0,
+        "bytes": sum(sample.size for sample in samples),
+        "latency": latency_stats(latencies),
+        "zoom": {
+            zoom: {
+                "requests": sum(sample.z == zoom for sample in samples),
+                **latency_stats([s.latency for s in samples if s.z == zoom]),
+            }
+            for zoom in zooms
+        },
+    }
+
+
+def format_report(result: Dict[str, Any]) -> str:
+    """Report as text."""
+    lines = [
+        f"{result['requests']} requests, {result['errors']} errors in "
+        f"{result['duration']:.1f}s: {result['throughput']:.1f} req/s, "
+        f"{result['bytes'] / 1024**2:.1f} MiB",
+    ]
+    if "s3_requests" in result:
+        lines.append(f"{result['s3_requests']} S3 requests")
+
+    header = ("", "requests", "mean", "p50", "p95", "p99", "max")
+    lines.append("".join(f"{name:>10}" for name in header) + "  (ms)")
+    rows = [("all", {"requests": result["requests"], **result["latency"]})]
+    rows += [(f"z{zoom}", stats) for zoom, stats in result["zoom"].items()]
+    for name, stats in rows:
+        values = [stats.get(key, math.nan) for key in header[1:]]
+        lines.append(f"{name:>10}{values[0]:>10}" + "".join(f"{v:>10.1f}" for v in values[1:]))  # fmt: skip
+
+    return "\n".join(lines)
+
+
+async def load_test(
+    url: str,
+    trace: Sequence[Sequence[Sequence[Tile]]],
+    variable: str = "var",
+    query: str = QUERY,
+    users: int = 8,
+    connections: int = 6,
+    think_time: float = 0.0,
+    reference: bool = False,
+    base_url: Optional[str] = None,
+    format: str = "png",
+) -> Dict[str, Any]:
+    """
+    Replay a trace on the tiles of `url`, returns the report.
+
+    Requests go to the ASGI app in process, or to `base_url` if set.
+    """
+    params = dict(httpx.QueryParams(query))
+    params.update({"url": url, "variable": variable})
+    if reference:
+        params["reference"] = "true"
+
+    if base_url:
+        client = httpx.AsyncClient(base_url=base_url, timeout=300)
+    else:
+        from titiler.xarray.main import app
+
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app),
+            base_url="http://testserver",
+            timeout=300,
+        )
+
+    async with client:
+        start = time.perf_counter()
+        samples = await replay(
+            client,
+            f"/tiles/{{z}}/{{x}}/{{y}}.{format}",
+            params,
+            trace,
+            users=users,
+            connections=connections,
+            think_time=think_time,
+        )
+        result = report(samples, time.perf_counter() - start)
+        response = await client.get("/cache_stats")
+        if response.status_code == 200:
+            result["cache_stats"] = response.json()
+
+    result["samples"] = [asdict(sample) for sample in samples]
+    return result
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    """Command line interface of the load test."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    dataset = parser.add_argument_group("dataset")
+    dataset.add_argument("--url", help="Existing dataset, nothing is generated")
+    dataset.add_argument("--variable", default="var")
+    dataset.add_argument("--reference", action="store_true", help="--url is a reference")  # fmt: skip
+    dataset.add_argument("--format", default="zarr", choices=("zarr", "netcdf", "reference"))  # fmt: skip
+    dataset.add_argument("--resolution", type=float, default=0.25, help="Degrees")
+    dataset.add_argument("--times", type=int, default=10, help="Daily time steps")
+    dataset.add_argument(
+        "--chunks",
+        default="space-major",
+        help=f"{', '.join(CHUNK_PRESETS)} or time,lat,lon sizes",
+    )
+    dataset.add_argument("--shard-size", type=int, default=16)
+    server = parser.add_argument_group("S3 server")
+    server.add_argument("--latency", type=float, default=0.0, help="Seconds per S3 request")  # fmt: skip
+    server.add_argument("--bucket", default="titiler-xarray-load-test")
+    load = parser.add_argument_group("load")
+    load.add_argument("--query", default=QUERY, help="Tile query parameters")
+    load.add_argument("--sessions", type=int, default=32)
+    load.add_argument("--steps", type=int, default=10, help="Viewports per session")
+    load.add_argument("--users", type=int, default=8, help="Concurrent users")
+    load.add_argument("--connections", type=int, default=6, help="Per user")
+    load.add_argument("--think-time", type=float, default=0.0, help="Seconds")
+    load.add_argument("--minzoom", type=int, default=1)
+    load.add_argument("--maxzoom", type=int, default=5)
+    load.add_argument("--seed", type=int, default=0)
+    load.add_argument("--base-url", help="Running server, instead of the ASGI app")
+    parser.add_argument("--output", help="JSON report, with every request")
+    options = parser.parse_args(args)
+
+    tms = morecantile.tms.get("WebMercatorQuad")
+    trace = browse_trace(
+        tms,
+        options.sessions,
+        options.steps,
+        minzoom=options.minzoom,
+        maxzoom=options.maxzoom,
+        seed=options.seed,
+    )
+
+    def run(url: str, reference: bool) -> Dict[str, Any]:
+        return asyncio.run(
+            load_test(
+                url,
+                trace,
+                variable=options.variable,
+                query=options.query,
+                users=options.users,
+                connections=options.connections,
+                think_time=options.think_time,
+                reference=reference,
+                base_url=options.base_url,
+            )
+        )
+
+    if options.url:
+        result = run(options.url, options.reference)
+    else:
+        extension = {"zarr": "zarr", "netcdf": "nc", "reference": "json"}
+        with tempfile.TemporaryDirectory() as directory, S3Server(
+            latency=options.latency
+        ) as s3_server:
+            src_path = generate(
+                os.path.join(directory, f"dataset.{extension[options.format]}"),
+                format=options.format,
+                resolution=options.resolution,
+                times=options.times,
+                chunks=options.chunks,
+                shard_size=options.shard_size,
+                variable=options.variable,
+                log=lambda message: print(message, file=sys.stderr),
+            )
+            url = upload_dataset(src_path, options.bucket, format=options.format)
+            s3_server.requests = 0
+            result = run(url, options.format == "reference")
+            result["s3_requests"] = s3_server.requests
+
+    print(format_report(result))
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
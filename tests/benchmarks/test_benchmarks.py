@@ -0,0 +1,132 @@
+"""Benchmarks of the reader and rendering hot paths.
+
+Run with `python -m pytest tests/benchmarks --benchmark-only --benchmark-autosave`
+and compare with a previous run with `--benchmark-compare`.
+"""
+
+import pickle
+
+import numpy
+import pytest
+from rio_tiler.colormap import cmap
+from rio_tiler.models import ImageData
+
+from titiler.core.resources.enums import ImageType
+from titiler.xarray import reader
+from titiler.xarray.cache import cache_key_prefix, dataset_cache_key
+from titiler.xarray.factory import render_tile
+
+DATASETS = ["zarr", "netcdf", "large"]
+GENERATED = ["space-major", "time-major", "netcdf-balanced", "reference-sharded"]
+
+
+@pytest.mark.parametrize("dataset", DATASETS)
+@pytest.mark.parametrize("cache", ["cold", "redis", "pickle", "memory"])
+def test_open_dataset(benchmark, caches, datasets, dataset, cache):
+    """
+    Open a dataset without cache, from the redis metadata or from memory.
+
+    `pickle` times the former redis cache of pickled datasets, for comparison
+    with the replay of the recorded metadata (`redis`). The sizes of the redis
+    entries are in the `entry_size` extra info.
+    """
+    benchmark.group = f"xarray_open_dataset-{dataset}"
+    src_path, _, _ = datasets[dataset]
+    caches.enable_cache = cache == "redis"
+    caches.enable_dataset_cache = cache == "memory"
+    if cache == "cold":
+
+        def setup():
+            # the chunks of the coordinates and metadata are read again each round
+            reader.chunk_cache.invalidate(cache_key_prefix(src_path=src_path))
+            return (src_path,), {}
+
+        benchmark.pedantic(reader.xarray_open_dataset, setup=setup, rounds=20)
+        return
+
+    key = dataset_cache_key(
+        src_path, group=None, reference=False, decode_times=True, consolidated=True
+    )
+    if cache == "pickle":
+        # the chunk cache (and its lock) is not part of a pickled dataset
+        caches.enable_chunk_cache = False
+        key = f"{key}:pickle"
+        reader.cache_client.set(key, pickle.dumps(reader.xarray_open_dataset(src_path)))
+        benchmark.extra_info["entry_size"] = len(reader.cache_client.get(key))
+        benchmark(lambda: pickle.loads(reader.cache_client.get(key)))
+        return
+
+    reader.xarray_open_dataset(src_path)
+    if cache == "redis":
+        benchmark.extra_info["entry_size"] = len(reader.cache_client.get(key))
+    benchmark(reader.xarray_open_dataset, src_path)
+
+
+@pytest.mark.parametrize(
+    "case,options",
+    [
+        ("default", {}),
+        ("datetime", {"datetime": "2022-01-03"}),
+        ("drop_dim", {"drop_dim": "level=upper"}),
+        ("lon_wrap", {}),
+    ],
+)
+def test_get_variable(benchmark, caches, large_store, lon360_store, case, options):
+    """Select a variable, a time, a dimension value and wrap longitudes."""
+    benchmark.group = "get_variable"
+    src_path = lon360_store if case == "lon_wrap" else large_store
+    if "drop_dim" not in options and src_path == large_store:
+        options = {**options, "drop_dim": "level=surface"}
+
+    ds = reader.xarray_open_dataset(src_path)
+    benchmark(reader.get_variable, ds, "var", **options)
+
+
+@pytest.mark.parametrize("dataset", DATASETS + GENERATED)
+@pytest.mark.parametrize("scale", [1, 2, 3, 4])
+def test_tile(benchmark, caches, datasets, dataset, scale):
+    """Read a zoom 2 tile, the chunks being in the chunk cache."""
+    benchmark.group = f"tile-{dataset}"
+    src_path, variable, options = datasets[dataset]
+    with reader.ZarrReader(src_path, variable=variable, **options) as src_dst:
+        benchmark(src_dst.tile, 2, 1, 2, tilesize=scale * 256)
+
+
+@pytest.mark.parametrize("dataset", DATASETS + GENERATED)
+@pytest.mark.parametrize("approx", [False, True])
+def test_histogram(benchmark, app, caches, datasets, dataset, approx):
+    """Histogram of a variable, exact or from a subset of the elements."""
+    benchmark.group = f"histogram-{dataset}"
+    src_path, variable, options = datasets[dataset]
+    params = {"url": src_path, "variable": variable, "approx": approx, **options}
+
+    def histogram():
+        response = app.get("/histogram", params=params)
+        assert response.status_code == 200
+
+    benchmark(histogram)
+
+
+@pytest.mark.parametrize("dataset", GENERATED)
+def test_time_series(benchmark, caches, datasets, dataset):
+    """Read the time series of a pixel, without the chunk cache."""
+    benchmark.group = "time_series"
+    caches.enable_chunk_cache = False
+    src_path, variable, options = datasets[dataset]
+    with reader.ZarrReader(src_path, variable=variable, **options) as src_dst:
+        benchmark(lambda: src_dst.point_array(10.0, 45.0).values)
+
+
+@pytest.mark.parametrize(
+    "format", [ImageType.png, ImageType.jpeg, ImageType.webp, ImageType.npy]
+)
+@pytest.mark.parametrize("scale", [1, 4])
+def test_render(benchmark, format, scale):
+    """Rescale, color and encode a tile."""
+    benchmark.group = f"render-{scale}x"
+    size = scale * 256
+    data = numpy.random.default_rng(0).random((1, size, size), dtype="float32")
+    image = ImageData(numpy.ma.MaskedArray(data))
+    colormap = cmap.get("viridis") if format != ImageType.npy else None
+
+    benchmark(render_tile, image, format, rescale=[(0, 1)], colormap=colormap)
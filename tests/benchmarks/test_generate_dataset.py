@@ -0,0 +1,53 @@
+"""Test the dataset generator."""
+
+import numpy
+import pytest
+import xarray
+from generate_dataset import chunk_shape, generate
+
+from titiler.xarray import reader
+
+
+def test_chunk_shape():
+    """Presets and custom chunks are capped by the shape."""
+    assert chunk_shape("time-major", (365, 720, 1440)) == (365, 32, 32)
+    assert chunk_shape("space-major", (365, 180, 360)) == (1, 180, 360)
+    assert chunk_shape("10,20,30", (365, 180, 360)) == (10, 20, 30)
+    with pytest.raises(ValueError):
+        chunk_shape("10,20", (365, 180, 360))
+
+
+@pytest.mark.parametrize("calendar", ["standard", "noleap"])
+def test_generate(tmp_path, calendar):
+    """The formats and chunkings hold the same values."""
+    options = {"resolution": 2.0, "times": 10, "calendar": calendar}
+    paths = {
+        "zarr": generate(str(tmp_path / "a.zarr"), **options),
+        "netcdf": generate(
+            str(tmp_path / "b.nc"), format="netcdf", chunks="balanced", **options
+        ),
+        "reference": generate(
+            str(tmp_path / "c.json"),
+            format="reference",
+            chunks="3,50,50",
+            shard_size=4,
+            **options,
+        ),
+    }
+
+    values = []
+    for format, src_path in paths.items():
+        with reader.ZarrReader(
+            src_path, variable="var", reference=format == "reference", datetime=None
+        ) as src_dst:
+            assert src_dst.bounds == pytest.approx((-180, -90, 180, 90))
+            values.append(src_dst.time_series().values)
+
+    assert values[0].shape == (10, 90, 180)
+    numpy.testing.assert_array_equal(values[0], values[1])
+    numpy.testing.assert_array_equal(values[0], values[2])
+
+    ds = xarray.open_dataset(paths["zarr"], engine="zarr")
+    assert ds["time"].dt.calendar == (
+        "proleptic_gregorian" if calendar == "standard" else calendar
+    )
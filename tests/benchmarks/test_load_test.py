@@ -0,0 +1,66 @@
+"""Test the load test harness."""
+
+import asyncio
+
+import morecantile
+import pytest
+from generate_dataset import generate
+from load_test import S3Server, Sample, browse_trace, load_test, report, upload_dataset
+
+tms = morecantile.tms.get("WebMercatorQuad")
+
+
+def test_browse_trace():
+    """Sessions pan and zoom within the zoom range, the same for a seed."""
+    trace = browse_trace(tms, 4, 10, minzoom=1, maxzoom=4, seed=1)
+    assert len(trace) == 4
+    assert all(len(session) == 10 for session in trace)
+    assert trace == browse_trace(tms, 4, 10, minzoom=1, maxzoom=4, seed=1)
+
+    for session in trace:
+        for viewport in session:
+            assert 0 < len(viewport) <= 12
+            assert len({tile.z for tile in viewport}) == 1
+            assert all(tms.is_valid(tile) for tile in viewport)
+            assert 1 <= viewport[0].z <= 4
+
+
+def test_report():
+    """Latency percentiles, throughput and errors."""
+    samples = [
+        Sample(0, 0, 1, 0, 0, 200, latency / 1000, 10) for latency in range(1, 101)
+    ]
+    samples[0].status = 500
+    result = report(samples, 2.0)
+    assert result["requests"] == 100
+    assert result["errors"] == 1
+    assert result["throughput"] == 50
+    assert result["latency"]["p50"] == pytest.approx(50.5)
+    assert result["latency"]["max"] == 100
+    assert result["zoom"][1]["requests"] == 100
+
+
+@pytest.mark.parametrize("format", ["zarr", "netcdf", "reference"])
+def test_load_test(tmp_path, format):
+    """Tiles are read from the local S3 server."""
+    extension = {"zarr": "zarr", "netcdf": "nc", "reference": "json"}
+    trace = browse_trace(tms, 2, 3, minzoom=1, maxzoom=3)
+    with S3Server(latency=0.001) as s3_server:
+        src_path = generate(
+            str(tmp_path / f"dataset.{extension[format]}"),
+            format=format,
+            resolution=5,
+            times=2,
+            chunks="1,18,36",
+        )
+        url = upload_dataset(src_path, "bucket", format=format)
+        s3_server.requests = 0
+        result = asyncio.run(
+            load_test(url, trace, users=2, reference=format == "reference")
+        )
+
+        assert s3_server.requests > 0
+
+    assert result["requests"] == sum(len(v) for session in trace for v in session)
+    assert result["errors"] == 0
+    assert set(result["latency"]) == {"mean", "p50", "p95", "p99", "max"}
@@ -1,8 +1,20 @@
 """titiler.xarray tests configuration."""
 
+import os
+
 import pytest
 from fastapi.testclient import TestClient
 
+# Use fakeredis for modules imported at collection time
+os.environ.setdefault("TEST_ENVIRONMENT", "1")
+
+
+def pytest_ignore_collect(collection_path, config):
+    """Only collect the benchmarks with `--benchmark-only` (pytest-benchmark)."""
+    if collection_path.name == "benchmarks":
+        return not getattr(config.option, "benchmark_only", False)
+    return None
+
 
 @pytest.fixture
 def app(monkeypatch):
@@ -1,8 +1,13 @@
+import io
 import json
 import os
+import zipfile
 
+import numpy as np
 from helpers import find_string_in_stream
 
+from titiler.xarray.animation import png_chunks
+
 DATA_DIR = "tests/fixtures"
 test_zarr_store = os.path.join(DATA_DIR, "test_zarr_store.zarr")
 test_reference_store = os.path.join(DATA_DIR, "reference.json")
@@ -183,13 +188,13 @@ def test_get_tile_pyramid(app):
         get_tile_test(app, test_pyramid_store_params, zoom=z)
 
 
-def test_get_tile_pyramid_error(app):
+def test_get_tile_pyramid_finest_level(app):
+    # zooms finer than the finest level are read from the finest level
     response = app.get(
         "/tiles/3/0/0.png",
         params=test_pyramid_store_params["params"],
     )
-    assert response.status_code == 422
-    assert response.json() == {"detail": "group not found at path '3'"}
+    assert response.status_code == 200
 
 
 def histogram_test(app, ds_params):
@@ -256,3 +261,105 @@ def test_map_with_params(app):
     assert response.status_code == 200
     assert response.headers["Content-Type"] == "text/html; charset=utf-8"
     assert find_string_in_stream(response, "<div id='map' class=\"hidden\"></div>")
+
+
+def test_batch_tiles(app, monkeypatch):
+    from titiler.xarray import reader
+
+    opened = []
+    xarray_open_dataset = reader.xarray_open_dataset
+
+    def open_dataset(*args, **kwargs):
+        opened.append(args)
+        return xarray_open_dataset(*args, **kwargs)
+
+    monkeypatch.setattr(reader, "xarray_open_dataset", open_dataset)
+    tiles = ["1/0/0", "1/1/0", "1/0/1", "1/1/1", "1/1/1"]
+    response = app.get(
+        "/tiles/batch",
+        params={**test_zarr_store_params["params"], "tile": tiles},
+    )
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "application/zip"
+    assert len(opened) == 1
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert archive.namelist() == [
+            "1/0/0.png",
+            "1/1/0.png",
+            "1/0/1.png",
+            "1/1/1.png",
+        ]
+        single = app.get("/tiles/1/1/0.png", params=test_zarr_store_params["params"])
+        assert archive.read("1/1/0.png") == single.content
+
+    response = app.get(
+        "/tiles/WebMercatorQuad/batch",
+        params={
+            **test_pyramid_store_params["params"],
+            "tile": ["0/0/0", "1/0/0", "1/1/0"],
+            "format": "jpeg",
+        },
+    )
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert archive.namelist() == ["0/0/0.jpeg", "1/0/0.jpeg", "1/1/0.jpeg"]
+
+    response = app.get(
+        "/tiles/batch",
+        params={**test_zarr_store_params["params"], "tile": "1/0"},
+    )
+    assert response.status_code == 400
+
+    response = app.get(
+        "/tiles/batch",
+        params={**test_zarr_store_params["params"], "tile": "1/5/5"},
+    )
+    assert response.status_code == 400
+
+
+def test_point(app):
+    response = app.get("/point/-100.5,40.2", params=test_zarr_store_params["params"])
+    assert response.status_code == 200
+    point = response.json()
+    assert point["coordinates"] == [-100.5, 40.2]
+    assert len(point["times"]) == len(point["values"]) == 10
+
+    response = app.get(
+        "/point/-100.5,40.2",
+        params={**test_netcdf_store_params["params"]},
+    )
+    assert response.status_code == 200
+    assert len(response.json()["values"]) == len(response.json()["times"])
+
+    response = app.get("/point/200,40", params=test_zarr_store_params["params"])
+    assert response.status_code == 404
+
+
+def test_stack(app):
+    response = app.get("/stack/0/0/0.png", params=test_zarr_store_params["params"])
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/apng"
+    chunks = [chunk_type for chunk_type, _ in png_chunks(response.content)]
+    assert chunks[:3] == [b"IHDR", b"acTL", b"fcTL"]
+    assert chunks.count(b"fcTL") == 10
+    assert chunks.count(b"fdAT") >= 9
+
+    # the frame delay is a 16-bit number of milliseconds
+    params = test_zarr_store_params["params"]
+    response = app.get("/stack/0/0/0.png", params={**params, "delay": 65535})
+    assert response.status_code == 200
+    response = app.get("/stack/0/0/0.png", params={**params, "delay": 65536})
+    assert response.status_code == 422
+
+    response = app.get(
+        "/stack/WebMercatorQuad/1/0/0@2x.npy", params=test_zarr_store_params["params"]
+    )
+    assert response.status_code == 200
+    assert np.load(io.BytesIO(response.content)).shape == (10, 2, 512, 512)
+
+    # the time coordinate of the fixture is not decoded as datetimes
+    response = app.get(
+        "/stack/0/0/0.png",
+        params={**test_zarr_store_params["params"], "datetime": "2000-01-01"},
+    )
+    assert response.status_code == 400
@@ -0,0 +1,422 @@
+"""Test dataset caches."""
+
+import asyncio
+import json
+import os
+import pickle
+import time
+
+import numpy
+import pytest
+import xarray
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from titiler.xarray import cache, metadata, reader
+from titiler.xarray.cache import DatasetCache, dataset_sizeof
+from titiler.xarray.factory import ZarrTilerFactory
+
+DATA_DIR = "tests/fixtures"
+test_zarr_store = os.path.join(DATA_DIR, "test_zarr_store.zarr")
+test_reference_store = os.path.join(DATA_DIR, "reference.json")
+test_netcdf_store = os.path.join(DATA_DIR, "testfile.nc")
+test_unconsolidated_store = os.path.join(DATA_DIR, "unconsolidated.zarr")
+
+
+@pytest.fixture
+def dataset_cache(monkeypatch):
+    """Use a fresh in-process dataset cache and disable redis."""
+    cache = DatasetCache(maxsize=1024 * 1024, ttl=60)
+    monkeypatch.setattr(reader, "dataset_cache", cache)
+    monkeypatch.setattr(reader.api_settings, "enable_cache", False)
+    monkeypatch.setattr(reader.api_settings, "enable_dataset_cache", True)
+    return cache
+
+
+def test_dataset_cache_hit(dataset_cache):
+    """Same arguments return the same dataset handle."""
+    ds = reader.xarray_open_dataset(test_zarr_store)
+    assert reader.xarray_open_dataset(test_zarr_store) is ds
+    assert len(dataset_cache) == 1
+
+
+def test_dataset_cache_key(dataset_cache):
+    """Every open argument is part of the cache key."""
+    ds = reader.xarray_open_dataset(test_zarr_store, decode_times=True)
+    other = reader.xarray_open_dataset(test_zarr_store, decode_times=False)
+    assert ds is not other
+    assert len(dataset_cache) == 2
+
+
+def test_dataset_cache_size_eviction(dataset_cache):
+    """Datasets are evicted in LRU order once the byte budget is exceeded."""
+    ds = reader.xarray_open_dataset(test_zarr_store)
+    size = dataset_sizeof(ds)
+
+    cache = DatasetCache(maxsize=size, ttl=60)
+    cache.set_dataset("a", ds)
+    cache.set_dataset("b", ds)
+    assert "a" not in cache
+    assert "b" in cache
+
+    too_small = DatasetCache(maxsize=size - 1, ttl=60)
+    too_small.set_dataset("a", ds)
+    assert len(too_small) == 0
+
+
+@pytest.mark.parametrize(
+    "src_path,kwargs",
+    [
+        (test_zarr_store, {}),
+        (test_netcdf_store, {}),
+        (test_reference_store, {"reference": True}),
+        (test_unconsolidated_store, {"consolidated": False}),
+    ],
+)
+def test_metadata_cache(monkeypatch, src_path, kwargs):
+    """Datasets are rebuilt from the cached metadata without reading the store."""
+    monkeypatch.setattr(reader.api_settings, "enable_cache", True)
+    monkeypatch.setattr(reader.api_settings, "enable_dataset_cache", False)
+    reader.cache_client.flushall()
+
+    ds = reader.xarray_open_dataset(src_path, **kwargs)
+    data_bytes = reader.cache_client.get(cache.dataset_cache_key(src_path, **kwargs))
+    assert data_bytes
+    entries = metadata.loads(data_bytes, reader.xarray_engine(src_path))
+    assert entries is not None
+
+    def get_filesystem(*args, **kwargs):
+        raise AssertionError("metadata should be read from the cache")
+
+    with monkeypatch.context() as m:
+        m.setattr(reader, "get_filesystem", get_filesystem)
+        cached_ds = reader.xarray_open_dataset(src_path, **kwargs)
+        assert list(cached_ds.data_vars) == list(ds.data_vars)
+        assert cached_ds.coords.to_dataset().identical(ds.coords.to_dataset())
+
+    variable = list(ds.data_vars)[0]
+    xarray.testing.assert_identical(cached_ds[variable].load(), ds[variable].load())
+
+
+def test_metadata_cache_version():
+    """Entries written with another format version are ignored."""
+    entries = {"keys": {".zgroup": b"{}"}, "missing": set(), "listdir": {}}
+    data_bytes = metadata.dumps("zarr", entries)
+    assert metadata.loads(data_bytes, "zarr") == entries
+    assert metadata.loads(data_bytes, "h5netcdf") is None
+    assert metadata.loads(pickle.dumps({"version": 0}), "zarr") is None
+    assert metadata.loads(b"not a pickle", "zarr") is None
+
+
+def test_dataset_cache_key_normalization():
+    """Equivalent arguments share a key, other arguments do not."""
+    key = cache.dataset_cache_key(test_zarr_store)
+    assert key == cache.dataset_cache_key(test_zarr_store + "/", reference=None)
+    assert key.startswith(cache.cache_key_prefix(src_path=test_zarr_store))
+    assert key != cache.dataset_cache_key(test_zarr_store, consolidated=False)
+    assert key != cache.dataset_cache_key(test_zarr_store, decode_times=False)
+    assert key != cache.dataset_cache_key(test_zarr_store, group=1)
+    assert key != cache.dataset_cache_key(test_reference_store)
+
+
+def test_clear_cache(app, monkeypatch):
+    """Clear the cache of one dataset, a path prefix or of all datasets."""
+    monkeypatch.setattr(reader.api_settings, "enable_dataset_cache", False)
+    cache_client = reader.cache_client
+    cache_client.flushall()
+    cache_client.set("another-app-key", b"1")
+
+    for src_path in [test_zarr_store, test_unconsolidated_store]:
+        reader.xarray_open_dataset(src_path, consolidated=False)
+    reader.xarray_open_dataset(test_zarr_store)
+    assert len(cache_client.keys(f"{reader.api_settings.cache_namespace}:*")) == 3
+
+    response = app.get("/clear_cache", params={"url": test_zarr_store})
+    assert response.status_code == 200
+    assert response.json()["deleted"] == 2
+    assert not cache_client.get(cache.dataset_cache_key(test_zarr_store))
+
+    reader.xarray_open_dataset(test_zarr_store)
+    response = app.get("/clear_cache", params={"prefix": DATA_DIR})
+    assert response.json()["deleted"] == 2
+
+    reader.xarray_open_dataset(test_zarr_store)
+    response = app.get("/clear_cache")
+    assert response.json()["deleted"] == 1
+    assert cache_client.get("another-app-key") == b"1"
+
+
+def test_tile_cache_key():
+    """Tile keys are built from the parsed options, without the defaults."""
+    tile = [("tileMatrixSetId", "WebMercatorQuad"), ("z", 0), ("x", 0), ("y", 0)]
+    key = cache.tile_cache_key(
+        test_zarr_store, tile, {"variable": "CDD0", "rescale": [(0.0, 1.0)]}
+    )
+    assert key.startswith(cache.cache_key_prefix(src_path=test_zarr_store))
+    assert key == cache.tile_cache_key(
+        test_zarr_store,
+        tile,
+        {
+            "rescale": [(0.0, 1.0)],
+            "variable": "CDD0",
+            "reference": False,
+            "decode_times": True,
+            "drop_dim": None,
+        },
+    )
+    assert key != cache.tile_cache_key(
+        test_zarr_store, tile, {"variable": "CDD0", "rescale": [(0.0, 2.0)]}
+    )
+    assert key != cache.tile_cache_key(
+        test_zarr_store,
+        tile,
+        {"variable": "CDD0", "rescale": [(0.0, 1.0)], "reference": True},
+    )
+
+
+def test_disk_bytes_cache(tmp_path):
+    """Disk cache honours the TTL, the byte budget and invalidation."""
+    disk_cache = cache.DiskBytesCache(
+        str(tmp_path), maxsize=3000, ttl=60, max_item_size=1500
+    )
+    prefix = cache.cache_key_prefix(src_path=test_zarr_store)
+
+    assert disk_cache.get(f"{prefix}a") is None
+    disk_cache.set(f"{prefix}a", b"a" * 1000)
+    assert disk_cache.get(f"{prefix}a") == b"a" * 1000
+
+    # too large
+    disk_cache.set(f"{prefix}b", b"b" * 2000)
+    assert disk_cache.get(f"{prefix}b") is None
+
+    # over budget, the least recently used value is removed
+    disk_cache.set(f"{prefix}c", b"c" * 1000)
+    os.utime(disk_cache._path(f"{prefix}c"), (0, os.path.getmtime(tmp_path)))
+    disk_cache.set(f"{prefix}d", b"d\n" * 500)
+    assert disk_cache.get(f"{prefix}c") is None
+    assert disk_cache.get(f"{prefix}a") is not None
+    assert disk_cache.get_many([f"{prefix}c", f"{prefix}d"]) == {
+        f"{prefix}d": b"d\n" * 500
+    }
+    assert disk_cache.size <= 3000
+
+    assert disk_cache.invalidate(cache.cache_key_prefix(src_path="another")) == 0
+    assert disk_cache.invalidate(prefix) == 2
+    assert disk_cache.get(f"{prefix}a") is None
+
+    disk_cache.ttl = 1
+    disk_cache.set(f"{prefix}a", b"a")
+    os.utime(disk_cache._path(f"{prefix}a"), (0, 0))
+    assert disk_cache.get(f"{prefix}a") is None
+
+
+def test_redis_tile_cache():
+    """Tiles are stored with their media type."""
+    tile_cache = cache.TileCache(
+        cache.RedisBytesCache(reader.cache_client, ttl=60, max_item_size=100)
+    )
+    tile_cache.set("tile", b"\x89PNG\n", "image/png")
+    assert tile_cache.get("tile") == (b"\x89PNG\n", "image/png")
+    assert reader.cache_client.ttl("tile") > 0
+
+    tile_cache.set("large", b"0" * 100, "image/png")
+    assert tile_cache.get("large") is None
+
+
+def test_tiles_endpoint_cache(tmp_path, monkeypatch):
+    """Repeated tile requests are served from the tile cache."""
+    tile_cache = cache.TileCache(
+        cache.DiskBytesCache(
+            str(tmp_path), maxsize=1024 * 1024, ttl=60, max_item_size=1024 * 1024
+        )
+    )
+    factory = ZarrTilerFactory(tile_cache=tile_cache)
+    application = FastAPI()
+    application.include_router(factory.router)
+    client = TestClient(application)
+
+    params = {"url": test_zarr_store, "variable": "CDD0", "decode_times": False}
+    response = client.get("/tiles/0/0/0.png", params=params)
+    assert response.status_code == 200
+    assert len(os.listdir(tmp_path)) == 1
+
+    def reader(*args, **kwargs):
+        raise AssertionError("tile should be read from the cache")
+
+    monkeypatch.setattr(factory, "reader", reader)
+    cached = client.get("/tiles/0/0/0.png", params=dict(reversed(params.items())))
+    assert cached.status_code == 200
+    assert cached.headers["content-type"] == "image/png"
+    assert cached.content == response.content
+
+
+@pytest.mark.parametrize(
+    "query,equivalent",
+    [
+        ({"multiscale": "false"}, {"multiscale": "False"}),
+        ({}, {"decode_times": "true", "reference": "false"}),
+        ({"rescale": "0,1"}, {"rescale": "0.0,1.0"}),
+        ({"consolidated": "true"}, {}),
+    ],
+)
+def test_tiles_endpoint_cache_key(tmp_path, monkeypatch, query, equivalent):
+    """Equivalent tile requests are served from the same cached tile."""
+    tile_cache = cache.TileCache(
+        cache.DiskBytesCache(
+            str(tmp_path), maxsize=1024 * 1024, ttl=60, max_item_size=1024 * 1024
+        )
+    )
+    factory = ZarrTilerFactory(tile_cache=tile_cache)
+    application = FastAPI()
+    application.include_router(factory.router)
+    client = TestClient(application)
+
+    params = {"url": test_zarr_store, "variable": "CDD0"}
+    response = client.get("/tiles/0/0/0.png", params={**params, **query})
+    assert response.status_code == 200
+
+    def reader(*args, **kwargs):
+        raise AssertionError("tile should be read from the cache")
+
+    monkeypatch.setattr(factory, "reader", reader)
+    cached = client.get("/tiles/0/0/0.png", params={**params, **equivalent})
+    assert cached.status_code == 200
+    assert cached.content == response.content
+
+
+def test_chunk_cache(monkeypatch):
+    """Chunks are read once from the store, then from the chunk cache."""
+    chunk_cache = cache.ChunkCache(maxsize=1024 * 1024)
+    monkeypatch.setattr(reader, "chunk_cache", chunk_cache)
+    monkeypatch.setattr(reader.api_settings, "enable_cache", False)
+    monkeypatch.setattr(reader.api_settings, "enable_dataset_cache", False)
+    monkeypatch.setattr(reader.api_settings, "enable_chunk_cache", True)
+
+    ds = reader.xarray_open_dataset(test_zarr_store)
+    data = ds["CDD0"].load()
+    misses = chunk_cache.stats()["misses"]
+    assert misses > 0
+    assert chunk_cache.stats()["hits"] == 0
+
+    # the 10x10x10 chunks of CDD0 are all cached
+    ds = reader.xarray_open_dataset(test_zarr_store)
+    xarray.testing.assert_identical(ds["CDD0"].load(), data)
+    stats = chunk_cache.stats()
+    assert stats["misses"] == misses
+    assert stats["hits"] >= 4 * 8
+    assert 0 < stats["size"] <= stats["maxsize"]
+
+    prefix = cache.cache_key_prefix(src_path=test_zarr_store)
+    assert chunk_cache.invalidate(prefix) > 0
+    assert chunk_cache.stats()["size"] == 0
+
+
+def test_chunk_cache_rewritten_dataset(monkeypatch, tmp_path):
+    """A rewritten dataset has its new metadata at once, its new chunks after the TTL."""
+    chunk_cache = cache.ChunkCache(maxsize=1024 * 1024, ttl=0.5)
+    monkeypatch.setattr(reader, "chunk_cache", chunk_cache)
+    monkeypatch.setattr(reader.api_settings, "enable_cache", False)
+    monkeypatch.setattr(reader.api_settings, "enable_dataset_cache", False)
+    monkeypatch.setattr(reader.api_settings, "enable_chunk_cache", True)
+
+    src_path = str(tmp_path / "data.zarr")
+    ds = xarray.Dataset({"var": (("y", "x"), numpy.ones((4, 4)))})
+    ds.to_zarr(src_path)
+    opened = reader.xarray_open_dataset(src_path)
+    assert float(opened["var"].max()) == 1.0
+    version = cache.dataset_version(opened)
+
+    ds["var"] = ds["var"] * 2
+    ds["var"].attrs["units"] = "m"
+    ds.to_zarr(src_path, mode="w")
+
+    opened = reader.xarray_open_dataset(src_path)
+    assert opened["var"].attrs["units"] == "m"
+    assert cache.dataset_version(opened) != version
+
+    time.sleep(0.5)
+    opened = reader.xarray_open_dataset(src_path)
+    assert float(opened["var"].max()) == 2.0
+
+
+def test_cache_stats(app):
+    """Chunk cache counters are reported."""
+    response = app.get("/cache_stats")
+    assert response.status_code == 200
+    assert set(response.json()["chunks"]) == {
+        "hits",
+        "shared_hits",
+        "misses",
+        "size",
+        "maxsize",
+    }
+    assert set(response.json()["warp_maps"]) == {"hits", "misses", "size", "maxsize"}
+
+
+def test_chunk_cache_shared(tmp_path):
+    """Chunks evicted from memory are read from the shared cache."""
+    backend = cache.DiskBytesCache(
+        str(tmp_path), maxsize=1024 * 1024, ttl=60, max_item_size=1024
+    )
+    chunk_cache = cache.ChunkCache(maxsize=10, backend=backend)
+    chunk_cache.set_many({"a": b"a" * 8, "b": b"b" * 8})
+    assert chunk_cache.get_many(["a", "b", "c"]) == {"a": b"a" * 8, "b": b"b" * 8}
+    assert chunk_cache.stats()["hits"] == 1
+    assert chunk_cache.stats()["shared_hits"] == 1
+    assert chunk_cache.stats()["misses"] == 1
+
+
+def test_prefetch_tile(monkeypatch):
+    """Chunks of a tile are fetched into the chunk cache before reading the tile."""
+    chunk_cache = cache.ChunkCache(maxsize=1024 * 1024)
+    monkeypatch.setattr(reader, "chunk_cache", chunk_cache)
+    monkeypatch.setattr(reader.api_settings, "enable_cache", False)
+    monkeypatch.setattr(reader.api_settings, "enable_dataset_cache", False)
+    monkeypatch.setattr(reader.api_settings, "enable_chunk_cache", True)
+
+    with reader.ZarrReader(test_zarr_store, variable="CDD0") as src_dst:
+        store, keys = reader.zarr_chunk_keys(src_dst.input)
+        assert isinstance(store, cache.ChunkCacheStore)
+        assert keys
+
+        asyncio.run(src_dst.aprefetch_tile(0, 0, 0))
+        misses = chunk_cache.stats()["misses"]
+        assert misses > 0
+
+        src_dst.tile(0, 0, 0)
+        assert chunk_cache.stats()["misses"] == misses
+        assert chunk_cache.stats()["hits"] > 0
+
+
+def test_prefetch_tile_reference(monkeypatch, tmp_path):
+    """Chunks of a reference to files are prefetched."""
+    chunk_cache = cache.ChunkCache(maxsize=1024 * 1024)
+    monkeypatch.setattr(reader, "chunk_cache", chunk_cache)
+    monkeypatch.setattr(reader.api_settings, "enable_cache", False)
+    monkeypatch.setattr(reader.api_settings, "enable_dataset_cache", False)
+    monkeypatch.setattr(reader.api_settings, "enable_chunk_cache", True)
+
+    src_path = str(tmp_path / "data.zarr")
+    xarray.open_dataset(test_zarr_store, engine="zarr").to_zarr(src_path)
+    refs = {}
+    for root, _, files in os.walk(src_path):
+        for name in files:
+            path = os.path.join(root, name)
+            key = os.path.relpath(path, src_path)
+            if name.startswith("."):
+                with open(path) as f:
+                    refs[key] = f.read()
+            else:
+                refs[key] = [path, 0, os.path.getsize(path)]
+
+    reference = str(tmp_path / "reference.json")
+    with open(reference, "w") as f:
+        json.dump({"version": 1, "refs": refs}, f)
+
+    with reader.ZarrReader(reference, variable="CDD0", reference=True) as src_dst:
+        asyncio.run(src_dst.aprefetch_tile(0, 0, 0))
+        misses = chunk_cache.stats()["misses"]
+        assert misses > 0
+
+        src_dst.tile(0, 0, 0)
+        assert chunk_cache.stats()["misses"] == misses
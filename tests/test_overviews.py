@@ -0,0 +1,155 @@
+"""Test overviews of single resolution datasets."""
+
+import fsspec
+import numpy
+import pytest
+import xarray
+from morecantile import Tile
+
+from titiler.xarray import cache, factory, overviews, reader
+
+
+@pytest.fixture
+def global_store(tmp_path):
+    """Global 0.5 degree grid, in 60x60 chunks."""
+    res = 0.5
+    lon = numpy.arange(-180 + res / 2, 180, res)
+    lat = numpy.arange(90 - res / 2, -90, -res)
+    data = numpy.random.default_rng(0).random((len(lat), len(lon)), dtype="float32")
+    data[:30, :30] = numpy.nan
+    ds = xarray.Dataset(
+        {"var": (("lat", "lon"), data)}, coords={"lat": lat, "lon": lon}
+    )
+    src_path = str(tmp_path / "global.zarr")
+    ds.to_zarr(src_path, encoding={"var": {"chunks": (60, 60)}})
+    return src_path, data
+
+
+@pytest.fixture
+def overviews_directory(monkeypatch, tmp_path):
+    """Enable the overviews, in a temporary directory."""
+    directory = str(tmp_path / "overviews")
+    monkeypatch.setattr(overviews.api_settings, "overviews_directory", directory)
+    monkeypatch.setattr(factory.api_settings, "enable_overviews", True)
+    return directory
+
+
+def test_coarsen():
+    """Blocks of 2x2 values are averaged or sampled."""
+    data = numpy.array([[1, 2, 3], [3, 4, 5], [0, 0, 0]], dtype="uint8")
+    numpy.testing.assert_array_equal(
+        overviews.coarsen(data, nodata=0), [[2.5, 4], [numpy.nan, numpy.nan]]
+    )
+    numpy.testing.assert_array_equal(
+        overviews.coarsen(data, method="nearest"), [[1, 3], [0, 0]]
+    )
+    assert overviews.coarsen(data).dtype == "float32"
+    assert overviews.coarsen(data, method="nearest").dtype == "uint8"
+
+
+def test_overview_factor(global_store):
+    """The coarsening factor is the largest one at least as fine as the tile."""
+    src_path, _ = global_store
+    with reader.ZarrReader(src_path, variable="var") as src_dst:
+        # 720 pixels wide, 256 (or 512) pixels at zoom 0 and 1024 at zoom 2
+        assert overviews.overview_factor(src_dst.input, src_dst.tms, Tile(0, 0, 0)) == 2
+        assert (
+            overviews.overview_factor(
+                src_dst.input, src_dst.tms, Tile(0, 0, 0), tilesize=512
+            )
+            == 1
+        )
+        assert overviews.overview_factor(src_dst.input, src_dst.tms, Tile(0, 0, 2)) == 1
+
+
+@pytest.mark.parametrize("method", ["mean", "nearest"])
+def test_get_overview(monkeypatch, global_store, overviews_directory, method):
+    """Overviews are built once, each from the previous one."""
+    monkeypatch.setattr(overviews.api_settings, "overviews_method", method)
+    src_path, data = global_store
+    with reader.ZarrReader(src_path, variable="var") as src_dst:
+        url = overviews.get_overview(src_dst, 4)
+        assert url.startswith(overviews_directory)
+        assert url.endswith("/4.zarr")
+        assert overviews.overview_exists(url.replace("/4.zarr", "/2.zarr"))
+        # built overviews are reused
+        assert overviews.get_overview(src_dst, 4) == url
+
+    with reader.ZarrReader(url, variable="var") as overview:
+        assert overview.input.shape == (90, 180)
+        assert overview.bounds == pytest.approx(src_dst.bounds)
+        if method == "mean":
+            # the 7x7 blocks in the NaN corner have no valid value to average
+            with pytest.warns(RuntimeWarning, match="Mean of empty slice"):
+                expected = numpy.nanmean(
+                    data.reshape(90, 4, 180, 4).astype("float64"), axis=(1, 3)
+                )
+            assert numpy.isnan(expected[:7, :7]).all()
+            assert not numpy.isnan(expected[7:, 7:]).any()
+            assert numpy.isnan(overview.input.values[:7, :7]).all()
+            numpy.testing.assert_allclose(overview.input.values, expected, rtol=1e-6)
+        else:
+            numpy.testing.assert_array_equal(overview.input.values, data[::4, ::4])
+
+    with reader.ZarrReader(src_path, variable="var", datetime=None) as src_dst:
+        other = xarray.Dataset({"var": src_dst.input + 1})
+        assert overviews.overview_url(
+            other, other["var"], src_path, "var", 4
+        ) != overviews.overview_url(src_dst.ds, src_dst.input, src_path, "var", 4)
+
+
+@pytest.mark.parametrize("directory", ["local", "memory://overviews"])
+def test_publish_overview(global_store, tmp_path, directory):
+    """Built overviews are moved in place, once."""
+    if directory == "local":
+        directory = str(tmp_path / "overviews")
+    url = f"{directory}/name/2.zarr"
+    src_path, _ = global_store
+    with reader.ZarrReader(src_path, variable="var") as src_dst:
+        for index in range(2):
+            tmp_url = f"{url}.{index}.tmp"
+            overviews.build_overview(src_dst.input, fsspec.get_mapper(tmp_url), "var")
+            assert overviews.overview_exists(url) == (index > 0)
+            overviews.publish_overview(tmp_url, url)
+            assert overviews.overview_exists(url)
+
+            fs, path = fsspec.core.url_to_fs(url)
+            assert fs.ls(path.rsplit("/", 1)[0], detail=False) == [path]
+
+    ds = xarray.open_zarr(fsspec.get_mapper(url))
+    assert ds["var"].shape == (180, 360)
+
+
+def test_tile_overview(app, monkeypatch, global_store, overviews_directory):
+    """Low zoom tiles are read from an overview, built after the first request."""
+    src_path, _ = global_store
+    params = {"url": src_path, "variable": "var"}
+
+    exited = []
+    monkeypatch.setattr(
+        reader.ZarrReader,
+        "__exit__",
+        lambda self, *args: exited.append(self.src_path),
+    )
+    # the first request reads the dataset, the overview is built meanwhile
+    assert app.get("/tiles/0/0/0.png", params=params).status_code == 200
+    assert exited == [src_path]
+    overviews.wait_builds()
+
+    # both the dataset and the overview readers are exited
+    assert app.get("/tiles/0/0/0.png", params=params).status_code == 200
+    assert len(exited) == 3 and exited[-1] == src_path
+
+    misses = cache.chunk_cache.stats()["misses"]
+    cache.chunk_cache.invalidate(cache.cache_key_prefix(src_path=src_path))
+    assert app.get("/tiles/0/0/0.png", params=params).status_code == 200
+    # the overview requests do not read the dataset chunks
+    assert cache.chunk_cache.stats()["misses"] - misses == 0
+
+    # the histogram is estimated from the overview
+    monkeypatch.setattr(factory.api_settings, "approx_size", 10000)
+    response = app.get("/histogram", params={**params, "approx": True})
+    assert response.status_code == 200
+    assert sum(bucket["value"] for bucket in response.json()) == pytest.approx(
+        720 * 360 - 30 * 30
+    )
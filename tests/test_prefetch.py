@@ -0,0 +1,82 @@
+"""Test the tile prefetcher."""
+
+import asyncio
+import os
+import time
+
+import morecantile
+from morecantile import Tile
+
+from titiler.xarray import cache, prefetch
+
+test_zarr_store = os.path.join("tests/fixtures", "test_zarr_store.zarr")
+
+
+def test_prefetch_tiles():
+    """Neighbours and children of a tile."""
+    tms = morecantile.tms.get("WebMercatorQuad")
+    assert prefetch.prefetch_tiles(tms, Tile(0, 0, 0)) == tms.children(Tile(0, 0, 0))
+    assert len(prefetch.prefetch_tiles(tms, Tile(0, 0, 1))) == 3 + 4
+    assert len(prefetch.prefetch_tiles(tms, Tile(5, 5, 4))) == 8 + 4
+    assert len(prefetch.prefetch_tiles(tms, Tile(5, 5, tms.maxzoom))) == 8
+
+
+def test_tile_prefetcher():
+    """Jobs are deduplicated, bounded and cancelled under load."""
+    prefetcher = prefetch.TilePrefetcher(max_queue=4, max_concurrency=2, max_load=1)
+    running = []
+
+    async def job():
+        running.append(len(prefetcher.tasks))
+        await asyncio.sleep(0.01)
+
+    async def main():
+        assert prefetcher.submit("a", job)
+        assert not prefetcher.submit("a", job)
+        for key in "bcde":
+            prefetcher.submit(key, job)
+        assert prefetcher.stats()["queued"] == 4
+        assert prefetcher.stats()["dropped"] == 1
+        await asyncio.sleep(0.1)
+        assert prefetcher.stats()["completed"] == 4
+
+        for key in "fg":
+            prefetcher.submit(key, job)
+        with prefetcher.request():
+            with prefetcher.request():
+                # too many requests in flight
+                assert not prefetcher.submit("h", job)
+            await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert prefetcher.stats() == {
+        "queued": 0,
+        "completed": 4,
+        "dropped": 2,
+        "cancelled": 2,
+        "load": 0,
+    }
+
+
+def test_prefetch_endpoint(app, monkeypatch):
+    """The neighbours and children of a served tile are read from the chunk cache."""
+    from titiler.xarray.main import xarray_factory
+
+    prefetcher = prefetch.TilePrefetcher(max_queue=64, max_concurrency=4, max_load=8)
+    monkeypatch.setattr(xarray_factory, "prefetcher", prefetcher)
+    cache.chunk_cache.invalidate(cache.cache_key_prefix(src_path=test_zarr_store))
+
+    params = {"url": test_zarr_store, "variable": "CDD0"}
+    assert app.get("/tiles/1/0/0.png", params=params).status_code == 200
+    for _ in range(100):
+        if prefetcher.stats()["completed"] == 7:
+            break
+        time.sleep(0.05)
+    assert prefetcher.stats()["completed"] == 7
+    assert app.get("/cache_stats").json()["prefetch"]["completed"] == 7
+
+    monkeypatch.setattr(xarray_factory, "prefetcher", None)
+    misses = cache.chunk_cache.stats()["misses"]
+    for tile in ["1/1/0", "1/1/1", "2/0/0", "2/1/1"]:
+        assert app.get(f"/tiles/{tile}.png", params=params).status_code == 200
+    assert cache.chunk_cache.stats()["misses"] == misses
@@ -0,0 +1,85 @@
+"""Test the pyramid builder."""
+
+import numpy
+import pytest
+import xarray
+import zarr
+
+from titiler.xarray import pyramid, reader
+
+
+@pytest.fixture
+def src_path(tmp_path):
+    """1 degree grid with 3 time steps."""
+    lon = numpy.arange(-179.5, 180, 1.0)
+    lat = numpy.arange(89.5, -90, -1.0)
+    data = numpy.random.default_rng(0).random((3, 180, 360), dtype="float32")
+    ds = xarray.Dataset(
+        {"var": (("time", "lat", "lon"), data)},
+        coords={
+            "time": numpy.arange(3).astype("datetime64[D]"),
+            "lat": lat,
+            "lon": lon,
+        },
+    )
+    path = str(tmp_path / "source.zarr")
+    ds.to_zarr(path, encoding={"var": {"chunks": (1, 90, 90)}})
+    return path
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_build_pyramid(app, src_path, tmp_path, workers):
+    """Levels are aligned to the tiles and served with multiscale=true."""
+    output = str(tmp_path / "pyramid.zarr")
+    zooms = pyramid.build_pyramid(
+        src_path, output, "var", maxzoom=2, time_chunk=2, workers=workers
+    )
+    assert zooms == [2, 1, 0]
+
+    root = zarr.open_consolidated(output)
+    assert [d["path"] for d in root.attrs["multiscales"][0]["datasets"]] == [
+        "0",
+        "1",
+        "2",
+    ]
+    assert root["2/var"].shape == (3, 1024, 1024)
+    assert root["2/var"].chunks == (2, 256, 256)
+
+    levels = reader.multiscale_levels(output, "var")
+    assert [level.group for level in levels] == ["0", "1", "2"]
+
+    # the finest level holds the tiles rendered from the dataset
+    with reader.ZarrReader(src_path, variable="var", datetime="1970-01-02") as src:
+        expected = src.tile(1, 1, 2)
+    with reader.ZarrReader(
+        output, variable="var", group="2", datetime="1970-01-02"
+    ) as src:
+        numpy.testing.assert_array_equal(src.tile(1, 1, 2).array, expected.array)
+
+    # coarser levels are averaged from the previous level
+    level_2 = root["2/var"][0, :512, :512].reshape(256, 2, 256, 2)
+    numpy.testing.assert_allclose(
+        root["1/var"][0, :256, :256], level_2.mean(axis=(1, 3)), rtol=1e-5
+    )
+
+    response = app.get(
+        "/tiles/1/0/0.png",
+        params={"url": output, "variable": "var", "multiscale": True},
+    )
+    assert response.status_code == 200
+
+
+def test_main(src_path, tmp_path, capsys):
+    """The command line builds a pyramid."""
+    output = str(tmp_path / "pyramid.zarr")
+    pyramid.main(
+        [src_path, output, "--variable", "var", "--maxzoom", "1", "--workers", "1"]
+    )
+    assert "zooms 0 to 1" in capsys.readouterr().err
+    assert reader.multiscale_sizes(output, "var") == [256 * 256, 512 * 512]
+    assert pyramid.level_tiles(reader.WEB_MERCATOR_TMS, (-10, -10, 10, 10), 2) == (
+        1,
+        1,
+        2,
+        2,
+    )
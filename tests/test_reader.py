@@ -0,0 +1,428 @@
+"""Test ZarrReader."""
+
+import asyncio
+import os
+import threading
+
+import numpy
+import pytest
+import xarray
+import zarr
+from morecantile import Tile
+from rio_tiler.constants import WEB_MERCATOR_TMS
+from rio_tiler.errors import PointOutsideBounds
+
+from titiler.xarray import cache, reader
+
+DATA_DIR = "tests/fixtures"
+test_zarr_store = os.path.join(DATA_DIR, "test_zarr_store.zarr")
+test_unconsolidated_store = os.path.join(DATA_DIR, "unconsolidated.zarr")
+
+
+@pytest.fixture
+def chunk_cache(monkeypatch):
+    """Count the chunks read from the stores."""
+    chunk_cache = cache.ChunkCache(maxsize=1024 * 1024 * 1024)
+    monkeypatch.setattr(reader, "chunk_cache", chunk_cache)
+    monkeypatch.setattr(reader.api_settings, "enable_cache", False)
+    monkeypatch.setattr(reader.api_settings, "enable_dataset_cache", False)
+    monkeypatch.setattr(reader.api_settings, "enable_chunk_cache", True)
+    return chunk_cache
+
+
+@pytest.mark.parametrize(
+    "src_path,variable,consolidated,tile,chunks",
+    [
+        # 36x72 grid with 10x10 chunks
+        (test_zarr_store, "CDD0", True, (0, 0, 0), 32),
+        (test_zarr_store, "CDD0", True, (0, 0, 1), 12),
+        (test_zarr_store, "CDD0", True, (3, 2, 3), 4),
+        (test_zarr_store, "CDD0", True, (10, 12, 5), 1),
+        # 90x180 grid with 45x180 chunks
+        (test_unconsolidated_store, "var1", False, (0, 0, 0), 2),
+        (test_unconsolidated_store, "var1", False, (3, 2, 3), 1),
+    ],
+)
+def test_tile_chunk_reads(chunk_cache, src_path, variable, consolidated, tile, chunks):
+    """Only the chunks overlapping the tile window are read."""
+    with reader.ZarrReader(
+        src_path, variable=variable, consolidated=consolidated
+    ) as src_dst:
+        misses = chunk_cache.stats()["misses"]
+        img = src_dst.tile(*tile)
+        assert img.data.shape == (1, 256, 256)
+        assert chunk_cache.stats()["misses"] - misses == chunks
+
+        window = src_dst.tile_window(
+            src_dst.tms.xy_bounds(*tile), src_dst.tms.rasterio_crs
+        )
+        _, keys = reader.zarr_chunk_keys(window)
+        assert len(keys) == chunks
+
+
+def test_tile_window(chunk_cache):
+    """The window covers the tile bounds plus the halo."""
+    with reader.ZarrReader(test_zarr_store, variable="CDD0") as src_dst:
+        bounds = (-50, 30, -20, 50)
+        window = src_dst.tile_window(bounds, src_dst.crs)
+        # 5 degrees longitude, ~5.14 degrees latitude pixels
+        assert window.x.values.min() <= -50 - 2 * 5
+        assert window.x.values.max() >= -20 + 5
+        assert window.y.values.min() <= 30 - 5
+        assert window.y.values.max() >= 50 + 5
+        assert window.rio.transform() != src_dst.input.rio.transform()
+
+        with pytest.raises(reader.NoDataInBounds):
+            src_dst.tile_window((200, 0, 210, 10), src_dst.crs)
+
+        src_dst.tile_halo = 0
+        with pytest.raises(reader.OneDimensionalRaster):
+            src_dst.tile_window((0.5, 0.5, 0.6, 0.6), src_dst.crs, auto_expand=False)
+        window = src_dst.tile_window((0.5, 0.5, 0.6, 0.6), src_dst.crs)
+        assert window.sizes["x"] >= 2 and window.sizes["y"] >= 2
+
+
+@pytest.fixture
+def lon360_store(tmp_path):
+    """Global 0-360 longitude grid with 10x10 chunks."""
+    lon = numpy.arange(2.5, 360, 5.0)
+    lat = numpy.arange(-87.5, 90, 5.0)
+    data = numpy.arange(lat.size * lon.size, dtype="float32").reshape(lat.size, -1)
+    ds = xarray.Dataset(
+        {"var": (("lat", "lon"), data)}, coords={"lat": lat, "lon": lon}
+    )
+    src_path = str(tmp_path / "lon360.zarr")
+    ds.to_zarr(src_path, encoding={"var": {"chunks": (10, 10)}})
+    return src_path
+
+
+def test_lon_wrap(chunk_cache, monkeypatch, lon360_store):
+    """0-360 longitudes are remapped once per dataset, read as two ranges."""
+    monkeypatch.setattr(reader.api_settings, "enable_dataset_cache", True)
+    monkeypatch.setattr(reader, "dataset_cache", cache.DatasetCache(2**20, ttl=60))
+
+    with reader.ZarrReader(lon360_store, variable="var") as src_dst:
+        da = src_dst.input
+        assert src_dst.bounds == (-180, -90, 180, 90)
+        split, x = src_dst.ds.encoding[reader.LON_WRAP_ENCODING]["var"]
+        assert split == 36
+        numpy.testing.assert_array_equal(da.x, numpy.arange(-177.5, 180, 5.0))
+
+        # the columns are read as slices of the source, not gathered
+        wrapped = da.isel(x=slice(30, 40)).variable._data
+        assert isinstance(wrapped.array, reader.LonWrapArray)
+        assert [key.tuple[1] for key in wrapped.array.source_keys(wrapped.key)] == [
+            slice(66, 72),
+            slice(0, 4),
+        ]
+
+        # the north-eastern tile reads the columns 0-35 of the source and the
+        # halo on the other side of the antimeridian (6 chunks), rows 16-35 (3)
+        _, keys = reader.zarr_chunk_keys(
+            src_dst.tile_window(
+                src_dst.tms.xy_bounds(1, 0, 1), src_dst.tms.rasterio_crs
+            )
+        )
+        assert len(keys) == 18
+        misses = chunk_cache.stats()["misses"]
+        src_dst.tile(1, 0, 1)
+        assert chunk_cache.stats()["misses"] - misses == 18
+
+        ds = xarray.open_zarr(lon360_store)
+        expected = ds["var"].assign_coords(lon=(ds.lon + 180) % 360 - 180)
+        expected = expected.sortby("lon").rename({"lon": "x", "lat": "y"})
+        numpy.testing.assert_array_equal(da.values, expected.values)
+        numpy.testing.assert_array_equal(
+            da.isel(x=[0, 71, 35], y=0).values, expected.isel(x=[0, 71, 35], y=0)
+        )
+        numpy.testing.assert_array_equal(
+            da.isel(x=slice(None, None, 5), y=3).values,
+            expected.isel(x=slice(None, None, 5), y=3),
+        )
+        assert da.isel(x=1, y=2).values == expected.isel(x=1, y=2).values
+        numpy.testing.assert_array_equal(
+            src_dst.point_array(-177.4, -77.4).values, expected.isel(x=0, y=2).values
+        )
+
+    with reader.ZarrReader(lon360_store, variable="var") as src_dst:
+        lon_wrap = src_dst.ds.encoding[reader.LON_WRAP_ENCODING]["var"]
+        assert lon_wrap[1] is x
+
+
+def test_lon_wrap_unsorted(tmp_path):
+    """Longitudes not sorted once wrapped around are sorted with an index."""
+    lon = numpy.array([190.0, 10.0, 200.0, 20.0])
+    ds = xarray.Dataset(
+        {"var": (("lat", "lon"), numpy.arange(8.0).reshape(2, 4))},
+        coords={"lat": [0.0, 1.0], "lon": lon},
+    )
+    src_path = str(tmp_path / "unsorted.zarr")
+    ds.to_zarr(src_path)
+
+    with reader.ZarrReader(src_path, variable="var") as src_dst:
+        index, _ = src_dst.ds.encoding[reader.LON_WRAP_ENCODING]["var"]
+        numpy.testing.assert_array_equal(index, [0, 2, 1, 3])
+        numpy.testing.assert_array_equal(src_dst.input.x, [-170, -160, 10, 20])
+        numpy.testing.assert_array_equal(src_dst.input.values[0], [0, 2, 1, 3])
+
+
+def test_prefetch_tiles(chunk_cache):
+    """The chunks shared by several tiles are fetched once."""
+    tiles = [Tile(0, 0, 1), Tile(1, 0, 1), Tile(0, 1, 1), Tile(1, 1, 1)]
+    with reader.ZarrReader(test_zarr_store, variable="CDD0") as src_dst:
+        keys = [set(src_dst.tile_chunk_keys(*tile)[1]) for tile in tiles]
+        union = set.union(*keys)
+        assert len(union) < sum(len(k) for k in keys)
+
+        misses = chunk_cache.stats()["misses"]
+        asyncio.run(src_dst.aprefetch_tiles(tiles))
+        assert chunk_cache.stats()["misses"] - misses == len(union)
+
+        for tile in tiles:
+            src_dst.tile(*tile)
+        assert chunk_cache.stats()["misses"] - misses == len(union)
+
+
+def test_prefetch_tiles_off_loop(chunk_cache, monkeypatch):
+    """The chunk keys are computed in a worker thread, not on the event loop."""
+    threads = []
+    tile_chunk_keys = reader.ZarrReader.tile_chunk_keys
+
+    def record_thread(self, *args, **kwargs):
+        threads.append(threading.get_ident())
+        return tile_chunk_keys(self, *args, **kwargs)
+
+    monkeypatch.setattr(reader.ZarrReader, "tile_chunk_keys", record_thread)
+
+    async def prefetch(src_dst):
+        await src_dst.aprefetch_tile(0, 0, 0)
+        return threading.get_ident()
+
+    with reader.ZarrReader(test_zarr_store, variable="CDD0") as src_dst:
+        loop_thread = asyncio.run(prefetch(src_dst))
+
+    assert threads and loop_thread not in threads
+    assert chunk_cache.stats()["misses"]
+
+
+@pytest.mark.parametrize(
+    "chunks,n_chunks",
+    [
+        # chunked along time: one chunk per time step
+        ((1, 20, 40), 48),
+        # chunked along space: the whole time series of a 5x5 pixel block
+        ((48, 5, 5), 1),
+    ],
+)
+def test_point_array(chunk_cache, tmp_path, chunks, n_chunks):
+    """A point time series only reads the chunks of one spatial column."""
+    data = numpy.arange(48 * 20 * 40, dtype="float32").reshape(48, 20, 40)
+    ds = xarray.Dataset(
+        {"var": (("time", "lat", "lon"), data)},
+        coords={
+            "time": numpy.arange(48).astype("datetime64[D]"),
+            "lat": numpy.arange(-9.5, 10, 1.0),
+            "lon": numpy.arange(-19.5, 20, 1.0),
+        },
+    )
+    src_path = str(tmp_path / "point.zarr")
+    ds.to_zarr(src_path, encoding={"var": {"chunks": chunks}})
+
+    with reader.ZarrReader(src_path, variable="var") as src_dst:
+        da = src_dst.point_array(10.2, -3.7)
+        assert da.dims == ("time",)
+
+        misses = chunk_cache.stats()["misses"]
+        asyncio.run(reader.aprefetch(da))
+        assert chunk_cache.stats()["misses"] - misses == n_chunks
+
+        # lon 10.2 is in the column 30, lat -3.7 in the row 6
+        numpy.testing.assert_array_equal(da.values, data[:, 6, 30])
+        assert chunk_cache.stats()["misses"] - misses == n_chunks
+
+        with pytest.raises(PointOutsideBounds):
+            src_dst.point_array(30, 0)
+
+    with reader.ZarrReader(src_path, variable="var", datetime="1970-01-03") as src_dst:
+        assert src_dst.point_array(10.2, -3.7).dims == ()
+
+
+def test_tile_stack(chunk_cache, tmp_path):
+    """A tile stack reads the chunks of the tile window once for all the time steps."""
+    data = numpy.arange(48 * 20 * 40, dtype="float32").reshape(48, 20, 40)
+    ds = xarray.Dataset(
+        {
+            "var": (("time", "lat", "lon"), data),
+            "static": (("lat", "lon"), data[0]),
+        },
+        coords={
+            "time": numpy.arange(48).astype("datetime64[D]"),
+            "lat": numpy.arange(-9.5, 10, 1.0),
+            "lon": numpy.arange(-19.5, 20, 1.0),
+        },
+    )
+    src_path = str(tmp_path / "stack.zarr")
+    ds.to_zarr(src_path, encoding={"var": {"chunks": (12, 10, 10)}})
+
+    with reader.ZarrReader(src_path, variable="var") as src_dst:
+        times = src_dst.stack_times(
+            start_datetime="1970-01-05", end_datetime="1970-01-20"
+        )
+        numpy.testing.assert_array_equal(times, numpy.arange(4, 20))
+        numpy.testing.assert_array_equal(
+            src_dst.stack_times(["1970-01-10", "1970-01-02T20:00:00"]), [9, 2]
+        )
+        assert len(src_dst.stack_times()) == 48
+
+        misses = chunk_cache.stats()["misses"]
+        images = src_dst.tile_stack(0, 0, 0, times)
+        # 2 time chunks of the 2x4 spatial chunks
+        assert chunk_cache.stats()["misses"] - misses == 16
+        assert len(images) == 16
+
+    for time, image in zip(times, images):
+        with reader.ZarrReader(
+            src_path, variable="var", datetime=str(ds.time.values[time])
+        ) as src_dst:
+            expected = src_dst.tile(0, 0, 0)
+        numpy.testing.assert_array_equal(image.array, expected.array)
+
+    with reader.ZarrReader(src_path, variable="static") as src_dst:
+        with pytest.raises(ValueError):
+            src_dst.stack_times()
+
+
+@pytest.fixture
+def multiscales_store(tmp_path):
+    """Pyramid of zooms 2 and 3 listed in a `multiscales` attribute."""
+    src_path = str(tmp_path / "multiscales.zarr")
+    paths = []
+    for zoom in (2, 3):
+        res = 360 / (256 * 2**zoom)
+        lon = numpy.arange(-180 + res / 2, 180, res)
+        lat = numpy.arange(90 - res / 2, -90, -res)
+        ds = xarray.Dataset(
+            {"var": (("lat", "lon"), numpy.ones((len(lat), len(lon)), "uint8"))},
+            coords={"lat": lat, "lon": lon},
+        )
+        ds.to_zarr(src_path, group=f"z{zoom}")
+        paths.append({"path": f"z{zoom}"})
+
+    root = zarr.open_group(src_path)
+    root.attrs["multiscales"] = [{"datasets": paths}]
+    zarr.consolidate_metadata(src_path)
+    return src_path
+
+
+def test_multiscale_levels(multiscales_store):
+    """Levels are read from the multiscales attribute and selected by resolution."""
+    levels = reader.multiscale_levels(multiscales_store, "var")
+    assert [level.group for level in levels] == ["z2", "z3"]
+    assert levels[0].resolution == pytest.approx(360 / 1024)
+    # the level table is kept with the root dataset
+    assert reader.multiscale_levels(multiscales_store, "var") is levels
+
+    tms = WEB_MERCATOR_TMS
+    assert reader.multiscale_level(levels, tms, Tile(0, 0, 0)) == "z2"
+    assert reader.multiscale_level(levels, tms, Tile(1, 1, 2)) == "z2"
+    assert reader.multiscale_level(levels, tms, Tile(1, 1, 2), tilesize=512) == "z3"
+    assert reader.multiscale_level(levels, tms, Tile(3, 3, 3)) == "z3"
+    assert reader.multiscale_level(levels, tms, Tile(20, 20, 6)) == "z3"
+
+    group = reader.multiscale_group(multiscales_store, "var", tms, Tile(1, 1, 2))
+    with reader.ZarrReader(multiscales_store, variable="var", group=group) as src_dst:
+        assert src_dst.input.shape == (512, 1024)
+        assert src_dst.tile(1, 1, 2).array.shape == (1, 256, 256)
+
+
+def test_multiscale_levels_groups():
+    """Without a multiscales attribute, the levels are the groups 0, 1, ..."""
+    levels = reader.multiscale_levels(
+        "tests/fixtures/pyramid.zarr", "value", consolidated=False
+    )
+    assert [level.group for level in levels] == ["0", "1", "2"]
+    assert [level.size for level in levels] == [100, 2500, 62500]
+
+
+@pytest.mark.parametrize(
+    "tile", [(0, 0, 0), (1, 0, 1), (3, 2, 3), (10, 12, 5), (31, 20, 6)]
+)
+@pytest.mark.parametrize("dtype,nodata", [("float32", numpy.nan), ("uint8", 0)])
+def test_regrid_nearest(monkeypatch, tmp_path, tile, dtype, nodata):
+    """Nearest tiles of lon/lat grids are the same with and without the fast path."""
+    res = 0.7
+    lon = numpy.arange(-180 + res / 2, 180, res)
+    lat = numpy.arange(90 - res / 2, -90, -res)
+    data = numpy.random.default_rng(0).integers(1, 255, (len(lat), len(lon)))
+    data = data.astype(dtype)
+    data[100:200, 100:200] = nodata
+    da = xarray.DataArray(data, dims=("lat", "lon"), coords={"lat": lat, "lon": lon})
+    src_path = str(tmp_path / "grid.zarr")
+    xarray.Dataset({"var": da.rio.write_nodata(nodata, encoded=True)}).to_zarr(src_path)
+
+    with reader.ZarrReader(src_path, variable="var") as src_dst:
+        window = src_dst.input
+        assert reader.regrid.is_separable(window, WEB_MERCATOR_TMS.rasterio_crs)
+        assert not reader.regrid.is_separable(
+            window.rio.write_crs("epsg:32631"), WEB_MERCATOR_TMS.rasterio_crs
+        )
+
+        fast = src_dst.tile(*tile)
+        monkeypatch.setattr(reader.api_settings, "enable_fast_regrid", False)
+        warped = src_dst.tile(*tile)
+
+    numpy.testing.assert_array_equal(fast.array.mask, warped.array.mask)
+    numpy.testing.assert_array_equal(fast.array, warped.array)
+    assert fast.bounds == warped.bounds
+    assert fast.crs == warped.crs
+
+
+def test_warp_map_cache(monkeypatch, tmp_path):
+    """Index maps are computed once per source grid and tile."""
+    warp_maps = reader.regrid.WarpMapCache(maxsize=1024 * 1024)
+    monkeypatch.setattr(reader.regrid, "warp_maps", warp_maps)
+
+    res = 1.0
+    lon = numpy.arange(-180 + res / 2, 180, res)
+    lat = numpy.arange(90 - res / 2, -90, -res)
+    time = numpy.array(["2022-01-01", "2022-01-02"], dtype="datetime64[D]")
+    data = numpy.random.default_rng(0).random((2, len(lat), len(lon)))
+    ds = xarray.Dataset(
+        {"a": (("time", "lat", "lon"), data), "b": (("time", "lat", "lon"), data)},
+        coords={"time": time, "lat": lat, "lon": lon},
+    )
+    src_path = str(tmp_path / "grid.zarr")
+    ds.to_zarr(src_path)
+
+    for variable in ["a", "b"]:
+        for datetime in ["2022-01-01", "2022-01-02"]:
+            with reader.ZarrReader(
+                src_path, variable=variable, datetime=datetime
+            ) as src_dst:
+                src_dst.tile(1, 1, 2)
+
+    assert warp_maps.stats()["misses"] == 1
+    assert warp_maps.stats()["hits"] == 3
+
+    with reader.ZarrReader(src_path, variable="a", datetime="2022-01-01") as src_dst:
+        src_dst.tile(2, 1, 2)
+        src_dst.tile(1, 1, 2, tilesize=512)
+    assert warp_maps.stats()["misses"] == 3
+    assert warp_maps.stats()["size"] == 2 * (256 + 256) * 8 + (512 + 512) * 8
+
+
+def test_get_variable_drop_dim():
+    """A dimension other than time, y and x is dropped."""
+    data = numpy.arange(2 * 2 * 3 * 4, dtype="float32").reshape(2, 2, 3, 4)
+    ds = xarray.Dataset(
+        {"var": (("level", "time", "lat", "lon"), data)},
+        coords={
+            "level": ["surface", "upper"],
+            "time": numpy.array(["2022-01-01", "2022-01-02"], dtype="datetime64[D]"),
+            "lat": [1.0, 0.0, -1.0],
+            "lon": [0.0, 1.0, 2.0, 3.0],
+        },
+    )
+    da = reader.get_variable(ds, "var", datetime="2022-01-02", drop_dim="level=upper")
+    assert da.dims == ("y", "x")
+    numpy.testing.assert_array_equal(da.values, data[1, 1])
@@ -0,0 +1,147 @@
+"""Test the tile seeder."""
+
+import os
+import sqlite3
+from urllib.parse import unquote, urlsplit
+
+import morecantile
+import pytest
+import redis
+from morecantile import Tile
+
+from titiler.core.resources.enums import ImageType
+from titiler.xarray import cache, reader, seed
+from titiler.xarray.factory import ZarrTilerFactory
+
+test_zarr_store = os.path.join("tests/fixtures", "test_zarr_store.zarr")
+
+QUERY = "variable=CDD0&rescale=0,300&colormap_name=viridis"
+
+
+def test_layer():
+    """Query parameters are resolved with the factory dependencies."""
+    layer = seed.layer(ZarrTilerFactory(), test_zarr_store, QUERY)
+    assert layer.reader_options["variable"] == "CDD0"
+    assert layer.reader_options["decode_times"] is True
+    assert layer.render_options["rescale"] == [(0.0, 300.0)]
+    assert layer.render_options["colormap"] is not None
+
+    with pytest.raises(ValueError):
+        seed.layer(ZarrTilerFactory(), test_zarr_store, "rescale=0,1")
+
+
+def test_tile_groups():
+    """Tiles are grouped by ancestor at the group zoom."""
+    tms = morecantile.tms.get("WebMercatorQuad")
+    bounds = (-180, -85, 180, 85)
+    groups = list(seed.tile_groups(tms, bounds, range(0, 4), group_zoom=1))
+    # 1 + 4 tiles at zooms 0 and 1, 4 groups of 4 and 16 tiles at zooms 2 and 3
+    assert [len(group) for group in groups] == [1] * 5 + [4] * 4 + [16] * 4
+    for group in groups[5:]:
+        assert len({tuple(tms.parent(tile, zoom=1)[0]) for tile in group}) == 1
+
+
+def test_seed_tile_cache(app, monkeypatch, tmp_path):
+    """Seeded tiles are served from the tile cache, through the TileJSON tiles URL."""
+    from titiler.xarray.main import xarray_factory
+
+    tile_cache = cache.TileCache(
+        cache.DiskBytesCache(
+            str(tmp_path), maxsize=1024 * 1024 * 1024, ttl=60, max_item_size=1024**2
+        )
+    )
+    layer = seed.layer(xarray_factory, test_zarr_store, QUERY)
+    assert seed.seed(layer, 0, 2, tile_cache=tile_cache) == 1 + 4 + 16
+
+    tilejson = app.get(f"/tilejson.json?url={test_zarr_store}&{QUERY}").json()
+    tiles_url = urlsplit(tilejson["tiles"][0])
+    path = unquote(tiles_url.path).format(z=2, x=1, y=1)
+
+    monkeypatch.setattr(xarray_factory, "tile_cache", tile_cache)
+    # the tiles are not rendered
+    monkeypatch.setattr(xarray_factory, "reader", None)
+    response = app.get(f"{path}?{tiles_url.query}")
+    assert response.status_code == 200
+    content, media_type = tile_cache.get(layer.cache_key(Tile(1, 1, 2), None))
+    assert response.content == content
+
+    # and with the extension of the format picked for the tile
+    format = seed.AUTO_FORMATS[media_type].value
+    response = app.get(f"{path}.{format}?{tiles_url.query}")
+    assert response.status_code == 200
+    assert response.content == content
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_seed_mbtiles(tmp_path, workers):
+    """Tiles are rendered in a process pool and written to an MBTiles archive."""
+    mbtiles = str(tmp_path / "tiles.mbtiles")
+    layer = seed.layer(ZarrTilerFactory(), test_zarr_store, QUERY, format=ImageType.png)
+    count = seed.seed(
+        layer, 1, 3, bbox=(10, 10, 80, 50), mbtiles=mbtiles, workers=workers
+    )
+    assert count == 1 + 1 + 4
+
+    with sqlite3.connect(mbtiles) as connection:
+        rows = connection.execute(
+            "SELECT zoom_level, tile_column, tile_row FROM tiles ORDER BY zoom_level"
+        ).fetchall()
+        metadata = dict(connection.execute("SELECT name, value FROM metadata"))
+
+    assert rows[:2] == [(1, 1, 1), (2, 2, 2)]
+    assert metadata["format"] == "png"
+    assert metadata["minzoom"] == "1"
+
+    # the format of an archive is not picked per tile
+    with pytest.raises(ValueError):
+        seed.seed(
+            seed.layer(ZarrTilerFactory(), test_zarr_store, QUERY),
+            1,
+            1,
+            mbtiles=mbtiles,
+        )
+
+    # MBTiles names JPEG tiles `jpg` and does not hold GeoTIFF tiles
+    mbtiles = str(tmp_path / "jpeg.mbtiles")
+    layer = seed.layer(
+        ZarrTilerFactory(), test_zarr_store, QUERY, format=ImageType.jpeg
+    )
+    seed.seed(layer, 1, 1, mbtiles=mbtiles, workers=workers)
+    with sqlite3.connect(mbtiles) as connection:
+        metadata = dict(connection.execute("SELECT name, value FROM metadata"))
+    assert metadata["format"] == "jpg"
+
+    with pytest.raises(ValueError):
+        seed.seed(
+            seed.layer(
+                ZarrTilerFactory(), test_zarr_store, QUERY, format=ImageType.tif
+            ),
+            1,
+            1,
+            mbtiles=str(tmp_path / "tif.mbtiles"),
+        )
+    assert not (tmp_path / "tif.mbtiles").exists()
+
+
+def test_main(monkeypatch, tmp_path, capsys):
+    """Seed from the command line, without redis."""
+    monkeypatch.delenv("TEST_ENVIRONMENT")
+    # nothing listens on port 1
+    monkeypatch.setattr(reader, "cache_client", redis.Redis(port=1))
+    monkeypatch.setattr(reader.api_settings, "enable_cache", True)
+
+    mbtiles = str(tmp_path / "tiles.mbtiles")
+    seed.main(
+        [
+            test_zarr_store,
+            QUERY,
+            "--maxzoom",
+            "1",
+            "--mbtiles",
+            mbtiles,
+            "--no-tile-cache",
+            "--workers",
+            "1",
+        ]
+    )
+    assert "5 tiles" in capsys.readouterr().err
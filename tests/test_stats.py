@@ -0,0 +1,362 @@
+"""Test chunk-wise statistics."""
+
+import os
+
+import numpy
+import pytest
+import xarray
+
+from titiler.xarray import cache, factory, reader, stats
+
+DATA_DIR = "tests/fixtures"
+test_zarr_store = os.path.join(DATA_DIR, "test_zarr_store.zarr")
+test_netcdf_store = os.path.join(DATA_DIR, "testfile.nc")
+test_unconsolidated_store = os.path.join(DATA_DIR, "unconsolidated.zarr")
+test_pyramid_store = os.path.join(DATA_DIR, "pyramid.zarr")
+
+
+def test_iter_blocks(monkeypatch):
+    """Blocks follow the dataset chunks and are bounded in size."""
+    with reader.ZarrReader(test_zarr_store, variable="CDD0") as src_dst:
+        # 36x72 grid with 10x10 chunks
+        assert stats.chunk_sizes(src_dst.input) == {"y": 10, "x": 10}
+        blocks = list(stats.iter_blocks(src_dst.input))
+        assert len(blocks) == 4 * 8
+        assert blocks[-1] == {"y": slice(30, 40), "x": slice(70, 80)}
+
+        monkeypatch.setattr(stats, "MAX_BLOCK_SIZE", 50)
+        assert stats.chunk_sizes(src_dst.input) == {"y": 5, "x": 10}
+
+        shapes = list(stats.map_blocks(numpy.shape, src_dst.input, max_workers=4))
+        assert len(shapes) == 8 * 8
+        assert max(numpy.prod(shape) for shape in shapes) <= 50
+
+
+@pytest.mark.parametrize(
+    "src_path,variable,kwargs",
+    [
+        (test_zarr_store, "CDD0", {}),
+        (test_netcdf_store, "data", {}),
+        (test_unconsolidated_store, "var1", {"consolidated": False}),
+    ],
+)
+@pytest.mark.parametrize(
+    "bins,range",
+    [(10, None), (4, (10.0, 50.0)), ([0.0, 10.0, 20.0, 100.0], None)],
+)
+def test_histogram(monkeypatch, src_path, variable, kwargs, bins, range):
+    """Chunk-wise histograms match numpy.histogram."""
+    monkeypatch.setattr(stats, "MAX_BLOCK_SIZE", 1000)
+    with reader.ZarrReader(src_path, variable=variable, **kwargs) as src_dst:
+        data = src_dst.input.values
+        data = data[~numpy.isnan(data)]
+        expected_counts, expected_edges = numpy.histogram(data, bins=bins, range=range)
+
+        counts, edges = stats.histogram(
+            src_dst.input, bins=bins, range=range, max_workers=4
+        )
+        numpy.testing.assert_array_equal(counts, expected_counts)
+        numpy.testing.assert_array_equal(edges, expected_edges)
+        assert stats.data_range(src_dst.input) == (data.min(), data.max())
+
+
+def test_data_range_cache(monkeypatch):
+    """The range of a variable is computed once."""
+    monkeypatch.setattr(reader.api_settings, "enable_cache", True)
+    reader.cache_client.flushall()
+
+    with reader.ZarrReader(test_zarr_store, variable="CDD0") as src_dst:
+        data_range = src_dst.data_range()
+
+    def data_range_error(*args, **kwargs):
+        raise AssertionError("range should be read from the cache")
+
+    monkeypatch.setattr(stats, "data_range", data_range_error)
+    with reader.ZarrReader(test_zarr_store, variable="CDD0") as src_dst:
+        assert src_dst.data_range() == data_range
+        src_dst.input.attrs["actual_range"] = [0, 255]
+        assert src_dst.data_range() == (0, 255)
+
+
+def test_data_range_cache_version(monkeypatch):
+    """The cached range is not reused once the dataset metadata changed."""
+    monkeypatch.setattr(reader.api_settings, "enable_cache", True)
+    reader.cache_client.flushall()
+
+    with reader.ZarrReader(test_zarr_store, variable="CDD0") as src_dst:
+        data_range = src_dst.data_range()
+        monkeypatch.setattr(stats, "data_range", lambda *args, **kwargs: (0.0, 1.0))
+        assert src_dst.data_range() == data_range
+
+        src_dst.ds.attrs["history"] = "rewritten"
+        assert src_dst.data_range() == (0.0, 1.0)
+
+
+def test_histogram_endpoint(app):
+    """Histogram bins and range are set with query parameters."""
+    params = {"url": test_zarr_store, "variable": "CDD0"}
+    response = app.get("/histogram", params={**params, "bins": 4, "range": "0,100"})
+    assert response.status_code == 200
+    histogram = response.json()
+    assert [h["bucket"] for h in histogram] == [
+        [0, 25],
+        [25, 50],
+        [50, 75],
+        [75, 100],
+    ]
+
+    response = app.get("/histogram", params={**params, "bins": "0,100,255"})
+    assert response.status_code == 200
+    histogram = response.json()
+    assert [h["bucket"] for h in histogram] == [[0, 100], [100, 255]]
+    assert sum(h["value"] for h in histogram) == 36 * 72
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        {"bins": "abc"},
+        {"bins": "0"},
+        {"bins": "-2"},
+        {"bins": "0,10,5"},
+        {"range": "1"},
+        {"range": "0,abc"},
+        {"range": "10,0"},
+        {"range": "0,inf"},
+    ],
+)
+def test_histogram_endpoint_invalid(app, query):
+    """Invalid bins and ranges are rejected."""
+    params = {"url": test_zarr_store, "variable": "CDD0", **query}
+    response = app.get("/histogram", params=params)
+    assert response.status_code == 400
+
+
+def test_approx_histogram():
+    """Histograms are estimated from a deterministic sample of chunks."""
+    rng = numpy.random.default_rng(1)
+    da = xarray.DataArray(rng.normal(size=(100, 100)), dims=("y", "x"))
+    da.encoding["preferred_chunks"] = {"y": 10, "x": 10}
+    expected, edges = stats.histogram(da, bins=5, range=(-2, 2))
+
+    # all the chunks are sampled
+    counts, approx_edges, errors = stats.approx_histogram(
+        da, bins=5, range=(-2, 2), size=da.size
+    )
+    numpy.testing.assert_allclose(counts, expected)
+    numpy.testing.assert_array_equal(approx_edges, edges)
+    assert not errors.any()
+
+    # 10 of the 100 chunks
+    blocks, n_blocks = stats.sample_blocks(da, 1000)
+    assert len(blocks) == 10 and n_blocks == 100
+    assert stats.sample_blocks(da, 1000)[0] == blocks
+    assert stats.sample_blocks(da, 1000, seed=1)[0] != blocks
+
+    counts, _, errors = stats.approx_histogram(da, bins=5, range=(-2, 2), size=1000)
+    assert counts.sum() == pytest.approx(expected.sum(), rel=0.05)
+    assert (errors > 0).all()
+    assert (numpy.abs(counts - expected) <= 4 * errors).all()
+
+    # the range defaults to the range of the sample
+    _, edges, _ = stats.approx_histogram(da, bins=5, size=1000)
+    sample = numpy.concatenate([da.isel(block).values.ravel() for block in blocks])
+    assert edges[0] == sample.min() and edges[-1] == sample.max()
+
+
+def test_multinomial_errors():
+    """Errors of counts from a sample of the elements."""
+    errors = stats.multinomial_errors(numpy.array([50, 50]), 10000)
+    numpy.testing.assert_allclose(errors, 10000 * numpy.sqrt(0.99 * 0.25 / 100))
+    assert not stats.multinomial_errors(numpy.array([50, 50]), 100).any()
+    assert not stats.multinomial_errors(numpy.array([0, 0]), 100).any()
+
+
+def test_approx_histogram_endpoint(app, monkeypatch):
+    """Approximate histograms of multiscale and flat stores."""
+    monkeypatch.setattr(factory.api_settings, "approx_size", 2500)
+    params = {
+        "url": test_pyramid_store,
+        "variable": "value",
+        "consolidated": False,
+        "multiscale": True,
+        "approx": True,
+    }
+    assert reader.multiscale_sizes(test_pyramid_store, "value", consolidated=False) == [
+        100,
+        2500,
+        62500,
+    ]
+    assert reader.approx_level([100, 2500, 62500], 2500) == 1
+    assert reader.approx_level([100, 2500, 62500], 100000) == 2
+
+    # the 50x50 level, scaled to the 250x250 level
+    response = app.get("/histogram", params=params)
+    assert response.status_code == 200
+    histogram = response.json()
+    assert len(histogram) == 10
+    assert sum(h["value"] for h in histogram) == pytest.approx(62500, abs=10)
+    assert all(h["error"] > 0 for h in histogram)
+
+    # the group is the finest level
+    response = app.get("/histogram", params={**params, "group": 1})
+    histogram = response.json()
+    assert sum(h["value"] for h in histogram) == pytest.approx(2500, abs=10)
+    assert all(h["error"] == 0 for h in histogram)
+
+    response = app.get(
+        "/histogram",
+        params={"url": test_zarr_store, "variable": "CDD0", "approx": True},
+    )
+    assert response.status_code == 200
+    assert all(h["error"] == 0 for h in response.json())
+
+
+@pytest.mark.parametrize(
+    "src_path,variable,kwargs",
+    [
+        (test_zarr_store, "CDD0", {}),
+        (test_netcdf_store, "data", {}),
+        (test_unconsolidated_store, "var1", {"consolidated": False}),
+    ],
+)
+def test_statistics(monkeypatch, src_path, variable, kwargs):
+    """Chunk-wise statistics match numpy."""
+    monkeypatch.setattr(stats, "MAX_BLOCK_SIZE", 1000)
+    with reader.ZarrReader(src_path, variable=variable, **kwargs) as src_dst:
+        data = src_dst.input.values
+        valid = data[~numpy.isnan(data)].astype("float64")
+
+        result = stats.statistics(src_dst.input, percentiles=[2, 50, 98], max_workers=4)
+        assert result["count"] == valid.size
+        assert result["valid_percent"] == round(valid.size / data.size * 100, 2)
+        assert result["min"] == valid.min()
+        assert result["max"] == valid.max()
+        assert result["mean"] == pytest.approx(valid.mean())
+        assert result["std"] == pytest.approx(valid.std())
+
+        # percentiles are interpolated within a bin of the histogram
+        tolerance = (valid.max() - valid.min()) / stats.PERCENTILE_BINS
+        if data.dtype.kind in "iu":
+            tolerance = 1
+        for p in [2, 50, 98]:
+            assert result[f"percentile_{p}"] == pytest.approx(
+                numpy.percentile(valid, p), abs=tolerance
+            )
+
+
+def test_statistics_integers():
+    """Percentiles of integers are exact."""
+    percentiles = [0, 10, 25, 50, 99, 100]
+    for data in [numpy.arange(1, 101), numpy.array([1, 1, 1, 5, 7, 7, 8, 20])]:
+        da = xarray.DataArray(data.astype("int16"))
+        result = stats.statistics(da, percentiles=percentiles)
+        for p in percentiles:
+            assert result[f"percentile_{p}"] == numpy.percentile(data, p)
+
+    da = xarray.DataArray(numpy.full((4, 4), numpy.nan))
+    result = stats.statistics(da)
+    assert result["count"] == 0 and result["valid_percent"] == 0
+    assert result["mean"] is None and result["percentile_2"] is None
+
+
+def test_statistics_empty():
+    """Statistics of an empty selection have no values."""
+    with reader.ZarrReader(test_zarr_store, variable="CDD0") as src_dst:
+        da = src_dst.input.isel(x=slice(0, 0))
+        result = stats.statistics(da, max_workers=2)
+        assert result["count"] == 0
+        assert result["valid_percent"] == 0
+        assert result["mean"] is None
+        assert result["percentile_2"] is None
+
+        result = stats.approx_statistics(da, size=100, max_workers=2)
+        assert result["count"] == 0
+        assert result["error"] == {"mean": None, "count": 0.0}
+
+
+def test_approx_statistics():
+    """Statistics are estimated from a deterministic sample of chunks."""
+    rng = numpy.random.default_rng(1)
+    data = rng.normal(size=(100, 100))
+    data[:, :20] = numpy.nan
+    da = xarray.DataArray(data, dims=("y", "x"))
+    da.encoding["preferred_chunks"] = {"y": 10, "x": 10}
+    expected = stats.statistics(da)
+
+    result = stats.approx_statistics(da, size=da.size)
+    assert result["count"] == expected["count"]
+    assert result["mean"] == pytest.approx(expected["mean"])
+    assert result["error"] == {"mean": 0, "count": 0}
+
+    result = stats.approx_statistics(da, size=1000)
+    assert result["error"]["mean"] > 0
+    assert result["error"]["count"] > 0
+    assert abs(result["mean"] - expected["mean"]) <= 4 * result["error"]["mean"]
+    assert abs(result["count"] - expected["count"]) <= 4 * result["error"]["count"]
+
+    # a single chunk
+    result = stats.approx_statistics(da, size=10)
+    assert result["count"] == pytest.approx(expected["count"], rel=0.5)
+    assert result["error"]["mean"] > 0
+
+
+def test_statistics_endpoint(app, monkeypatch):
+    """Statistics are cached per dataset version."""
+    monkeypatch.setattr(reader.api_settings, "enable_cache", True)
+    reader.cache_client.flushall()
+
+    params = {"url": test_zarr_store, "variable": "CDD0"}
+    response = app.get("/statistics", params={**params, "p": [10, 90]})
+    assert response.status_code == 200
+    result = response.json()
+    assert set(result) == {
+        "min",
+        "max",
+        "mean",
+        "std",
+        "count",
+        "valid_percent",
+        "percentile_10",
+        "percentile_90",
+    }
+    assert result["count"] == 36 * 72
+
+    for p in (150, -5):
+        response = app.get("/statistics", params={**params, "p": [10, p]})
+        assert response.status_code == 422
+
+    def statistics_error(*args, **kwargs):
+        raise AssertionError("statistics should be read from the cache")
+
+    with monkeypatch.context() as m:
+        m.setattr(stats, "statistics", statistics_error)
+        response = app.get("/statistics", params={**params, "p": [10, 90]})
+        assert response.json() == result
+
+    # the 50x50 level, scaled to the 250x250 level
+    monkeypatch.setattr(factory.api_settings, "approx_size", 2500)
+    response = app.get(
+        "/statistics",
+        params={
+            "url": test_pyramid_store,
+            "variable": "value",
+            "consolidated": False,
+            "multiscale": True,
+            "approx": True,
+        },
+    )
+    assert response.status_code == 200
+    result = response.json()
+    assert result["count"] == 62500
+    assert 0 <= result["min"] and result["max"] <= 1
+    assert result["error"]["mean"] > 0
+
+
+def test_dataset_version():
+    """The version changes with the dataset metadata."""
+    ds = xarray.Dataset({"var": (("y", "x"), numpy.zeros((2, 2)))})
+    version = cache.dataset_version(ds)
+    assert version == cache.dataset_version(ds.copy())
+    ds.attrs["date_modified"] = "2024-01-01"
+    assert cache.dataset_version(ds) != version
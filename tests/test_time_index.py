@@ -0,0 +1,72 @@
+"""Test the time index."""
+
+import numpy
+import pytest
+import xarray
+
+from titiler.xarray import reader
+from titiler.xarray.time_index import TimeIndex
+
+
+def test_time_index_datetime64():
+    """Lookups return positions in the (unsorted) coordinate."""
+    times = numpy.array(
+        ["2000-01-03", "2000-01-01", "2000-01-02", "2000-01-05"],
+        dtype="datetime64[ns]",
+    )
+    index = TimeIndex.from_coord(xarray.DataArray(times, dims="time"))
+    assert index.nearest("2000-01-01") == 1
+    assert index.nearest("2000-01-03T18:00:00") == 0
+    assert index.nearest("1999-01-01") == 1
+    assert index.nearest("2010-01-01") == 3
+    assert index.exact("2000-01-02") == 2
+    with pytest.raises(KeyError):
+        index.exact("2000-01-04")
+    assert index.range("2000-01-02", "2000-01-03").tolist() == [0, 2]
+    assert index.range(None, "2000-01-02").tolist() == [1, 2]
+    assert index.range("2000-01-04", None).tolist() == [3]
+
+
+def test_time_index_cftime():
+    """cftime coordinates are converted once, in their own calendar."""
+    times = xarray.cftime_range("2000-01-01", periods=365 * 3, calendar="noleap")
+    index = TimeIndex.from_coord(xarray.DataArray(times.values, dims="time"))
+    assert index.calendar == "noleap"
+    assert index.nearest("2001-03-01") == 365 + 59
+    assert index.exact("2002-12-31") == 365 * 3 - 1
+    assert len(index.range("2001-01-01", "2001-12-31")) == 365
+
+    times = xarray.cftime_range("2000-01-01", periods=360, calendar="360_day")
+    index = TimeIndex.from_coord(xarray.DataArray(times.values, dims="time"))
+    assert index.exact("2000-02-29") == 58
+    assert index.nearest("2000-03-01") == 60
+
+
+def test_time_index_not_decoded():
+    """CF times which were not decoded are indexed with their units."""
+    time = xarray.DataArray(
+        numpy.arange(10) * 24,
+        dims="time",
+        attrs={"units": "hours since 2000-01-01", "calendar": "noleap"},
+    )
+    index = TimeIndex.from_coord(time)
+    assert index.exact("2000-01-05") == 4
+    assert index.nearest("2000-01-05T13:00:00") == 5
+
+    assert TimeIndex.from_coord(xarray.DataArray(numpy.arange(3), dims="t")) is None
+
+
+def test_get_variable_time_index():
+    """The time index is built once per dataset."""
+    times = xarray.cftime_range("2000-01-01", periods=10, calendar="noleap")
+    ds = xarray.Dataset(
+        {"var": (("time", "lat", "lon"), numpy.arange(10 * 4).reshape(10, 2, 2))},
+        coords={"time": times, "lat": [0.5, 1.5], "lon": [0.5, 1.5]},
+    )
+    da = reader.get_variable(ds, "var", datetime="2000-01-04T00:00:00Z")
+    assert int(da.values[0, 0]) == 12
+    index = ds.encoding[reader.TIME_INDEX_ENCODING]
+
+    da = reader.get_variable(ds, "var", datetime="2000-01-06")
+    assert int(da.values[0, 0]) == 20
+    assert ds.encoding[reader.TIME_INDEX_ENCODING] is index
@@ -0,0 +1,81 @@
+"""Animated PNG (APNG) encoding."""
+
+import struct
+import zlib
+from typing import Iterator, List, Sequence, Tuple
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def png_chunks(content: bytes) -> Iterator[Tuple[bytes, bytes]]:
+    """Iterate over the (type, data) chunks of a PNG image."""
+    if not content.startswith(PNG_SIGNATURE):
+        raise ValueError("Not a PNG image")
+
+    offset = len(PNG_SIGNATURE)
+    while offset < len(content):
+        (length,) = struct.unpack(">I", content[offset : offset + 4])
+        chunk_type = content[offset + 4 : offset + 8]
+        yield chunk_type, content[offset + 8 : offset + 8 + length]
+        offset += length + 12
+
+
+def png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    """Encode a PNG chunk."""
+    return (
+        struct.pack(">I", len(data))
+        + chunk_type
+        + data
+        + struct.pack(">I", zlib.crc32(chunk_type + data))
+    )
+
+
+def apng(frames: Sequence[bytes], delay: int = 100, loop: int = 0) -> bytes:
+    """
+    Assemble PNG images of the same size and format into an animated PNG.
+
+    The compressed image data of the frames is reused as is, so the frames
+    are not decoded again. `delay` is the display time of a frame in
+    milliseconds and `loop` the number of plays (0 to loop forever).
+    """
+    if not frames:
+        raise ValueError("No frames")
+
+    chunks = [list(png_chunks(frame)) for frame in frames]
+    header = chunks[0][0]
+    if any(frame_chunks[0] != header for frame_chunks in chunks):
+        raise ValueError("Frames must have the same size and format")
+
+    width, height = struct.unpack(">II", header[1][:8])
+
+    content: List[bytes] = [PNG_SIGNATURE, png_chunk(b"IHDR", header[1])]
+    # Chunks of the first frame which must come before the image data (e.g. PLTE)
+    for chunk_type, data in chunks[0][1:]:
+        if chunk_type in (b"IDAT", b"IEND"):
+            break
+        content.append(png_chunk(chunk_type, data))
+
+    content.append(png_chunk(b"acTL", struct.pack(">II", len(frames), loop)))
+
+    sequence = 0
+    for index, frame_chunks in enumerate(chunks):
+        content.append(
+            png_chunk(
+                b"fcTL",
+                struct.pack(
+                    ">IIIIIHHBB", sequence, width, height, 0, 0, delay, 1000, 0, 0
+                ),
+            )
+        )
+        sequence += 1
+        for chunk_type, data in frame_chunks:
+            if chunk_type != b"IDAT":
+                continue
+            if index == 0:
+                content.append(png_chunk(b"IDAT", data))
+            else:
+                content.append(png_chunk(b"fdAT", struct.pack(">I", sequence) + data))
+                sequence += 1
+
+    content.append(png_chunk(b"IEND", b""))
+    return b"".join(content)
@@ -0,0 +1,711 @@
+"""Caches: cache keys, in-process cache of opened datasets, rendered tiles and
+zarr chunks caches and invalidation."""
+
+import abc
+import asyncio
+import dataclasses
+import enum
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Hashable, List, Mapping, Optional, Sequence, Tuple
+from urllib.parse import urlencode
+
+import numpy
+import xarray
+from cachetools import Cache, LRUCache, TTLCache
+from fsspec.asyn import AsyncFileSystem
+from fsspec.implementations.reference import ReferenceNotReachable
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+from zarr.errors import ReadOnlyError
+from zarr.storage import BaseStore, FSStore, Store, listdir
+
+from titiler.xarray.metadata import CACHE_FORMAT_VERSION
+from titiler.xarray.settings import ApiSettings
+
+api_settings = ApiSettings()
+
+
+def normalize_src_path(src_path: str) -> str:
+    """Normalize dataset path, a trailing slash does not make a new dataset."""
+    return src_path.rstrip("/") or src_path
+
+
+def cache_key_prefix(
+    src_path: Optional[str] = None, prefix: Optional[str] = None
+) -> str:
+    """
+    Prefix shared by the cache keys of one dataset (`src_path`), of all the
+    datasets whose path starts with `prefix`, or of all the entries.
+
+    Keys look like `{namespace}:v{version}:{src_path}::{kind}:{params}`.
+    """
+    if src_path is not None:
+        return f"{api_settings.cache_namespace}:v{CACHE_FORMAT_VERSION}:{normalize_src_path(src_path)}::"
+
+    if prefix is not None:
+        return f"{api_settings.cache_namespace}:v{CACHE_FORMAT_VERSION}:{prefix}"
+
+    return f"{api_settings.cache_namespace}:"
+
+
+def cache_key(kind: str, src_path: str, **params: Any) -> str:
+    """Create a cache key for a dataset and a set of (sorted) parameters."""
+    query = urlencode(sorted((k, str(v)) for k, v in params.items()))
+    return f"{cache_key_prefix(src_path=src_path)}{kind}:{query}"
+
+
+def dataset_cache_key(
+    src_path: str,
+    group: Optional[Any] = None,
+    reference: Optional[bool] = False,
+    decode_times: Optional[bool] = True,
+    consolidated: Optional[bool] = True,
+) -> str:
+    """Create the cache key of an opened dataset from all the open arguments."""
+    return cache_key(
+        "dataset",
+        src_path,
+        group=group,
+        reference=bool(reference),
+        decode_times=True if decode_times is None else decode_times,
+        consolidated=consolidated,
+    )
+
+
+# Tile options left out of the tile cache keys when they have these values
+TILE_OPTION_DEFAULTS: Dict[str, Any] = {
+    "multiscale": False,
+    "reference": False,
+    "decode_times": True,
+    "consolidated": True,
+    "render_params": {"add_mask": True},
+}
+
+
+def canonical_value(value: Any) -> Any:
+    """JSON serializable form of a parsed parameter value (enum, algorithm, colormap...)."""
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, numpy.generic):
+        return value.item()
+    if isinstance(value, numpy.ndarray):
+        return value.tolist()
+    if isinstance(value, BaseModel):
+        return {"name": type(value).__name__, **canonical_value(value.model_dump())}
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return canonical_value(dataclasses.asdict(value))
+    if isinstance(value, Mapping):
+        return {str(k): canonical_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [canonical_value(v) for v in value]
+    return value
+
+
+def tile_cache_key(
+    src_path: str,
+    tile: Sequence[Tuple[str, Any]],
+    options: Mapping[str, Any],
+) -> str:
+    """
+    Create the cache key of a rendered tile.
+
+    `tile` holds the tile path parameters, with their default values filled in
+    (TMS, z/x/y, scale and format) and `options` the parsed values of the query
+    parameters but the dataset `url`. Options which are None or have their
+    default value are left out, so that equivalent requests (`true`/`True`,
+    `rescale=0,1`/`0.0,1.0`, omitted or explicit defaults) share a key.
+    """
+    values = {}
+    for name, value in options.items():
+        value = canonical_value(value)
+        if value is not None and value != TILE_OPTION_DEFAULTS.get(name):
+            values[name] = value
+
+    digest = hashlib.sha1(
+        json.dumps(values, sort_keys=True, default=str).encode()
+    ).hexdigest()[:16]
+    params = [(k, str(v)) for k, v in tile] + [("options", digest)]
+    return f"{cache_key_prefix(src_path=src_path)}tile:{urlencode(params)}"
+
+
+def dataset_version(ds: xarray.Dataset) -> str:
+    """
+    Short hash of the dataset metadata (attributes, dimensions and variables).
+
+    Part of the keys of values computed from the data (e.g. statistics), so
+    that a dataset rewritten with new metadata does not reuse them.
+    """
+    metadata = {
+        "attrs": ds.attrs,
+        "sizes": dict(ds.sizes),
+        "variables": {
+            name: [str(var.dtype), var.attrs, var.encoding.get("chunks")]
+            for name, var in ds.variables.items()
+        },
+    }
+    data = json.dumps(metadata, sort_keys=True, default=str).encode()
+    return hashlib.sha1(data).hexdigest()[:16]
+
+
+def dataset_sizeof(ds: xarray.Dataset) -> int:
+    """
+    Estimate the in-memory footprint of an opened dataset.
+
+    Data variables are lazy and do not count, only the coordinates (which xarray
+    loads to build its indexes) and the attributes are resident in memory.
+    """
+    size = sum(coord.nbytes for coord in ds.coords.values())
+    return max(size, 1)
+
+
+class DatasetCache(TTLCache):
+    """
+    Per-worker LRU cache of opened `xarray.Dataset` handles.
+
+    Entries are evicted when they are older than `ttl` seconds or, in least
+    recently used order, when the summed size of the cached datasets exceeds
+    `maxsize` bytes. Evicted datasets are not closed explicitly since a request
+    may still be reading from them; xarray's file manager closes the underlying
+    file once the last reference is dropped.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        """Create a thread-safe dataset cache."""
+        super().__init__(maxsize=maxsize, ttl=ttl, getsizeof=dataset_sizeof)
+        self.lock = threading.RLock()
+
+    def get_dataset(self, key: Hashable) -> Optional[xarray.Dataset]:
+        """Return the dataset stored under `key`, if any."""
+        with self.lock:
+            return self.get(key)
+
+    def set_dataset(self, key: Hashable, ds: xarray.Dataset) -> None:
+        """Store `ds` under `key`, datasets larger than the cache are skipped."""
+        with self.lock:
+            try:
+                self[key] = ds
+            except ValueError:
+                # value too large
+                pass
+
+    def invalidate(self, prefix: str) -> int:
+        """Remove the datasets whose key starts with `prefix`."""
+        with self.lock:
+            keys = [k for k in self.keys() if str(k).startswith(prefix)]
+            for key in keys:
+                self.pop(key, None)
+            return len(keys)
+
+
+class BytesCache(abc.ABC):
+    """Shared cache of byte values (rendered tiles, zarr chunks)."""
+
+    def __init__(self, ttl: int, max_item_size: int):
+        """Set the entries time-to-live (seconds) and the largest value (bytes) to cache."""
+        self.ttl = ttl
+        self.max_item_size = max_item_size
+
+    @abc.abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """Return a cached value."""
+
+    @abc.abstractmethod
+    def set(self, key: str, value: bytes) -> None:
+        """Cache a value."""
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, bytes]:
+        """Return the cached values of multiple keys."""
+        values = {key: self.get(key) for key in keys}
+        return {key: value for key, value in values.items() if value is not None}
+
+    def set_many(self, items: Mapping[str, bytes]) -> None:
+        """Cache multiple values."""
+        for key, value in items.items():
+            self.set(key, value)
+
+    def invalidate(self, prefix: str) -> int:
+        """Remove the values whose key starts with `prefix`."""
+        return 0
+
+
+class RedisBytesCache(BytesCache):
+    """
+    Bytes cache in redis.
+
+    Values are stored in the titiler-xarray namespace, so they are removed by
+    `invalidate` with the dataset entries. The total memory is bounded by the
+    redis `maxmemory` eviction policy.
+    """
+
+    def __init__(self, cache_client, ttl: int, max_item_size: int):
+        """Create a redis bytes cache."""
+        super().__init__(ttl, max_item_size)
+        self.cache_client = cache_client
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return a cached value."""
+        return self.cache_client.get(key)
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, bytes]:
+        """Return the cached values of multiple keys in one round trip."""
+        if not keys:
+            return {}
+        values = self.cache_client.mget(keys)
+        return {key: value for key, value in zip(keys, values) if value is not None}
+
+    def set(self, key: str, value: bytes) -> None:
+        """Cache a value."""
+        self.set_many({key: value})
+
+    def set_many(self, items: Mapping[str, bytes]) -> None:
+        """Cache multiple values in one round trip."""
+        pipeline = self.cache_client.pipeline(transaction=False)
+        for key, value in items.items():
+            if len(value) <= self.max_item_size:
+                pipeline.set(key, value, ex=self.ttl or None)
+        pipeline.execute()
+
+
+class DiskBytesCache(BytesCache):
+    """
+    Bytes cache in a local directory.
+
+    Each value is a file named after the hash of its key and holding the key
+    and the value. Least recently used values are removed when the directory
+    grows over `maxsize` bytes.
+    """
+
+    def __init__(self, directory: str, maxsize: int, ttl: int, max_item_size: int):
+        """Create a disk bytes cache."""
+        super().__init__(ttl, max_item_size)
+        self.directory = directory
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(os.path.getsize(f) for f in self._files())
+
+    def _files(self) -> List[str]:
+        return [
+            os.path.join(self.directory, f)
+            for f in os.listdir(self.directory)
+            if f.endswith(".cache")
+        ]
+
+    def _path(self, key: str) -> str:
+        return os.path.join(
+            self.directory, hashlib.sha256(key.encode()).hexdigest() + ".cache"
+        )
+
+    def _remove(self, path: str) -> None:
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        with self.lock:
+            self.size -= size
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return a cached value."""
+        path = self._path(key)
+        try:
+            if self.ttl and time.time() - os.path.getmtime(path) > self.ttl:
+                self._remove(path)
+                return None
+            with open(path, "rb") as f:
+                cached_key, value = f.read().split(b"\n", 1)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        if cached_key.decode() != key:
+            return None
+
+        # access time is used to evict the least recently used values
+        os.utime(path, (time.time(), os.path.getmtime(path)))
+        return value
+
+    def set(self, key: str, value: bytes) -> None:
+        """Cache a value."""
+        if len(value) > self.max_item_size:
+            return
+
+        path = self._path(key)
+        data = key.encode() + b"\n" + value
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+
+        previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+        with self.lock:
+            self.size += len(data) - previous_size
+            overflow = self.size > self.maxsize
+
+        if overflow:
+            self.evict()
+
+    def evict(self) -> None:
+        """Remove the least recently used values until the cache fits in `maxsize`."""
+        files = []
+        for path in self._files():
+            try:
+                files.append((os.path.getatime(path), path))
+            except FileNotFoundError:
+                continue
+
+        for _, path in sorted(files):
+            if self.size <= self.maxsize:
+                break
+            self._remove(path)
+
+    def invalidate(self, prefix: str) -> int:
+        """Remove the values whose key starts with `prefix`."""
+        count = 0
+        for path in self._files():
+            try:
+                with open(path, "rb") as f:
+                    key = f.readline().decode().rstrip("\n")
+            except FileNotFoundError:
+                continue
+
+            if key.startswith(prefix):
+                self._remove(path)
+                count += 1
+
+        return count
+
+
+def get_bytes_cache(
+    backend: Optional[str],
+    ttl: int,
+    maxsize: int,
+    max_item_size: int,
+    directory: str,
+) -> Optional[BytesCache]:
+    """Create a `redis` or `disk` bytes cache."""
+    if backend == "redis":
+        from titiler.xarray.redis_pool import get_redis
+
+        return RedisBytesCache(get_redis(), ttl=ttl, max_item_size=max_item_size)
+
+    if backend == "disk":
+        return DiskBytesCache(
+            directory, maxsize=maxsize, ttl=ttl, max_item_size=max_item_size
+        )
+
+    return None
+
+
+class TileCache:
+    """Rendered tiles cache, stores the encoded image bytes and media type."""
+
+    def __init__(self, backend: BytesCache):
+        """Create a tile cache on top of a bytes cache."""
+        self.backend = backend
+
+    def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        """Return the content and media type of a cached tile."""
+        data = self.backend.get(key)
+        if not data:
+            return None
+        media_type, content = data.split(b"\n", 1)
+        return content, media_type.decode()
+
+    def set(self, key: str, content: bytes, media_type: str) -> None:
+        """Cache a rendered tile."""
+        self.backend.set(key, media_type.encode() + b"\n" + content)
+
+    def invalidate(self, prefix: str) -> int:
+        """Remove the tiles whose key starts with `prefix`."""
+        return self.backend.invalidate(prefix)
+
+
+def get_tile_cache() -> Optional[TileCache]:
+    """Create the rendered tiles cache from the API settings."""
+    backend = get_bytes_cache(
+        api_settings.tile_cache,
+        ttl=api_settings.tile_cache_ttl,
+        maxsize=api_settings.tile_cache_maxsize,
+        max_item_size=api_settings.tile_cache_max_item_size,
+        directory=api_settings.tile_cache_directory,
+    )
+    return TileCache(backend) if backend is not None else None
+
+
+class ChunkCache:
+    """
+    Zarr chunks cache: a per-worker LRU bounded to `maxsize` bytes, in front of
+    an optional shared (redis or disk) bytes cache.
+
+    With a `ttl` (seconds), chunks are also evicted from memory when they are
+    older than `ttl`, so that the workers which did not handle an invalidation
+    read a rewritten dataset again.
+    """
+
+    def __init__(
+        self, maxsize: int, backend: Optional[BytesCache] = None, ttl: float = 0
+    ):
+        """Create a chunk cache."""
+        self.memory: Cache = (
+            TTLCache(maxsize=maxsize, ttl=ttl, getsizeof=len)
+            if ttl
+            else LRUCache(maxsize=maxsize, getsizeof=len)
+        )
+        self.backend = backend
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, bytes]:
+        """Return the cached chunks."""
+        with self.lock:
+            values = {k: self.memory[k] for k in keys if k in self.memory}
+            self.hits += len(values)
+
+        missing = [k for k in keys if k not in values]
+        if missing and self.backend is not None:
+            shared = self.backend.get_many(missing)
+            self._set_memory(shared)
+            with self.lock:
+                self.shared_hits += len(shared)
+            values.update(shared)
+
+        with self.lock:
+            self.misses += len(keys) - len(values)
+
+        return values
+
+    def set_many(self, items: Mapping[str, bytes]) -> None:
+        """Cache chunks read from the store."""
+        self._set_memory(items)
+        if self.backend is not None:
+            self.backend.set_many(items)
+
+    def _set_memory(self, items: Mapping[str, bytes]) -> None:
+        with self.lock:
+            for key, value in items.items():
+                try:
+                    self.memory[key] = value
+                except ValueError:
+                    # value too large
+                    pass
+
+    def invalidate(self, prefix: str) -> int:
+        """Remove the chunks whose key starts with `prefix`."""
+        with self.lock:
+            keys = [k for k in self.memory.keys() if k.startswith(prefix)]
+            for key in keys:
+                self.memory.pop(key, None)
+
+        count = len(keys)
+        if self.backend is not None:
+            count += self.backend.invalidate(prefix)
+        return count
+
+    def stats(self) -> Dict[str, int]:
+        """Cache hits, misses and size."""
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "size": int(self.memory.currsize),
+                "maxsize": int(self.memory.maxsize),
+            }
+
+
+def is_metadata_key(key: str) -> bool:
+    """Whether a zarr store key is a metadata key (`.zmetadata`, `.zarray`...)."""
+    return key.rsplit("/", 1)[-1].startswith(".")
+
+
+class ChunkCacheStore(Store):
+    """
+    Zarr store reading the chunks of a dataset through the chunk cache.
+
+    Cache keys are the store keys prefixed with the dataset cache key prefix,
+    so that the chunks are shared by all the open arguments of a dataset and
+    are removed by `invalidate`. The metadata keys (`.zmetadata`, `.zarray`,
+    `.zattrs`...) are always read from the store, so that a reopened dataset
+    has its current metadata, and version.
+    """
+
+    def __init__(self, store: BaseStore, prefix: str, cache: ChunkCache):
+        """Wrap a zarr store."""
+        self.store = store
+        self.prefix = prefix
+        self.cache = cache
+
+    def __getitem__(self, key: str) -> bytes:
+        """Get key value."""
+        if is_metadata_key(key):
+            return self.store[key]
+
+        cached = self.cache.get_many([self.prefix + key])
+        if cached:
+            return cached[self.prefix + key]
+
+        value = self.store[key]
+        self.cache.set_many({self.prefix + key: value})
+        return value
+
+    def getitems(
+        self, keys: Sequence[str], *, contexts: Mapping[str, Any]
+    ) -> Mapping[str, Any]:
+        """Get multiple keys, the keys not cached are fetched in one call."""
+        cached = self.cache.get_many(
+            [self.prefix + k for k in keys if not is_metadata_key(k)]
+        )
+        values = {k: cached[self.prefix + k] for k in keys if self.prefix + k in cached}
+
+        to_fetch = [k for k in keys if k not in values]
+        if to_fetch:
+            fetched = self.store.getitems(to_fetch, contexts=contexts)
+            self._set_many(fetched)
+            values.update(fetched)
+
+        return values
+
+    async def agetitems(self, keys: Sequence[str]) -> Mapping[str, Any]:
+        """
+        Get multiple keys without blocking the event loop.
+
+        Keys not cached are fetched concurrently with the async implementation
+        of the fsspec filesystem (s3, http, reference) when there is one, or in
+        a worker thread otherwise.
+        """
+        cached = await run_in_threadpool(
+            self.cache.get_many,
+            [self.prefix + k for k in keys if not is_metadata_key(k)],
+        )
+        values = {k: cached[self.prefix + k] for k in keys if self.prefix + k in cached}
+
+        to_fetch = [k for k in keys if k not in values]
+        if not to_fetch:
+            return values
+
+        fs = getattr(self.store, "fs", None)
+        if isinstance(self.store, FSStore) and isinstance(fs, AsyncFileSystem):
+            paths = {
+                self.store.map._key_to_str(self.store._normalize_key(k)): k
+                for k in to_fetch
+            }
+            coro = fs._cat(list(paths), on_error="return")
+            if fs.asynchronous:
+                results = await coro
+            else:
+                # run on the filesystem's own event loop
+                results = await asyncio.wrap_future(
+                    asyncio.run_coroutine_threadsafe(coro, fs.loop)
+                )
+
+            fetched = {}
+            unreachable = []
+            for path, value in results.items():
+                if isinstance(value, self.store.exceptions):
+                    continue
+                elif isinstance(value, ReferenceNotReachable) or value is None:
+                    # the async reads of references to files fail, and return
+                    # None for other references, with fsspec<2024.6
+                    unreachable.append(paths[path])
+                elif isinstance(value, Exception):
+                    raise value
+                else:
+                    fetched[paths[path]] = value
+
+            if unreachable:
+                fetched.update(
+                    await run_in_threadpool(
+                        self.store.getitems, unreachable, contexts={}
+                    )
+                )
+        else:
+            fetched = await run_in_threadpool(
+                self.store.getitems, to_fetch, contexts={}
+            )
+
+        self._set_many(fetched)
+        values.update(fetched)
+        return values
+
+    def _set_many(self, items: Mapping[str, bytes]) -> None:
+        self.cache.set_many(
+            {self.prefix + k: v for k, v in items.items() if not is_metadata_key(k)}
+        )
+
+    def __contains__(self, key: object) -> bool:
+        """Check if key is in the store."""
+        return key in self.store
+
+    def listdir(self, path: str = "") -> List[str]:
+        """List the content of a path."""
+        return listdir(self.store, path)
+
+    def __iter__(self):
+        """Iterate over the keys of the wrapped store."""
+        return iter(self.store)
+
+    def __len__(self) -> int:
+        """Number of keys in the wrapped store."""
+        return len(self.store)
+
+    def __setitem__(self, key, value):
+        """The store is read-only."""
+        raise ReadOnlyError()
+
+    def __delitem__(self, key):
+        """The store is read-only."""
+        raise ReadOnlyError()
+
+
+def invalidate(
+    cache_client,
+    src_path: Optional[str] = None,
+    prefix: Optional[str] = None,
+    tile_cache: Optional[TileCache] = None,
+) -> int:
+    """
+    Delete the cache entries of one dataset, of the datasets whose path starts
+    with `prefix` or all the titiler-xarray entries when neither is set.
+
+    Only keys in our namespace are removed, other applications sharing the
+    redis instance are left untouched. Matching datasets and chunks are also
+    dropped from this worker's caches and from the `tile_cache`. Returns the
+    number of deleted entries.
+    """
+    key_prefix = cache_key_prefix(src_path=src_path, prefix=prefix)
+    pattern = re.sub(r"([*?\[\]\\])", r"\\\1", key_prefix) + "*"
+
+    dataset_cache.invalidate(key_prefix)
+    chunk_cache.invalidate(key_prefix)
+
+    count = tile_cache.invalidate(key_prefix) if tile_cache else 0
+    keys = list(cache_client.scan_iter(match=pattern, count=1000))
+    for idx in range(0, len(keys), 1000):
+        count += cache_client.delete(*keys[idx : idx + 1000])
+
+    return count
+
+
+dataset_cache = DatasetCache(
+    maxsize=api_settings.dataset_cache_maxsize,
+    ttl=api_settings.dataset_cache_ttl,
+)
+
+chunk_cache = ChunkCache(
+    maxsize=api_settings.chunk_cache_maxsize,
+    ttl=api_settings.dataset_cache_ttl,
+    backend=get_bytes_cache(
+        api_settings.chunk_cache,
+        ttl=api_settings.chunk_cache_ttl,
+        maxsize=api_settings.chunk_cache_shared_maxsize,
+        max_item_size=api_settings.chunk_cache_max_item_size,
+        directory=api_settings.chunk_cache_directory,
+    ),
+)
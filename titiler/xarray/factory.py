@@ -1,14 +1,32 @@
 """TiTiler.xarray factory."""
 
-from dataclasses import dataclass
-from typing import Dict, List, Literal, Optional, Type, Union
+import contextlib
+import functools
+import io
+import zipfile
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    List,
+    Literal,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+)
 from urllib.parse import urlencode
 
 import jinja2
 import numpy as np
-from fastapi import Depends, Path, Query
-from pydantic import conint
-from rio_tiler.models import Info
+from fastapi import Depends, HTTPException, Path, Query
+from morecantile import Tile, TileMatrixSet
+from pydantic import Field, conint
+from rio_tiler.models import ImageData, Info
+from starlette.concurrency import run_in_threadpool
 from starlette.requests import Request
 from starlette.responses import HTMLResponse, Response
 from starlette.templating import Jinja2Templates
@@ -20,7 +38,34 @@ from titiler.core.models.mapbox import TileJSON
 from titiler.core.resources.enums import ImageType
 from titiler.core.resources.responses import JSONResponse
 from titiler.core.utils import render_image
-from titiler.xarray.reader import ZarrReader
+from titiler.xarray.animation import apng
+from titiler.xarray.cache import TileCache, get_tile_cache, tile_cache_key
+from titiler.xarray.overviews import approx_overview, tile_overview
+from titiler.xarray.prefetch import TilePrefetcher, get_prefetcher, prefetch_tiles
+from titiler.xarray.reader import (
+    ZarrReader,
+    approx_level,
+    aprefetch,
+    multiscale_group,
+    multiscale_level,
+    multiscale_levels,
+    multiscale_sizes,
+)
+from titiler.xarray.settings import ApiSettings
+from titiler.xarray.stats import (
+    histogram_buckets,
+    multinomial_errors,
+    scale_statistics,
+)
+
+api_settings = ApiSettings()
+
+stack_responses = {
+    200: {
+        "content": {"image/apng": {}, ImageType.npy.mediatype: {}},
+        "description": "Return an animation or a stack of a tile over time.",
+    }
+}
 
 
 def nodata_dependency(
@@ -39,12 +84,202 @@ def nodata_dependency(
     return None
 
 
+def histogram_dependency(
+    bins: Annotated[
+        Optional[str],
+        Query(
+            title="Histogram bins",
+            description="Number of equal-width bins (10, by default) or comma `,` delimited bin edges.",
+        ),
+    ] = None,
+    range: Annotated[
+        Optional[str],
+        Query(
+            title="Histogram range",
+            description="Comma `,` delimited range of the bins, defaults to the variable minimum and maximum.",
+        ),
+    ] = None,
+) -> Dict:
+    """Histogram bins and range dependency."""
+    params: Dict = {"bins": 10}
+    try:
+        if bins:
+            edges = bins.split(",")
+            params["bins"] = (
+                int(edges[0]) if len(edges) == 1 else list(map(float, edges))
+            )
+
+        if range:
+            params["range"] = tuple(map(float, range.split(",")))
+
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid histogram parameters: {e}"
+        ) from e
+
+    if isinstance(params["bins"], int) and params["bins"] < 1:
+        raise HTTPException(status_code=400, detail="`bins` must be positive.")
+
+    if isinstance(params["bins"], list) and (
+        not np.isfinite(params["bins"]).all() or np.any(np.diff(params["bins"]) <= 0)
+    ):
+        raise HTTPException(
+            status_code=400, detail="`bins` edges must increase monotonically."
+        )
+
+    if "range" in params and (
+        len(params["range"]) != 2
+        or not np.isfinite(params["range"]).all()
+        or params["range"][0] > params["range"][1]
+    ):
+        raise HTTPException(
+            status_code=400, detail="`range` must be a finite `min,max` range."
+        )
+
+    return params
+
+
+def render_tile(
+    image: ImageData,
+    format: Optional[ImageType],
+    post_process: Optional[Callable] = None,
+    rescale: Optional[Sequence[Tuple[float, float]]] = None,
+    color_formula: Optional[str] = None,
+    colormap: Optional[Dict] = None,
+    render_params: Optional[Dict] = None,
+) -> Tuple[bytes, str]:
+    """Post-process, rescale, color and encode a tile."""
+    if post_process:
+        image = post_process(image)
+
+    if rescale:
+        image.rescale(rescale)
+
+    if color_formula:
+        image.apply_color_formula(color_formula)
+
+    return render_image(
+        image,
+        output_format=format,
+        colormap=colormap,
+        **(render_params or {}),
+    )
+
+
+def stack_array(images: List[ImageData]) -> bytes:
+    """Encode tiles as a NumPy array of shape (time, bands + mask, height, width)."""
+    array = np.stack(
+        [
+            np.concatenate((image.data, image.mask[None].astype(image.data.dtype)))
+            for image in images
+        ]
+    )
+    with io.BytesIO() as bio:
+        np.save(bio, array)
+        return bio.getvalue()
+
+
+def approx_multiscale_group(
+    url: str,
+    variable: str,
+    group: Optional[Union[int, str]] = None,
+    reference: bool = False,
+    consolidated: bool = True,
+) -> Tuple[Optional[Union[int, str]], Optional[int]]:
+    """
+    Coarsest level of a multiscale store to estimate a level from.
+
+    Returns the group of the level and the size of the estimated level
+    (`group`, or the finest level), or `(group, None)` when the store has no
+    levels.
+    """
+    levels = multiscale_levels(
+        url, variable, reference=reference, consolidated=consolidated
+    )
+    sizes = multiscale_sizes(
+        url, variable, max_group=group, reference=reference, consolidated=consolidated
+    )
+    if not sizes:
+        return group, None
+
+    return levels[approx_level(sizes, api_settings.approx_size)].group, sizes[-1]
+
+
 @dataclass
 class ZarrTilerFactory(BaseTilerFactory):
     """Zarr Tiler Factory."""
 
     reader: Type[ZarrReader] = ZarrReader
 
+    # Rendered tiles cache, disabled by default
+    tile_cache: Optional[TileCache] = field(default_factory=get_tile_cache)
+
+    # Background prefetch of the next tiles, disabled by default
+    prefetcher: Optional[TilePrefetcher] = field(default_factory=get_prefetcher)
+
+    async def request_load(self) -> AsyncIterator[None]:
+        """Count the tile requests in flight for the prefetcher."""
+        if self.prefetcher is None:
+            yield
+            return
+
+        with self.prefetcher.request():
+            yield
+
+    def queue_prefetch(
+        self,
+        tms: TileMatrixSet,
+        tile: Tile,
+        tilesize: int,
+        multiscale: bool,
+        reader_options: Dict[str, Any],
+    ) -> None:
+        """Queue the prefetch of the neighbours and children of a served tile."""
+        if self.prefetcher is None:
+            return
+
+        options = tuple(sorted(reader_options.items()))
+        for next_tile in prefetch_tiles(tms, tile):
+            self.prefetcher.submit(
+                (tms.id, tuple(next_tile), tilesize, multiscale, options),
+                functools.partial(
+                    self.prefetch_tile,
+                    tms,
+                    next_tile,
+                    tilesize,
+                    multiscale,
+                    reader_options,
+                ),
+            )
+
+    async def prefetch_tile(
+        self,
+        tms: TileMatrixSet,
+        tile: Tile,
+        tilesize: int,
+        multiscale: bool,
+        reader_options: Dict[str, Any],
+    ) -> None:
+        """Fetch the chunks of a tile into the chunk cache."""
+        group = None
+        if multiscale:
+            group = await run_in_threadpool(
+                multiscale_group,
+                reader_options["src_path"],
+                reader_options["variable"],
+                tms,
+                tile,
+                tilesize=tilesize,
+                reference=reader_options["reference"],
+                consolidated=reader_options["consolidated"],
+            )
+
+        src_dst = await run_in_threadpool(
+            self.reader, group=group, tms=tms, **reader_options
+        )
+        with src_dst:
+            await src_dst.aprefetch_tile(tile.x, tile.y, tile.z)
+
     def register_routes(self) -> None:  # noqa: C901
         """Register Info / Tiles / TileJSON endoints."""
 
@@ -95,7 +330,7 @@ class ZarrTilerFactory(BaseTilerFactory):
             response_class=JSONResponse,
             responses={200: {"description": "Return dataset's basic info."}},
         )
-        def info_endpoint(
+        async def info_endpoint(
             url: Annotated[str, Query(description="Dataset URL")],
             variable: Annotated[
                 str,
@@ -138,22 +373,26 @@ class ZarrTilerFactory(BaseTilerFactory):
             ] = True,
         ) -> Info:
             """Return dataset's basic info."""
-            with self.reader(
-                url,
-                variable=variable,
-                group=group,
-                reference=reference,
-                decode_times=decode_times,
-                drop_dim=drop_dim,
-                consolidated=consolidated,
-            ) as src_dst:
-                info = src_dst.info().model_dump()
-                if show_times and "time" in src_dst.input.dims:
-                    times = [str(x.data) for x in src_dst.input.time]
-                    info["count"] = len(times)
-                    info["times"] = times
 
-            return Info(**info)
+            def _info() -> Dict:
+                with self.reader(
+                    url,
+                    variable=variable,
+                    group=group,
+                    reference=reference,
+                    decode_times=decode_times,
+                    drop_dim=drop_dim,
+                    consolidated=consolidated,
+                ) as src_dst:
+                    info = src_dst.info().model_dump()
+                    if show_times and "time" in src_dst.input.dims:
+                        times = [str(x.data) for x in src_dst.input.time]
+                        info["count"] = len(times)
+                        info["times"] = times
+
+                return info
+
+            return Info(**await run_in_threadpool(_info))
 
         @self.router.get(r"/tiles/{z}/{x}/{y}", **img_endpoint_params)
         @self.router.get(r"/tiles/{z}/{x}/{y}.{format}", **img_endpoint_params)
@@ -170,7 +409,7 @@ class ZarrTilerFactory(BaseTilerFactory):
             r"/tiles/{tileMatrixSetId}/{z}/{x}/{y}@{scale}x.{format}",
             **img_endpoint_params,
         )
-        def tiles_endpoint(  # type: ignore
+        async def tiles_endpoint(  # type: ignore
             z: Annotated[
                 int,
                 Path(
@@ -246,45 +485,589 @@ class ZarrTilerFactory(BaseTilerFactory):
                 ),
             ] = True,
             nodata=Depends(nodata_dependency),
+            _load=Depends(self.request_load),
         ) -> Response:
             """Create map tile from a dataset."""
+            if self.tile_cache is not None:
+                cache_key = tile_cache_key(
+                    url,
+                    tile=[
+                        ("tileMatrixSetId", tileMatrixSetId),
+                        ("z", z),
+                        ("x", x),
+                        ("y", y),
+                        ("scale", scale),
+                        ("format", format.value if format else None),
+                    ],
+                    options={
+                        "variable": variable,
+                        "multiscale": multiscale,
+                        "reference": reference,
+                        "decode_times": decode_times,
+                        "drop_dim": drop_dim,
+                        "datetime": datetime,
+                        "consolidated": consolidated,
+                        "nodata": nodata,
+                        "post_process": post_process,
+                        "rescale": rescale,
+                        "color_formula": color_formula,
+                        "colormap": colormap,
+                        "render_params": render_params,
+                    },
+                )
+                cached = await run_in_threadpool(self.tile_cache.get, cache_key)
+                if cached is not None:
+                    content, media_type = cached
+                    return Response(content, media_type=media_type)
+
             tms = self.supported_tms.get(tileMatrixSetId)
-            with self.reader(
+            group = None
+            if multiscale:
+                group = await run_in_threadpool(
+                    multiscale_group,
+                    url,
+                    variable,
+                    tms,
+                    Tile(x, y, z),
+                    tilesize=scale * 256,
+                    reference=reference,
+                    consolidated=consolidated,
+                )
+
+            # Blocking work (dataset opening, decoding, reprojection and encoding)
+            # runs in worker threads, the chunks are fetched on the event loop.
+            with contextlib.ExitStack() as readers:
+                src_dst = readers.enter_context(
+                    await run_in_threadpool(
+                        self.reader,
+                        url,
+                        variable=variable,
+                        group=group,
+                        reference=reference,
+                        decode_times=decode_times,
+                        drop_dim=drop_dim,
+                        datetime=datetime,
+                        tms=tms,
+                        consolidated=consolidated,
+                    )
+                )
+                overview_url = None
+                if api_settings.enable_overviews and group is None:
+                    # Low zooms of single resolution datasets read an overview, once
+                    # built in the background
+                    overview_url = await run_in_threadpool(
+                        tile_overview, src_dst, Tile(x, y, z), tilesize=scale * 256
+                    )
+                    if overview_url:
+                        src_dst = readers.enter_context(
+                            await run_in_threadpool(
+                                self.reader, overview_url, variable=variable, tms=tms
+                            )
+                        )
+
+                await src_dst.aprefetch_tile(x, y, z)
+                image = await run_in_threadpool(
+                    src_dst.tile,
+                    x,
+                    y,
+                    z,
+                    tilesize=scale * 256,
+                    nodata=nodata if nodata is not None else src_dst.input.rio.nodata,
+                )
+
+            content, media_type = await run_in_threadpool(
+                render_tile,
+                image,
+                format,
+                post_process=post_process,
+                rescale=rescale,
+                color_formula=color_formula,
+                colormap=colormap,
+                render_params=render_params,
+            )
+
+            if self.tile_cache is not None:
+                await run_in_threadpool(
+                    self.tile_cache.set, cache_key, content, media_type
+                )
+
+            if not overview_url:
+                # the prefetched chunks are the dataset ones, not the overview ones
+                self.queue_prefetch(
+                    tms,
+                    Tile(x, y, z),
+                    scale * 256,
+                    multiscale,
+                    {
+                        "src_path": url,
+                        "variable": variable,
+                        "reference": reference,
+                        "decode_times": decode_times,
+                        "drop_dim": drop_dim,
+                        "datetime": datetime,
+                        "consolidated": consolidated,
+                    },
+                )
+
+            return Response(content, media_type=media_type)
+
+        @self.router.get(
+            r"/tiles/batch",
+            response_class=Response,
+            responses={200: {"content": {"application/zip": {}}}},
+        )
+        @self.router.get(
+            r"/tiles/{tileMatrixSetId}/batch",
+            response_class=Response,
+            responses={200: {"content": {"application/zip": {}}}},
+        )
+        async def batch_tiles_endpoint(  # type: ignore
+            tiles: Annotated[
+                List[str],
+                Query(
+                    alias="tile",
+                    description="Tiles to render, as `z/x/y` (repeat the parameter for each tile).",
+                ),
+            ],
+            url: Annotated[str, Query(description="Dataset URL")],
+            variable: Annotated[
+                str,
+                Query(description="Xarray Variable"),
+            ],
+            tileMatrixSetId: Annotated[  # type: ignore
+                Literal[tuple(self.supported_tms.list())],  # type: ignore
+                f"Identifier selecting one of the TileMatrixSetId supported (default: '{self.default_tms}')",
+            ] = self.default_tms,
+            scale: Annotated[  # type: ignore
+                conint(gt=0, le=4), "Tile size scale. 1=256x256, 2=512x512..."  # type: ignore
+            ] = 1,
+            format: Annotated[
+                ImageType,
+                Query(description="Output image type of the tiles."),
+            ] = ImageType.png,
+            multiscale: Annotated[
+                bool,
+                Query(
+                    title="multiscale",
+                    description="Whether the dataset has multiscale groups (Zoom levels)",
+                ),
+            ] = False,
+            reference: Annotated[
+                bool,
+                Query(
+                    title="reference",
+                    description="Whether the dataset is a kerchunk reference",
+                ),
+            ] = False,
+            decode_times: Annotated[
+                bool,
+                Query(
+                    title="decode_times",
+                    description="Whether to decode times",
+                ),
+            ] = True,
+            drop_dim: Annotated[
+                Optional[str],
+                Query(description="Dimension to drop"),
+            ] = None,
+            datetime: Annotated[
+                Optional[str], Query(description="Slice of time to read (if available)")
+            ] = None,
+            post_process=Depends(self.process_dependency),
+            rescale=Depends(self.rescale_dependency),
+            color_formula=Depends(ColorFormulaParams),
+            colormap=Depends(self.colormap_dependency),
+            render_params=Depends(self.render_dependency),
+            consolidated: Annotated[
+                Optional[bool],
+                Query(
+                    title="consolidated",
+                    description="Whether to expect and open zarr store with consolidated metadata",
+                ),
+            ] = True,
+            nodata=Depends(nodata_dependency),
+        ) -> Response:
+            """
+            Create a zip archive of map tiles (`{z}/{x}/{y}.{format}`).
+
+            The dataset is opened once (per multiscale group) and the union of
+            the chunks needed by the tiles is fetched once. Tiles outside the
+            dataset bounds are left out of the archive.
+            """
+            if len(tiles) > api_settings.batch_max_tiles:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Too many tiles, the maximum is {api_settings.batch_max_tiles}",
+                )
+
+            tms = self.supported_tms.get(tileMatrixSetId)
+            levels = []
+            if multiscale:
+                levels = await run_in_threadpool(
+                    multiscale_levels,
+                    url,
+                    variable,
+                    reference=reference,
+                    consolidated=consolidated,
+                )
+
+            tiles_by_group: Dict[Optional[str], List[Tile]] = {}
+            for tile_id in dict.fromkeys(tiles):
+                try:
+                    tile_z, tile_x, tile_y = map(int, tile_id.split("/"))
+                except ValueError as e:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Invalid tile '{tile_id}', expected z/x/y",
+                    ) from e
+
+                if not tms.is_valid(tile_x, tile_y, tile_z):
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Invalid tile '{tile_id}' for {tileMatrixSetId}",
+                    )
+
+                tile = Tile(tile_x, tile_y, tile_z)
+                group = multiscale_level(levels, tms, tile, tilesize=scale * 256)
+                tiles_by_group.setdefault(group, []).append(tile)
+
+            archive = io.BytesIO()
+            with zipfile.ZipFile(archive, "w") as zip_file:
+                for group, group_tiles in tiles_by_group.items():
+                    src_dst = await run_in_threadpool(
+                        self.reader,
+                        url,
+                        variable=variable,
+                        group=group,
+                        reference=reference,
+                        decode_times=decode_times,
+                        drop_dim=drop_dim,
+                        datetime=datetime,
+                        tms=tms,
+                        consolidated=consolidated,
+                    )
+                    with src_dst:
+                        await src_dst.aprefetch_tiles(group_tiles)
+                        for tile in group_tiles:
+                            if not src_dst.tile_exists(tile.x, tile.y, tile.z):
+                                continue
+
+                            image = await run_in_threadpool(
+                                src_dst.tile,
+                                tile.x,
+                                tile.y,
+                                tile.z,
+                                tilesize=scale * 256,
+                                nodata=(
+                                    nodata
+                                    if nodata is not None
+                                    else src_dst.input.rio.nodata
+                                ),
+                            )
+                            content, _ = await run_in_threadpool(
+                                render_tile,
+                                image,
+                                format,
+                                post_process=post_process,
+                                rescale=rescale,
+                                color_formula=color_formula,
+                                colormap=colormap,
+                                render_params=render_params,
+                            )
+                            zip_file.writestr(
+                                f"{tile.z}/{tile.x}/{tile.y}.{format.value}", content
+                            )
+
+            return Response(archive.getvalue(), media_type="application/zip")
+
+        @self.router.get(
+            r"/stack/{z}/{x}/{y}.{format}",
+            response_class=Response,
+            responses=stack_responses,
+        )
+        @self.router.get(
+            r"/stack/{z}/{x}/{y}@{scale}x.{format}",
+            response_class=Response,
+            responses=stack_responses,
+        )
+        @self.router.get(
+            r"/stack/{tileMatrixSetId}/{z}/{x}/{y}.{format}",
+            response_class=Response,
+            responses=stack_responses,
+        )
+        @self.router.get(
+            r"/stack/{tileMatrixSetId}/{z}/{x}/{y}@{scale}x.{format}",
+            response_class=Response,
+            responses=stack_responses,
+        )
+        async def stack_endpoint(  # type: ignore
+            z: Annotated[
+                int,
+                Path(
+                    description="Identifier (Z) selecting one of the scales defined in the TileMatrixSet and representing the scaleDenominator the tile.",
+                ),
+            ],
+            x: Annotated[
+                int,
+                Path(
+                    description="Column (X) index of the tile on the selected TileMatrix. It cannot exceed the MatrixHeight-1 for the selected TileMatrix.",
+                ),
+            ],
+            y: Annotated[
+                int,
+                Path(
+                    description="Row (Y) index of the tile on the selected TileMatrix. It cannot exceed the MatrixWidth-1 for the selected TileMatrix.",
+                ),
+            ],
+            format: Annotated[
+                Literal["png", "npy"],
+                Path(
+                    description="Animated PNG of the time steps (png) or raw stack of the time steps with the mask as last band (npy)."
+                ),
+            ],
+            url: Annotated[str, Query(description="Dataset URL")],
+            variable: Annotated[
+                str,
+                Query(description="Xarray Variable"),
+            ],
+            tileMatrixSetId: Annotated[  # type: ignore
+                Literal[tuple(self.supported_tms.list())],  # type: ignore
+                f"Identifier selecting one of the TileMatrixSetId supported (default: '{self.default_tms}')",
+            ] = self.default_tms,
+            scale: Annotated[  # type: ignore
+                conint(gt=0, le=4), "Tile size scale. 1=256x256, 2=512x512..."  # type: ignore
+            ] = 1,
+            datetimes: Annotated[
+                Optional[List[str]],
+                Query(
+                    alias="datetime",
+                    description="Time steps to read, the nearest time of each datetime (repeat the parameter for each time step).",
+                ),
+            ] = None,
+            start_datetime: Annotated[
+                Optional[str],
+                Query(description="Read the time steps from this datetime"),
+            ] = None,
+            end_datetime: Annotated[
+                Optional[str],
+                Query(description="Read the time steps until this datetime"),
+            ] = None,
+            delay: Annotated[
+                int,
+                Query(
+                    gt=0,
+                    le=65535,
+                    description="Display time of a frame, in milliseconds",
+                ),
+            ] = 100,
+            multiscale: Annotated[
+                bool,
+                Query(
+                    title="multiscale",
+                    description="Whether the dataset has multiscale groups (Zoom levels)",
+                ),
+            ] = False,
+            reference: Annotated[
+                bool,
+                Query(
+                    title="reference",
+                    description="Whether the dataset is a kerchunk reference",
+                ),
+            ] = False,
+            decode_times: Annotated[
+                bool,
+                Query(
+                    title="decode_times",
+                    description="Whether to decode times",
+                ),
+            ] = True,
+            drop_dim: Annotated[
+                Optional[str],
+                Query(description="Dimension to drop"),
+            ] = None,
+            post_process=Depends(self.process_dependency),
+            rescale=Depends(self.rescale_dependency),
+            color_formula=Depends(ColorFormulaParams),
+            colormap=Depends(self.colormap_dependency),
+            render_params=Depends(self.render_dependency),
+            consolidated: Annotated[
+                Optional[bool],
+                Query(
+                    title="consolidated",
+                    description="Whether to expect and open zarr store with consolidated metadata",
+                ),
+            ] = True,
+            nodata=Depends(nodata_dependency),
+        ) -> Response:
+            """
+            Create an animation, or a raw stack, of a map tile over time.
+
+            The source window of the tile is read once for all the time steps,
+            so the chunks holding several time steps are only decoded once.
+            """
+            tms = self.supported_tms.get(tileMatrixSetId)
+            group = None
+            if multiscale:
+                group = await run_in_threadpool(
+                    multiscale_group,
+                    url,
+                    variable,
+                    tms,
+                    Tile(x, y, z),
+                    tilesize=scale * 256,
+                    reference=reference,
+                    consolidated=consolidated,
+                )
+
+            src_dst = await run_in_threadpool(
+                self.reader,
                 url,
                 variable=variable,
-                group=z if multiscale else None,
+                group=group,
                 reference=reference,
                 decode_times=decode_times,
                 drop_dim=drop_dim,
-                datetime=datetime,
                 tms=tms,
                 consolidated=consolidated,
-            ) as src_dst:
-                image = src_dst.tile(
+            )
+            with src_dst:
+                try:
+                    times = await run_in_threadpool(
+                        src_dst.stack_times,
+                        datetimes,
+                        start_datetime,
+                        end_datetime,
+                    )
+                except ValueError as e:
+                    raise HTTPException(status_code=400, detail=str(e)) from e
+
+                if not len(times):
+                    raise HTTPException(
+                        status_code=404, detail="No time steps in the datetime range"
+                    )
+
+                if len(times) > api_settings.stack_max_times:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Too many time steps, the maximum is {api_settings.stack_max_times}",
+                    )
+
+                da = await run_in_threadpool(src_dst.tile_stack_window, x, y, z, times)
+                await aprefetch(da)
+                images = await run_in_threadpool(
+                    src_dst.tile_stack,
                     x,
                     y,
                     z,
+                    times,
                     tilesize=scale * 256,
                     nodata=nodata if nodata is not None else src_dst.input.rio.nodata,
                 )
 
-            if post_process:
-                image = post_process(image)
+            if format == "npy":
+                content = await run_in_threadpool(stack_array, images)
+                return Response(content, media_type=ImageType.npy.mediatype)
 
-            if rescale:
-                image.rescale(rescale)
-
-            if color_formula:
-                image.apply_color_formula(color_formula)
+            frames = await run_in_threadpool(
+                lambda: [
+                    render_tile(
+                        image,
+                        ImageType.png,
+                        post_process=post_process,
+                        rescale=rescale,
+                        color_formula=color_formula,
+                        colormap=colormap,
+                        render_params=render_params,
+                    )[0]
+                    for image in images
+                ]
+            )
+            content = await run_in_threadpool(apng, frames, delay=delay)
+            return Response(content, media_type="image/apng")
 
-            content, media_type = render_image(
-                image,
-                output_format=format,
-                colormap=colormap,
-                **render_params,
+        @self.router.get(
+            r"/point/{lon},{lat}",
+            response_class=JSONResponse,
+            responses={
+                200: {"description": "Return a value or a time series for a point"}
+            },
+        )
+        async def point_endpoint(
+            lon: Annotated[float, Path(description="Longitude")],
+            lat: Annotated[float, Path(description="Latitude")],
+            url: Annotated[str, Query(description="Dataset URL")],
+            variable: Annotated[
+                str,
+                Query(description="Xarray Variable"),
+            ],
+            group: Annotated[
+                Optional[int],
+                Query(
+                    description="Select a specific zarr group from a zarr hierarchy, can be for pyramids or datasets. Can be used to open a dataset in HDF5 files."
+                ),
+            ] = None,
+            reference: Annotated[
+                bool,
+                Query(
+                    title="reference",
+                    description="Whether the dataset is a kerchunk reference",
+                ),
+            ] = False,
+            decode_times: Annotated[
+                bool,
+                Query(
+                    title="decode_times",
+                    description="Whether to decode times",
+                ),
+            ] = True,
+            drop_dim: Annotated[
+                Optional[str],
+                Query(description="Dimension to drop"),
+            ] = None,
+            datetime: Annotated[
+                Optional[str],
+                Query(
+                    description="Slice of time to read (if available), the whole time series is returned by default"
+                ),
+            ] = None,
+            consolidated: Annotated[
+                Optional[bool],
+                Query(
+                    title="consolidated",
+                    description="Whether to expect and open zarr store with consolidated metadata",
+                ),
+            ] = True,
+        ) -> Dict:
+            """Return the value of a variable at a point, or its time series."""
+            src_dst = await run_in_threadpool(
+                self.reader,
+                url,
+                variable=variable,
+                group=group,
+                reference=reference,
+                decode_times=decode_times,
+                drop_dim=drop_dim,
+                datetime=datetime,
+                consolidated=consolidated,
             )
+            with src_dst:
+                da = await run_in_threadpool(src_dst.point_array, lon, lat)
+                # the time chunks of the pixel are fetched concurrently
+                await aprefetch(da)
+                values = await run_in_threadpool(lambda: da.values)
 
-            return Response(content, media_type=media_type)
+            # NaN are returned as null
+            data = values.astype(object)
+            data[np.isnan(values)] = None
+            values = data.tolist()
+            point: Dict = {"coordinates": [lon, lat], "variable": variable}
+            if "time" in da.dims:
+                point["times"] = [str(t) for t in da["time"].values]
+                point["values"] = values
+            else:
+                point["value"] = values
+
+            return point
 
         @self.router.get(
             "/tilejson.json",
@@ -298,7 +1081,7 @@ class ZarrTilerFactory(BaseTilerFactory):
             responses={200: {"description": "Return a tilejson"}},
             response_model_exclude_none=True,
         )
-        def tilejson_endpoint(  # type: ignore
+        async def tilejson_endpoint(  # type: ignore
             request: Request,
             url: Annotated[str, Query(description="Dataset URL")],
             variable: Annotated[
@@ -400,35 +1183,132 @@ class ZarrTilerFactory(BaseTilerFactory):
 
             tms = self.supported_tms.get(tileMatrixSetId)
 
+            def _tilejson() -> Dict:
+                with self.reader(
+                    url,
+                    variable=variable,
+                    group=group,
+                    reference=reference,
+                    decode_times=decode_times,
+                    tms=tms,
+                    consolidated=consolidated,
+                ) as src_dst:
+                    # see https://github.com/corteva/rioxarray/issues/645
+                    minx, miny, maxx, maxy = zip(
+                        [-180, -90, 180, 90], list(src_dst.geographic_bounds)
+                    )
+                    bounds = [max(minx), max(miny), min(maxx), min(maxy)]
+
+                    return {
+                        "bounds": bounds,
+                        "minzoom": minzoom if minzoom is not None else src_dst.minzoom,
+                        "maxzoom": maxzoom if maxzoom is not None else src_dst.maxzoom,
+                        "tiles": [tiles_url],
+                    }
+
+            return await run_in_threadpool(_tilejson)
+
+        @self.router.get(
+            "/histogram",
+            response_class=JSONResponse,
+            responses={200: {"description": "Return histogram for this data variable"}},
+            response_model_exclude_none=True,
+        )
+        def histogram(
+            url: Annotated[str, Query(description="Dataset URL")],
+            variable: Annotated[
+                str,
+                Query(description="Xarray Variable"),
+            ],
+            reference: Annotated[
+                bool,
+                Query(
+                    title="reference",
+                    description="Whether the dataset is a kerchunk reference",
+                ),
+            ] = False,
+            consolidated: Annotated[
+                bool,
+                Query(
+                    title="consolidated",
+                    description="Whether to expect a consolidated dataset",
+                ),
+            ] = True,
+            group: Annotated[
+                Optional[int],
+                Query(
+                    description="Select a specific zarr group from a zarr hierarchy, can be for pyramids or datasets. Can be used to open a dataset in HDF5 files."
+                ),
+            ] = None,
+            multiscale: Annotated[
+                bool,
+                Query(
+                    title="multiscale",
+                    description="Whether the dataset has multiscale groups (Zoom levels)",
+                ),
+            ] = False,
+            approx: Annotated[
+                bool,
+                Query(
+                    title="approx",
+                    description="Estimate the histogram from a coarser multiscale level or a sample of chunks, with the standard error of the counts.",
+                ),
+            ] = False,
+            histogram_params: Dict = Depends(histogram_dependency),
+        ):
+            """Return the histogram of a variable."""
+            level: Optional[Union[int, str]] = group
+            total = None
+            if approx and multiscale:
+                # Histogram of the coarsest level with enough values, scaled to
+                # the size of the selected (or finest) level.
+                level, total = approx_multiscale_group(
+                    url, variable, group, reference, consolidated
+                )
+
             with self.reader(
                 url,
                 variable=variable,
-                group=group,
                 reference=reference,
-                decode_times=decode_times,
-                tms=tms,
                 consolidated=consolidated,
+                group=level,
             ) as src_dst:
-                # see https://github.com/corteva/rioxarray/issues/645
-                minx, miny, maxx, maxy = zip(
-                    [-180, -90, 180, 90], list(src_dst.geographic_bounds)
-                )
-                bounds = [max(minx), max(miny), min(maxx), min(maxy)]
+                if total:
+                    counts, edges = src_dst.histogram(**histogram_params)
+                    errors = multinomial_errors(counts, total)
+                    counts = counts * total / src_dst.input.size
+                elif approx:
+                    overview_url = (
+                        approx_overview(src_dst, api_settings.approx_size)
+                        if api_settings.enable_overviews
+                        else None
+                    )
+                    if overview_url:
+                        # Histogram of an overview, scaled to the variable size
+                        with self.reader(overview_url, variable=variable) as overview:
+                            counts, edges = overview.histogram(**histogram_params)
+                            size = overview.input.size
+                        full_size = src_dst.input.size
+                        errors = multinomial_errors(counts, full_size)
+                        counts = counts * full_size / size
+                    else:
+                        counts, edges, errors = src_dst.approx_histogram(
+                            **histogram_params
+                        )
+                else:
+                    counts, edges = src_dst.histogram(**histogram_params)
+                    errors = None
 
-                return {
-                    "bounds": bounds,
-                    "minzoom": minzoom if minzoom is not None else src_dst.minzoom,
-                    "maxzoom": maxzoom if maxzoom is not None else src_dst.maxzoom,
-                    "tiles": [tiles_url],
-                }
+            return histogram_buckets(counts, edges, errors)
 
         @self.router.get(
-            "/histogram",
+            "/statistics",
             response_class=JSONResponse,
-            responses={200: {"description": "Return histogram for this data variable"}},
-            response_model_exclude_none=True,
+            responses={
+                200: {"description": "Return statistics for this data variable"}
+            },
         )
-        def histogram(
+        def statistics(
             url: Annotated[str, Query(description="Dataset URL")],
             variable: Annotated[
                 str,
@@ -454,25 +1334,60 @@ class ZarrTilerFactory(BaseTilerFactory):
                     description="Select a specific zarr group from a zarr hierarchy, can be for pyramids or datasets. Can be used to open a dataset in HDF5 files."
                 ),
             ] = None,
-        ):
+            drop_dim: Annotated[
+                Optional[str],
+                Query(description="Dimension to drop"),
+            ] = None,
+            datetime: Annotated[
+                Optional[str], Query(description="Slice of time to read (if available)")
+            ] = None,
+            percentiles: Annotated[
+                Optional[List[Annotated[int, Field(ge=0, le=100)]]],
+                Query(
+                    alias="p",
+                    title="Percentile values",
+                    description="List of percentile values (default to [2, 98]).",
+                ),
+            ] = None,
+            multiscale: Annotated[
+                bool,
+                Query(
+                    title="multiscale",
+                    description="Whether the dataset has multiscale groups (Zoom levels)",
+                ),
+            ] = False,
+            approx: Annotated[
+                bool,
+                Query(
+                    title="approx",
+                    description="Estimate the statistics from a coarser multiscale level or a sample of chunks, with the standard error of the mean and count.",
+                ),
+            ] = False,
+        ) -> Dict:
+            """Return the statistics of a variable."""
+            level: Optional[Union[int, str]] = group
+            total = None
+            if approx and multiscale:
+                level, total = approx_multiscale_group(
+                    url, variable, group, reference, consolidated
+                )
+
             with self.reader(
                 url,
                 variable=variable,
                 reference=reference,
                 consolidated=consolidated,
-                group=group,
+                group=level,
+                datetime=datetime,
+                drop_dim=drop_dim,
             ) as src_dst:
-                boolean_mask = ~np.isnan(src_dst.input)
-                data_values = src_dst.input.values[boolean_mask]
-                counts, values = np.histogram(data_values, bins=10)
-                counts, values = counts.tolist(), values.tolist()
-                buckets = list(
-                    zip(values, [values[i + 1] for i in range(len(values) - 1)])
+                if total:
+                    result = src_dst.variable_statistics(percentiles=percentiles)
+                    return scale_statistics(result, src_dst.input.size, total)
+
+                return src_dst.variable_statistics(
+                    percentiles=percentiles, approx=approx
                 )
-                hist_dict = []
-                for idx, bucket in enumerate(buckets):
-                    hist_dict.append({"bucket": bucket, "value": counts[idx]})
-                return hist_dict
 
         @self.router.get("/map", response_class=HTMLResponse)
         @self.router.get("/{tileMatrixSetId}/map", response_class=HTMLResponse)
@@ -1,12 +1,15 @@
 """titiler app."""
 
 import logging
+from typing import Optional
 
 import rioxarray
 import zarr
-from fastapi import Depends, FastAPI
+from fastapi import Depends, FastAPI, Query
+from rio_tiler.errors import PointOutsideBounds
 from starlette import status
 from starlette.middleware.cors import CORSMiddleware
+from typing_extensions import Annotated
 
 import titiler.xarray.reader as reader
 from titiler.core.errors import DEFAULT_STATUS_CODES, add_exception_handlers
@@ -17,6 +20,8 @@ from titiler.core.middleware import (
     TotalTimeMiddleware,
 )
 from titiler.xarray import __version__ as titiler_version
+from titiler.xarray import regrid
+from titiler.xarray.cache import chunk_cache, invalidate
 from titiler.xarray.factory import ZarrTilerFactory
 from titiler.xarray.middleware import ServerTimingMiddleware
 from titiler.xarray.redis_pool import get_redis
@@ -53,6 +58,7 @@ app.include_router(algorithms.router, tags=["Algorithms"])
 
 error_codes = {
     zarr.errors.GroupNotFoundError: status.HTTP_422_UNPROCESSABLE_ENTITY,
+    PointOutsideBounds: status.HTTP_404_NOT_FOUND,
 }
 add_exception_handlers(app, error_codes)
 add_exception_handlers(app, DEFAULT_STATUS_CODES)
@@ -80,7 +86,10 @@ if api_settings.debug:
         ServerTimingMiddleware,
         calls_to_track={
             "1-xarray-open_dataset": (reader.xarray_open_dataset,),
-            "2-rioxarray-reproject": (rioxarray.raster_array.RasterArray.reproject,),
+            "2-rioxarray-reproject": (
+                rioxarray.raster_array.RasterArray.reproject,
+                regrid.regrid_nearest,
+            ),
         },
     )
 
@@ -98,7 +107,33 @@ def ping():
 
 
 @app.get("/clear_cache")
-def clear_cache(cache_client=Depends(get_redis)):
-    """Clear the cache."""
-    cache_client.flushall()
-    return {"status": "cache cleared!"}
+def clear_cache(
+    url: Annotated[
+        Optional[str],
+        Query(description="Only clear the cache entries of this dataset"),
+    ] = None,
+    prefix: Annotated[
+        Optional[str],
+        Query(
+            description="Only clear the cache entries of the datasets whose URL starts with this prefix"
+        ),
+    ] = None,
+    cache_client=Depends(get_redis),
+):
+    """Clear the cache (all titiler-xarray entries by default)."""
+    deleted = invalidate(
+        cache_client,
+        src_path=url,
+        prefix=prefix,
+        tile_cache=xarray_factory.tile_cache,
+    )
+    return {"status": "cache cleared!", "deleted": deleted}
+
+
+@app.get("/cache_stats")
+def cache_stats():
+    """Chunk and warp map cache hits and misses of this worker."""
+    stats = {"chunks": chunk_cache.stats(), "warp_maps": regrid.warp_maps.stats()}
+    if xarray_factory.prefetcher is not None:
+        stats["prefetch"] = xarray_factory.prefetcher.stats()
+    return stats
@@ -0,0 +1,241 @@
+"""Compact dataset metadata cache.
+
+Instead of pickling a whole `xarray.Dataset` (with its fsspec mapper and backend
+state), we record the bytes xarray reads while opening a dataset: the zarr
+metadata documents (`.zmetadata`, `.zgroup`, `.zarray`, `.zattrs`) and the
+coordinate chunks, or the HDF5 header blocks for NetCDF files. Those bytes hold
+the dims, coordinates, attrs and encoding of the dataset, so replaying them
+rebuilds the dataset without touching the remote store.
+"""
+
+import bisect
+import io
+import pickle
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence
+
+from zarr.errors import ReadOnlyError
+from zarr.storage import BaseStore, Store, listdir
+
+# Bump when the layout of the cached entries changes
+CACHE_FORMAT_VERSION = 1
+
+
+class CachedStore(Store):
+    """
+    Zarr store serving the keys read while opening a dataset from memory.
+
+    While `recording`, every key, missing key and directory listing requested
+    through the store is kept in `entries`. Keys which were not recorded (data
+    chunks) are read from the wrapped store, which is only created on first use.
+    """
+
+    def __init__(
+        self,
+        store_factory: Callable[[], BaseStore],
+        entries: Optional[Dict[str, Any]] = None,
+    ):
+        """Wrap the store returned by `store_factory`."""
+        self._store_factory = store_factory
+        self._store: Optional[BaseStore] = None
+        self.recording = entries is None
+        self.entries = entries or {"keys": {}, "missing": set(), "listdir": {}}
+
+    @property
+    def store(self) -> BaseStore:
+        """Wrapped store."""
+        if self._store is None:
+            self._store = self._store_factory()
+        return self._store
+
+    def __getitem__(self, key: str) -> bytes:
+        """Get key value."""
+        if key in self.entries["keys"]:
+            return self.entries["keys"][key]
+        if key in self.entries["missing"]:
+            raise KeyError(key)
+
+        try:
+            value = self.store[key]
+        except KeyError:
+            if self.recording:
+                self.entries["missing"].add(key)
+            raise
+
+        if self.recording:
+            self.entries["keys"][key] = value
+        return value
+
+    def __contains__(self, key: object) -> bool:
+        """Check if key is in the store."""
+        if key in self.entries["keys"]:
+            return True
+        if key in self.entries["missing"]:
+            return False
+
+        exists = key in self.store
+        if self.recording and not exists:
+            self.entries["missing"].add(key)
+        return exists
+
+    def getitems(
+        self, keys: Sequence[str], *, contexts: Mapping[str, Any]
+    ) -> Mapping[str, Any]:
+        """Get multiple keys, the keys not recorded are fetched in one call."""
+        values = {k: self.entries["keys"][k] for k in keys if k in self.entries["keys"]}
+        to_fetch = [
+            k
+            for k in keys
+            if k not in self.entries["keys"] and k not in self.entries["missing"]
+        ]
+        if to_fetch:
+            fetched = self.store.getitems(to_fetch, contexts=contexts)
+            if self.recording:
+                self.entries["keys"].update(fetched)
+            values.update(fetched)
+        return values
+
+    def listdir(self, path: str = "") -> List[str]:
+        """List the content of a path."""
+        if path in self.entries["listdir"]:
+            return self.entries["listdir"][path]
+
+        content = listdir(self.store, path)
+        if self.recording:
+            self.entries["listdir"][path] = content
+        return content
+
+    def __iter__(self):
+        """Iterate over the keys of the wrapped store."""
+        return iter(self.store)
+
+    def __len__(self) -> int:
+        """Number of keys in the wrapped store."""
+        return len(self.store)
+
+    def __setitem__(self, key, value):
+        """The store is read-only."""
+        raise ReadOnlyError()
+
+    def __delitem__(self, key):
+        """The store is read-only."""
+        raise ReadOnlyError()
+
+
+class CachedFile(io.RawIOBase):
+    """
+    Read-only file serving the byte ranges read while opening a dataset from memory.
+
+    While `recording`, every block read from the wrapped file is kept in
+    `entries`. Reads outside the recorded blocks go to the wrapped file, which
+    is only opened on first use.
+    """
+
+    def __init__(
+        self,
+        file_factory: Callable[[], Any],
+        entries: Optional[Dict[str, Any]] = None,
+    ):
+        """Wrap the file returned by `file_factory`."""
+        self._file_factory = file_factory
+        self._file: Optional[Any] = None
+        self._position = 0
+        self.recording = entries is None
+        self.entries = entries or {"ranges": {}, "size": None}
+        self._offsets = sorted(self.entries["ranges"])
+
+    @property
+    def file(self) -> Any:
+        """Wrapped file."""
+        if self._file is None:
+            self._file = self._file_factory()
+        return self._file
+
+    @property
+    def size(self) -> int:
+        """File size."""
+        size = self.entries["size"]
+        if size is None:
+            size = self.entries["size"] = self.file.seek(0, io.SEEK_END)
+        return size
+
+    def readable(self) -> bool:
+        """File is readable."""
+        return True
+
+    def seekable(self) -> bool:
+        """File is seekable."""
+        return True
+
+    def tell(self) -> int:
+        """Current position."""
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        """Move to a new position."""
+        if whence == io.SEEK_SET:
+            self._position = offset
+        elif whence == io.SEEK_CUR:
+            self._position += offset
+        elif whence == io.SEEK_END:
+            self._position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        return self._position
+
+    def _read_recorded(self, start: int, size: int) -> Optional[bytes]:
+        """Return the bytes from a recorded block, if one covers the range."""
+        idx = bisect.bisect_right(self._offsets, start) - 1
+        if idx < 0:
+            return None
+        offset = self._offsets[idx]
+        block = self.entries["ranges"][offset]
+        if start + size > offset + len(block):
+            return None
+        return block[start - offset : start - offset + size]
+
+    def readinto(self, buffer) -> int:
+        """Read bytes into a pre-allocated buffer."""
+        size = len(buffer)
+        data = self._read_recorded(self._position, size)
+        if data is None:
+            self.file.seek(self._position)
+            data = self.file.read(size)
+            if self.recording and data:
+                if self._position not in self.entries["ranges"]:
+                    bisect.insort(self._offsets, self._position)
+                self.entries["ranges"][self._position] = data
+
+        buffer[: len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def close(self):
+        """Close the wrapped file."""
+        if self._file is not None:
+            self._file.close()
+        super().close()
+
+
+def dumps(engine: str, entries: Dict[str, Any]) -> bytes:
+    """Serialize recorded entries."""
+    return pickle.dumps(
+        {"version": CACHE_FORMAT_VERSION, "engine": engine, "entries": entries},
+        protocol=pickle.HIGHEST_PROTOCOL,
+    )
+
+
+def loads(data: bytes, engine: str) -> Optional[Dict[str, Any]]:
+    """Deserialize recorded entries, returns None for outdated or foreign entries."""
+    try:
+        payload = pickle.loads(data)
+    except Exception:
+        return None
+
+    if (
+        not isinstance(payload, dict)
+        or payload.get("version") != CACHE_FORMAT_VERSION
+        or payload.get("engine") != engine
+    ):
+        return None
+
+    return payload["entries"]
@@ -0,0 +1,424 @@
+"""Overviews of single resolution datasets, built on demand.
+
+An overview coarsens the selected 2D slice of a variable by a power of 2.
+Each overview is built chunk by chunk from the previous one (the dataset for
+the first one, coarsened by 2), so that building an overview only reads a
+quarter of the data of the previous level and one block is in memory at a
+time. Overviews are zarr stores persisted under `overviews_directory`, shared
+by the workers: an overview is built in a temporary store, then moved in
+place, so that a worker never reads an overview another one is writing. The
+tile requests build the missing overviews in a background thread and read
+the full resolution data until they are built.
+"""
+
+import functools
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import uuid
+import warnings
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+from typing import Any, Dict, Iterator, MutableMapping, Optional, Tuple
+
+import fsspec
+import numpy
+import xarray
+import zarr
+from fsspec.implementations.local import LocalFileSystem
+from morecantile import Tile, TileMatrixSet
+from rasterio.warp import transform_bounds
+
+from titiler.xarray.cache import dataset_version, normalize_src_path
+from titiler.xarray.reader import ZarrReader, get_variable, xarray_open_dataset
+from titiler.xarray.settings import ApiSettings
+from titiler.xarray.stats import chunk_sizes
+
+api_settings = ApiSettings()
+
+# Chunks of the overview arrays
+OVERVIEW_CHUNKS = 512
+
+# Locks of the overviews being built by this worker
+_locks: Dict[str, threading.Lock] = {}
+_locks_lock = threading.Lock()
+
+# Overviews built in the background, out of the tile requests
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="overviews")
+_builds: Dict[str, Future] = {}
+
+logger = logging.getLogger(__name__)
+
+
+def overview_factor(
+    da: xarray.DataArray,
+    tms: TileMatrixSet,
+    tile: Tile,
+    tilesize: int = 256,
+) -> int:
+    """
+    Largest power of 2 coarsening of a DataArray at least as fine as a tile.
+
+    Returns 1 when the DataArray is not finer than the tile. Overviews keep at
+    least 2 pixels along each dimension.
+    """
+    left, _, right, _ = transform_bounds(
+        tms.rasterio_crs, da.rio.crs, *tms.xy_bounds(tile), densify_pts=21
+    )
+    tile_resolution = (right - left) / tilesize * (1 + 1e-6)
+    resolution = abs(da.rio.resolution(recalc=True)[0])
+    min_size = min(da.sizes[da.rio.x_dim], da.sizes[da.rio.y_dim])
+
+    factor = 1
+    while resolution * factor * 2 <= tile_resolution and min_size // (factor * 2) >= 2:
+        factor *= 2
+    return factor
+
+
+def coarsen(
+    data: numpy.ndarray,
+    method: str = "mean",
+    nodata: Optional[float] = None,
+) -> numpy.ndarray:
+    """
+    Coarsen a 2D array by 2.
+
+    With `mean`, the result is the float mean of the valid values of each 2x2
+    block (NaN without valid values). With `nearest`, it is the top left
+    value of each block, in the dtype of the data.
+    """
+    if method == "nearest":
+        return data[::2, ::2]
+
+    values = data.astype("float64")
+    if nodata is not None and not numpy.isnan(nodata):
+        values[data == nodata] = numpy.nan
+
+    height, width = values.shape
+    padded = numpy.full((height + height % 2, width + width % 2), numpy.nan)
+    padded[:height, :width] = values
+    blocks = padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2)
+    with warnings.catch_warnings():
+        # blocks without valid values
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        mean = numpy.nanmean(blocks, axis=(1, 3))
+
+    return mean.astype("float64" if data.dtype == "float64" else "float32")
+
+
+def overview_coords(coord: xarray.DataArray) -> numpy.ndarray:
+    """
+    Pixel centers of a regular coordinate coarsened by 2.
+
+    The overview keeps the bounds of the data, with both methods.
+    """
+    values = coord.values
+    step = values[1] - values[0] if len(values) > 1 else 1
+    return values[0] + step / 2 + numpy.arange(math.ceil(len(values) / 2)) * 2 * step
+
+
+def _json_attrs(attrs: Dict[str, Any]) -> Dict[str, Any]:
+    """Attributes which can be stored in zarr metadata."""
+    attrs = {k: v for k, v in attrs.items() if k not in ("coordinates", "grid_mapping")}
+    return json.loads(
+        json.dumps(
+            attrs, default=lambda v: v.tolist() if hasattr(v, "tolist") else str(v)
+        )
+    )
+
+
+def _blocks(da: xarray.DataArray) -> Iterator[Tuple[slice, slice]]:
+    """Chunk aligned blocks of a 2D DataArray, with even sizes."""
+    y_dim, x_dim = da.rio.y_dim, da.rio.x_dim
+    sizes = chunk_sizes(da)
+    rows = sizes[y_dim] + sizes[y_dim] % 2
+    cols = sizes[x_dim] + sizes[x_dim] % 2
+    for row in range(0, da.sizes[y_dim], rows):
+        for col in range(0, da.sizes[x_dim], cols):
+            yield slice(row, row + rows), slice(col, col + cols)
+
+
+def build_overview(
+    da: xarray.DataArray,
+    store: MutableMapping,
+    variable: str,
+    method: str = "mean",
+) -> None:
+    """
+    Write the overview of a 2D DataArray coarsened by 2 to a zarr store.
+
+    The DataArray is read block by block, each block covering whole chunks.
+    The metadata is consolidated last, so that a store with consolidated
+    metadata is a complete overview.
+    """
+    y_dim, x_dim = da.rio.y_dim, da.rio.x_dim
+    nodata = da.rio.nodata
+    if method == "nearest":
+        dtype, fill_value = da.dtype, nodata
+    else:
+        dtype = numpy.dtype("float64" if da.dtype == "float64" else "float32")
+        fill_value = numpy.nan
+
+    coords = xarray.Dataset(
+        coords={
+            "y": overview_coords(da[y_dim]),
+            "x": overview_coords(da[x_dim]),
+        }
+    ).rio.write_crs(da.rio.crs)
+    coords.to_zarr(store, mode="w", consolidated=False)
+
+    group = zarr.open_group(store, mode="r+")
+    array = group.create(
+        variable,
+        shape=(coords.sizes["y"], coords.sizes["x"]),
+        chunks=(OVERVIEW_CHUNKS, OVERVIEW_CHUNKS),
+        dtype=dtype,
+        fill_value=fill_value,
+    )
+    array.attrs.update(
+        {
+            **_json_attrs(da.attrs),
+            "_ARRAY_DIMENSIONS": ["y", "x"],
+            "grid_mapping": "spatial_ref",
+        }
+    )
+
+    for rows, cols in _blocks(da):
+        block = coarsen(
+            da.isel({y_dim: rows, x_dim: cols}).values, method=method, nodata=nodata
+        )
+        row, col = rows.start // 2, cols.start // 2
+        array[row : row + block.shape[0], col : col + block.shape[1]] = block
+
+    zarr.consolidate_metadata(store)
+
+
+def overview_url(
+    ds: xarray.Dataset,
+    da: xarray.DataArray,
+    src_path: str,
+    variable: str,
+    factor: int,
+    method: str = "mean",
+) -> str:
+    """
+    Location of an overview.
+
+    The overviews of a variable slice (time and dropped dimensions) are
+    grouped in a directory named after a hash of the dataset path and
+    version, the variable, the slice and the method.
+    """
+    selection = {
+        name: str(coord.values)
+        for name, coord in da.coords.items()
+        if coord.ndim == 0 and name != "spatial_ref"
+    }
+    key = json.dumps(
+        [
+            normalize_src_path(src_path),
+            dataset_version(ds),
+            variable,
+            selection,
+            method,
+        ],
+        sort_keys=True,
+    )
+    name = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return f"{api_settings.overviews_directory.rstrip('/')}/{name}/{factor}.zarr"
+
+
+def overview_exists(url: str) -> bool:
+    """Whether an overview was completely built."""
+    fs, path = fsspec.core.url_to_fs(url)
+    return fs.exists(f"{path}/.zmetadata")
+
+
+def publish_overview(tmp_url: str, url: str) -> None:
+    """
+    Move an overview built at `tmp_url` to `url`, unless another worker did.
+
+    Local directories are renamed at once. On object storage the keys are
+    copied with the consolidated metadata last, so that the overview only
+    exists once complete.
+    """
+    fs, tmp_path = fsspec.core.url_to_fs(tmp_url)
+    _, path = fsspec.core.url_to_fs(url)
+    try:
+        if isinstance(fs, LocalFileSystem):
+            fs.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                os.rename(tmp_path, path)
+            except OSError:
+                # published by another worker
+                pass
+
+        elif not overview_exists(url):
+            src, dst = fs.get_mapper(tmp_path), fs.get_mapper(path)
+            for key in src:
+                if key != ".zmetadata":
+                    dst[key] = src[key]
+            dst[".zmetadata"] = src[".zmetadata"]
+
+    finally:
+        if fs.exists(tmp_path):
+            fs.rm(tmp_path, recursive=True)
+
+
+def _lock(url: str) -> threading.Lock:
+    """Lock of an overview, so that a worker builds it once."""
+    with _locks_lock:
+        return _locks.setdefault(url, threading.Lock())
+
+
+def build_overviews(
+    ds: xarray.Dataset,
+    da: xarray.DataArray,
+    src_path: str,
+    variable: str,
+    factor: int,
+) -> str:
+    """
+    Location of the overview of a variable slice coarsened by `factor`.
+
+    The missing overviews, from the finest to the requested one, are built.
+    """
+    method = api_settings.overviews_method
+    level = 1
+    source = da
+    while level < factor:
+        level *= 2
+        url = overview_url(ds, da, src_path, variable, level, method)
+        with _lock(url):
+            if not overview_exists(url):
+                tmp_url = f"{url}.{uuid.uuid4().hex}.tmp"
+                build_overview(
+                    source, fsspec.get_mapper(tmp_url), variable, method=method
+                )
+                publish_overview(tmp_url, url)
+
+        if level < factor:
+            source = get_variable(xarray_open_dataset(url), variable)
+
+    return url
+
+
+def get_overview(src_dst: ZarrReader, factor: int) -> str:
+    """Location of the overview of a reader's variable coarsened by `factor`."""
+    return build_overviews(
+        src_dst.ds, src_dst.input, src_dst.src_path, src_dst.variable, factor
+    )
+
+
+def _build_done(url: str, future: Future) -> None:
+    with _locks_lock:
+        _builds.pop(url, None)
+
+    if future.exception() is not None:
+        logger.warning("Overview build failed: %r", future.exception())
+
+
+def build_in_background(src_dst: ZarrReader, factor: int) -> Future:
+    """
+    Build the overview of a reader's variable coarsened by `factor` in a
+    background thread, once per worker.
+
+    The dataset and variable slice are kept by the build, not the reader.
+    """
+    url = overview_url(
+        src_dst.ds,
+        src_dst.input,
+        src_dst.src_path,
+        src_dst.variable,
+        factor,
+        api_settings.overviews_method,
+    )
+    with _locks_lock:
+        if url in _builds:
+            return _builds[url]
+
+        future = _executor.submit(
+            build_overviews,
+            src_dst.ds,
+            src_dst.input,
+            src_dst.src_path,
+            src_dst.variable,
+            factor,
+        )
+        _builds[url] = future
+
+    future.add_done_callback(functools.partial(_build_done, url))
+    return future
+
+
+def wait_builds(timeout: Optional[float] = None) -> None:
+    """Wait for the overviews being built in the background."""
+    with _locks_lock:
+        futures = list(_builds.values())
+    wait_futures(futures, timeout=timeout)
+
+
+def tile_overview(
+    src_dst: ZarrReader, tile: Tile, tilesize: int = 256, wait: bool = False
+) -> Optional[str]:
+    """
+    Location of the overview to read a tile from.
+
+    Returns None when the variable slice is not finer than the tile or, unless
+    `wait`, when the overview is not built yet: it is then built in the
+    background and the tile is read from the full resolution data meanwhile.
+    """
+    if src_dst.input.ndim != 2:
+        return None
+
+    factor = overview_factor(src_dst.input, src_dst.tms, tile, tilesize=tilesize)
+    if factor == 1:
+        return None
+
+    if wait:
+        return get_overview(src_dst, factor)
+
+    url = overview_url(
+        src_dst.ds,
+        src_dst.input,
+        src_dst.src_path,
+        src_dst.variable,
+        factor,
+        api_settings.overviews_method,
+    )
+    if overview_exists(url):
+        return url
+
+    build_in_background(src_dst, factor)
+    return None
+
+
+def approx_overview(src_dst: ZarrReader, size: int) -> Optional[str]:
+    """
+    Location of the coarsest overview already built with at least `size` elements.
+
+    Returns None when there is no such overview.
+    """
+    if src_dst.input.ndim != 2:
+        return None
+
+    method = api_settings.overviews_method
+    url = None
+    factor = 2
+    while src_dst.input.size // (factor * factor) >= size:
+        candidate = overview_url(
+            src_dst.ds,
+            src_dst.input,
+            src_dst.src_path,
+            src_dst.variable,
+            factor,
+            method,
+        )
+        if not overview_exists(candidate):
+            break
+        url = candidate
+        factor *= 2
+
+    return url
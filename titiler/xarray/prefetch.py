@@ -0,0 +1,135 @@
+"""Background prefetch of the tiles likely to be requested next.
+
+After a tile is served, the chunks of its neighbours and of its children at
+the next zoom are fetched into the chunk cache, so that panning and zooming
+start warm. Prefetching is best effort: jobs are deduplicated, the queue and
+the concurrency are bounded and all the jobs are cancelled when too many
+tile requests are in flight.
+"""
+
+import asyncio
+import contextlib
+import logging
+from typing import Awaitable, Callable, Dict, Hashable, Iterator, List, Optional
+
+from morecantile import Tile, TileMatrixSet
+
+from titiler.xarray.settings import ApiSettings
+
+api_settings = ApiSettings()
+
+logger = logging.getLogger(__name__)
+
+
+def prefetch_tiles(tms: TileMatrixSet, tile: Tile) -> List[Tile]:
+    """Neighbours of a tile and its children at the next zoom, if any."""
+    tiles = list(tms.neighbors(tile))
+    if tile.z < tms.maxzoom:
+        tiles.extend(tms.children(tile))
+    return tiles
+
+
+class TilePrefetcher:
+    """
+    Per-worker queue of prefetch jobs, run on the event loop.
+
+    `submit` drops the jobs already queued (by key) and the jobs over
+    `max_queue`, at most `max_concurrency` jobs run at a time. When more than
+    `max_load` requests are in flight (see `request`), the queued jobs are
+    cancelled and no job is accepted.
+    """
+
+    def __init__(self, max_queue: int, max_concurrency: int, max_load: int):
+        """Create a tile prefetcher."""
+        self.max_queue = max_queue
+        self.max_concurrency = max_concurrency
+        self.max_load = max_load
+        self.load = 0
+        self.tasks: Dict[Hashable, asyncio.Task] = {}
+        self.completed = 0
+        self.dropped = 0
+        self.cancelled = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def overloaded(self) -> bool:
+        """Whether too many requests are in flight to prefetch."""
+        return self.load > self.max_load
+
+    @contextlib.contextmanager
+    def request(self) -> Iterator[None]:
+        """Count a request in flight, cancelling the prefetch jobs under load."""
+        self.load += 1
+        if self.overloaded:
+            self.cancel()
+        try:
+            yield
+        finally:
+            self.load -= 1
+
+    def submit(self, key: Hashable, job: Callable[[], Awaitable[None]]) -> bool:
+        """Queue a prefetch job, unless already queued. Returns whether it was queued."""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # semaphores are bound to the loop they are first used in (python < 3.10)
+            self._loop = loop
+            self._semaphore = None
+            self.tasks.clear()
+
+        if key in self.tasks:
+            return False
+
+        if self.overloaded or len(self.tasks) >= self.max_queue:
+            self.dropped += 1
+            return False
+
+        task = loop.create_task(self._run(job))
+        self.tasks[key] = task
+        task.add_done_callback(lambda _: self._done(key, task))
+        return True
+
+    async def _run(self, job: Callable[[], Awaitable[None]]) -> None:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async with self._semaphore:
+            await job()
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self.tasks.get(key) is task:
+            del self.tasks[key]
+
+        if task.cancelled():
+            self.cancelled += 1
+        elif task.exception() is not None:
+            logger.debug("Tile prefetch failed: %r", task.exception())
+        else:
+            self.completed += 1
+
+    def cancel(self) -> None:
+        """Cancel the queued and running jobs."""
+        for task in list(self.tasks.values()):
+            task.cancel()
+
+    def stats(self) -> Dict[str, int]:
+        """Jobs queued, completed, dropped and cancelled."""
+        return {
+            "queued": len(self.tasks),
+            "completed": self.completed,
+            "dropped": self.dropped,
+            "cancelled": self.cancelled,
+            "load": self.load,
+        }
+
+
+def get_prefetcher() -> Optional[TilePrefetcher]:
+    """Tile prefetcher from the settings, None when disabled."""
+    if not api_settings.enable_prefetch:
+        return None
+
+    return TilePrefetcher(
+        max_queue=api_settings.prefetch_max_queue,
+        max_concurrency=api_settings.prefetch_max_concurrency,
+        max_load=api_settings.prefetch_max_load,
+    )
@@ -0,0 +1,369 @@
+"""Build multiscale zarr pyramids aligned to a TileMatrixSet.
+
+The levels of the pyramid are the zooms of the TileMatrixSet: a level covers
+the tiles intersecting the dataset and each of its chunks is one tile (and
+`time_chunk` time steps), so that serving a tile with `multiscale=true` reads
+a single chunk. The finest level is read from the dataset, each coarser level
+from the previous one. Tiles are rendered in a process pool, each worker
+holding one tile (times `time_chunk` time steps) at a time.
+
+Usage: `titiler-xarray-pyramid SRC_PATH OUTPUT --variable NAME`
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import fsspec
+import morecantile
+import numpy
+import xarray
+import zarr
+from morecantile import Tile, TileMatrixSet
+from rio_tiler.types import WarpResampling
+
+from titiler.xarray import reader
+
+Task = Tuple[Dict[str, Any], Sequence[Tile], Optional[slice]]
+
+
+def level_tiles(
+    tms: TileMatrixSet,
+    bounds: Tuple[float, float, float, float],
+    zoom: int,
+) -> Tuple[int, int, int, int]:
+    """Range (minx, miny, maxx, maxy) of the tiles of a zoom intersecting geographic bounds."""
+    tiles = list(tms.tiles(*bounds, zooms=[zoom]))
+    xs, ys = [tile.x for tile in tiles], [tile.y for tile in tiles]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def level_coords(
+    tms: TileMatrixSet,
+    tile_range: Tuple[int, int, int, int],
+    zoom: int,
+    tilesize: int,
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Pixel centers (x, y) of the tiles of a level, in the TileMatrixSet CRS."""
+    minx, miny, maxx, maxy = tile_range
+    left, _, right, top = tms.xy_bounds(Tile(minx, miny, zoom))
+    resolution = (right - left) / tilesize
+    width = (maxx - minx + 1) * tilesize
+    height = (maxy - miny + 1) * tilesize
+    x = left + (numpy.arange(width) + 0.5) * resolution
+    y = top - (numpy.arange(height) + 0.5) * resolution
+    return x, y
+
+
+def create_level(
+    store: zarr.storage.BaseStore,
+    group: str,
+    variable: str,
+    coords: Dict[str, numpy.ndarray],
+    crs: Any,
+    dtype: str,
+    chunks: Tuple[int, ...],
+    attrs: Dict[str, Any],
+) -> None:
+    """Create the coordinates and the (empty) variable array of a level."""
+    ds = xarray.Dataset(coords=coords).rio.write_crs(crs)
+    ds.to_zarr(store, group=group, mode="w", consolidated=False)
+
+    level = zarr.open_group(store, path=group, mode="r+")
+    array = level.create(
+        variable,
+        shape=tuple(len(values) for values in coords.values()),
+        chunks=chunks,
+        dtype=dtype,
+        fill_value=numpy.nan,
+    )
+    array.attrs.update(
+        {
+            **attrs,
+            "_ARRAY_DIMENSIONS": list(coords),
+            "grid_mapping": "spatial_ref",
+        }
+    )
+
+
+def _init_worker() -> None:
+    """Read the datasets without the shared cache (there may be no redis)."""
+    reader.api_settings.enable_cache = False
+
+
+def build_tiles(task: Task) -> int:
+    """
+    Render tiles of a level and write them to their chunks.
+
+    `task` holds the arguments of the level (see `build_level`), the tiles
+    and the time steps to render. Returns the number of tiles written.
+    """
+    level, tiles, times = task
+    array = zarr.open_array(
+        fsspec.get_mapper(level["output"]),
+        path=f"{level['group']}/{level['variable']}",
+        mode="r+",
+    )
+    tilesize = level["tilesize"]
+    minx, miny = level["origin"]
+
+    count = 0
+    with reader.ZarrReader(
+        level["src_path"], variable=level["variable"], **level["reader_options"]
+    ) as src_dst:
+        for tile in tiles:
+            if not src_dst.tile_exists(*tile):
+                continue
+
+            if times is not None:
+                images = src_dst.tile_stack(
+                    *tile,
+                    numpy.arange(times.start, times.stop),
+                    tilesize=tilesize,
+                    resampling_method=level["resampling"],
+                )
+            else:
+                images = [
+                    src_dst.tile(
+                        *tile,
+                        tilesize=tilesize,
+                        resampling_method=level["resampling"],
+                    )
+                ]
+
+            data = numpy.stack(
+                [
+                    image.array[0].astype(array.dtype).filled(numpy.nan)
+                    for image in images
+                ]
+            )
+            row, col = (tile.y - miny) * tilesize, (tile.x - minx) * tilesize
+            window = (slice(row, row + tilesize), slice(col, col + tilesize))
+            if times is not None:
+                array[(times, *window)] = data
+            else:
+                array[window] = data[0]
+            count += 1
+
+    return count
+
+
+def build_level(
+    executor: Optional[ProcessPoolExecutor],
+    level: Dict[str, Any],
+    tiles: List[Tile],
+    time_size: Optional[int],
+    time_chunk: int,
+) -> int:
+    """Render the tiles of a level, in the process pool when there is one."""
+    time_slices: List[Optional[slice]] = [None]
+    if time_size is not None:
+        time_slices = [
+            slice(start, min(start + time_chunk, time_size))
+            for start in range(0, time_size, time_chunk)
+        ]
+
+    tasks: Iterator[Task] = (
+        (level, [tile], times) for tile in tiles for times in time_slices
+    )
+    if executor is None:
+        return sum(map(build_tiles, tasks))
+
+    return sum(executor.map(build_tiles, tasks, chunksize=4))
+
+
+def build_pyramid(
+    src_path: str,
+    output: str,
+    variable: str,
+    tms: TileMatrixSet = morecantile.tms.get("WebMercatorQuad"),
+    minzoom: Optional[int] = None,
+    maxzoom: Optional[int] = None,
+    tilesize: int = 256,
+    resampling: WarpResampling = "nearest",
+    overview_resampling: WarpResampling = "average",
+    time_chunk: int = 1,
+    workers: int = 1,
+    reader_options: Optional[Dict[str, Any]] = None,
+    log: Any = None,
+) -> List[int]:
+    """
+    Write the multiscale pyramid of a variable, from `maxzoom` to `minzoom`.
+
+    The zooms default to 0 and to the zoom matching the dataset resolution.
+    The levels are the groups named after their zoom, listed in the
+    `multiscales` attribute of the root group. Returns the zooms.
+    """
+    reader_options = reader_options or {}
+    with reader.ZarrReader(
+        src_path, variable=variable, tms=tms, **reader_options
+    ) as src_dst:
+        bounds = src_dst.geographic_bounds
+        minzoom = 0 if minzoom is None else minzoom
+        maxzoom = src_dst.maxzoom if maxzoom is None else maxzoom
+        series = src_dst.time_series()
+        times = series["time"].values if "time" in series.dims else None
+        dtype = "float64" if series.dtype == "float64" else "float32"
+        attrs = {
+            k: v.tolist() if hasattr(v, "tolist") else v
+            for k, v in series.attrs.items()
+            if k not in ("coordinates", "grid_mapping")
+        }
+
+    store = fsspec.get_mapper(output)
+    root = zarr.open_group(store, mode="w")
+    zooms = list(range(maxzoom, minzoom - 1, -1))
+
+    executor = (
+        ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+        if workers > 1
+        else None
+    )
+    try:
+        for zoom in zooms:
+            start = time.time()
+            tile_range = level_tiles(tms, bounds, zoom)
+            x, y = level_coords(tms, tile_range, zoom, tilesize)
+            coords: Dict[str, numpy.ndarray] = {"y": y, "x": x}
+            chunks: Tuple[int, ...] = (tilesize, tilesize)
+            if times is not None:
+                coords = {"time": times, **coords}
+                chunks = (time_chunk, *chunks)
+
+            create_level(
+                store,
+                str(zoom),
+                variable,
+                coords,
+                tms.rasterio_crs,
+                dtype,
+                chunks,
+                attrs,
+            )
+
+            level = {
+                "output": output,
+                "group": str(zoom),
+                "variable": variable,
+                "tilesize": tilesize,
+                "origin": tile_range[:2],
+                "resampling": resampling,
+                "src_path": src_path,
+                "reader_options": {**reader_options, "tms": tms},
+            }
+            if zoom != maxzoom:
+                # Coarser levels are read from the previous level
+                level.update(
+                    resampling=overview_resampling,
+                    src_path=output,
+                    reader_options={
+                        "group": str(zoom + 1),
+                        "consolidated": False,
+                        "tms": tms,
+                    },
+                )
+
+            minx, miny, maxx, maxy = tile_range
+            tiles = [
+                Tile(tx, ty, zoom)
+                for ty in range(miny, maxy + 1)
+                for tx in range(minx, maxx + 1)
+            ]
+            count = build_level(
+                executor,
+                level,
+                tiles,
+                None if times is None else len(times),
+                time_chunk,
+            )
+            if log:
+                elapsed = time.time() - start
+                log(
+                    f"zoom {zoom}: {count} chunks in {elapsed:.1f}s "
+                    f"({count / max(elapsed, 1e-6):.1f} chunks/s)"
+                )
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    root.attrs["multiscales"] = [
+        {
+            "datasets": [{"path": str(zoom), "level": zoom} for zoom in zooms[::-1]],
+            "type": resampling,
+            "metadata": {"tile_matrix_set": tms.id, "tilesize": tilesize},
+        }
+    ]
+    zarr.consolidate_metadata(store)
+    return zooms
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    """Command line interface of the pyramid builder."""
+    parser = argparse.ArgumentParser(
+        prog="titiler-xarray-pyramid",
+        description="Build a multiscale zarr pyramid, to serve with `multiscale=true`.",
+    )
+    parser.add_argument("src_path", help="Dataset (zarr, NetCDF or kerchunk reference)")
+    parser.add_argument("output", help="Output zarr store (local path or URL)")
+    parser.add_argument("--variable", required=True, help="Variable to write")
+    parser.add_argument(
+        "--tms", default="WebMercatorQuad", help="TileMatrixSet identifier"
+    )
+    parser.add_argument("--minzoom", type=int, help="Coarsest zoom (default: 0)")
+    parser.add_argument(
+        "--maxzoom", type=int, help="Finest zoom (default: dataset resolution)"
+    )
+    parser.add_argument("--tilesize", type=int, default=256, choices=[256, 512])
+    parser.add_argument(
+        "--resampling", default="nearest", help="Resampling of the finest level"
+    )
+    parser.add_argument(
+        "--overview-resampling",
+        default="average",
+        help="Resampling of the coarser levels",
+    )
+    parser.add_argument(
+        "--time-chunk", type=int, default=1, help="Time steps per chunk"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1, help="Worker processes"
+    )
+    parser.add_argument("--drop-dim", help="Dimension to drop, as `dim=value`")
+    parser.add_argument(
+        "--reference", action="store_true", help="Dataset is a kerchunk reference"
+    )
+    parser.add_argument(
+        "--no-consolidated",
+        action="store_true",
+        help="Dataset has no consolidated metadata",
+    )
+    options = parser.parse_args(args)
+
+    _init_worker()
+    zooms = build_pyramid(
+        options.src_path,
+        options.output,
+        options.variable,
+        tms=morecantile.tms.get(options.tms),
+        minzoom=options.minzoom,
+        maxzoom=options.maxzoom,
+        tilesize=options.tilesize,
+        resampling=options.resampling,
+        overview_resampling=options.overview_resampling,
+        time_chunk=options.time_chunk,
+        workers=options.workers,
+        reader_options={
+            "drop_dim": options.drop_dim,
+            "reference": options.reference,
+            "consolidated": not options.no_consolidated,
+        },
+        log=lambda message: print(message, file=sys.stderr),
+    )
+    print(f"{options.output}: zooms {zooms[-1]} to {zooms[0]}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
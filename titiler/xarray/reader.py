@@ -1,27 +1,68 @@
 """ZarrReader."""
 
 import contextlib
-import pickle
+import itertools
+import json
+import math
 import re
-from typing import Any, Dict, List, Optional
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple, Union
 
 import attr
 import fsspec
 import numpy
 import s3fs
 import xarray
-from morecantile import TileMatrixSet
+from morecantile import Tile, TileMatrixSet
 from rasterio.crs import CRS
+from rasterio.enums import Resampling
+from rasterio.transform import from_bounds
+from rasterio.warp import transform as transform_coords
+from rasterio.warp import transform_bounds
 from rio_tiler.constants import WEB_MERCATOR_TMS, WGS84_CRS
+from rio_tiler.errors import PointOutsideBounds, TileOutsideBounds
 from rio_tiler.io.xarray import XarrayReader
-from rio_tiler.types import BBox
+from rio_tiler.models import ImageData
+from rio_tiler.types import BBox, NoData, WarpResampling
+from rioxarray.exceptions import NoDataInBounds, OneDimensionalRaster
+from starlette.concurrency import run_in_threadpool
+from xarray.backends.zarr import ZarrArrayWrapper
+from xarray.core.indexing import (
+    ExplicitIndexer,
+    ExplicitlyIndexed,
+    ExplicitlyIndexedNDArrayMixin,
+    LazilyIndexedArray,
+    OuterIndexer,
+    VectorizedIndexer,
+)
+from zarr.errors import GroupNotFoundError
+from zarr.indexing import OrthogonalIndexer
+from zarr.storage import normalize_store_arg
 
+from titiler.xarray import metadata, regrid, stats
+from titiler.xarray.cache import (
+    ChunkCacheStore,
+    cache_key,
+    cache_key_prefix,
+    chunk_cache,
+    dataset_cache,
+    dataset_cache_key,
+    dataset_version,
+)
 from titiler.xarray.redis_pool import get_redis
 from titiler.xarray.settings import ApiSettings
+from titiler.xarray.time_index import TimeIndex
 
 api_settings = ApiSettings()
 cache_client = get_redis()
 
+# Dataset encoding key holding the longitude remapping of the variables
+LON_WRAP_ENCODING = "titiler_xarray_lon_wrap"
+# Dataset encoding key holding the index of the time coordinate
+TIME_INDEX_ENCODING = "titiler_xarray_time_index"
+# Root dataset encoding key holding the multiscale levels of the variables
+MULTISCALE_ENCODING = "titiler_xarray_multiscale_levels"
+
 
 def parse_protocol(src_path: str, reference: Optional[bool] = False):
     """
@@ -80,24 +121,57 @@ def get_filesystem(
         raise ValueError(f"Unsupported protocol: {protocol}")
 
 
-def xarray_open_dataset(
+def get_store(src_path: str, protocol: str, xr_engine: str):
+    """
+    Get the filesystem for the given source path, zarr chunks are read through
+    the chunk cache.
+    """
+    file_handler = get_filesystem(src_path, protocol, xr_engine)
+    if xr_engine == "zarr" and api_settings.enable_chunk_cache:
+        return ChunkCacheStore(
+            normalize_store_arg(file_handler),
+            prefix=f"{cache_key_prefix(src_path=src_path)}chunk:",
+            cache=chunk_cache,
+        )
+
+    return file_handler
+
+
+def get_cached_filesystem(
+    src_path: str,
+    protocol: str,
+    xr_engine: str,
+    entries: Optional[Dict[str, Any]] = None,
+) -> Union[metadata.CachedStore, metadata.CachedFile]:
+    """
+    Get the filesystem for the given source path, wrapped to record (or replay)
+    the metadata read when opening the dataset.
+    """
+    if xr_engine == "h5netcdf":
+        return metadata.CachedFile(
+            lambda: get_store(src_path, protocol, xr_engine),
+            entries=entries,
+        )
+
+    return metadata.CachedStore(
+        lambda: normalize_store_arg(get_store(src_path, protocol, xr_engine)),
+        entries=entries,
+    )
+
+
+def open_dataset(
     src_path: str,
     group: Optional[Any] = None,
     reference: Optional[bool] = False,
     decode_times: Optional[bool] = True,
     consolidated: Optional[bool] = True,
+    file_handler: Optional[Any] = None,
 ) -> xarray.Dataset:
-    """Open dataset."""
-    # Generate cache key and attempt to fetch the dataset from cache
-    if api_settings.enable_cache:
-        cache_key = f"{src_path}_{group}" if group is not None else src_path
-        data_bytes = cache_client.get(cache_key)
-        if data_bytes:
-            return pickle.loads(data_bytes)
-
-    protocol = parse_protocol(src_path, reference=reference)
+    """Open dataset with xarray, without caching."""
     xr_engine = xarray_engine(src_path)
-    file_handler = get_filesystem(src_path, protocol, xr_engine)
+    if file_handler is None:
+        protocol = parse_protocol(src_path, reference=reference)
+        file_handler = get_store(src_path, protocol, xr_engine)
 
     # Arguments for xarray.open_dataset
     # Default args
@@ -107,8 +181,8 @@ def xarray_open_dataset(
     }
 
     # Argument if we're opening a datatree
-    if type(group) == int:
-        xr_open_args["group"] = group
+    if group is not None:
+        xr_open_args["group"] = str(group)
 
     # NetCDF arguments
     if xr_engine == "h5netcdf":
@@ -122,11 +196,62 @@ def xarray_open_dataset(
     if reference:
         xr_open_args["consolidated"] = False
         xr_open_args["backend_kwargs"] = {"consolidated": False}
-    ds = xarray.open_dataset(file_handler, **xr_open_args)
+    return xarray.open_dataset(file_handler, **xr_open_args)
+
+
+def xarray_open_dataset(
+    src_path: str,
+    group: Optional[Any] = None,
+    reference: Optional[bool] = False,
+    decode_times: Optional[bool] = True,
+    consolidated: Optional[bool] = True,
+) -> xarray.Dataset:
+    """Open dataset."""
+    # First look in the worker's dataset cache, then in the shared redis cache
+    cache_key = dataset_cache_key(
+        src_path,
+        group=group,
+        reference=reference,
+        decode_times=decode_times,
+        consolidated=consolidated,
+    )
+    if api_settings.enable_dataset_cache:
+        ds = dataset_cache.get_dataset(cache_key)
+        if ds is not None:
+            return ds
+
+    file_handler = None
     if api_settings.enable_cache:
-        # Serialize the dataset to bytes using pickle
-        data_bytes = pickle.dumps(ds)
-        cache_client.set(cache_key, data_bytes)
+        # The redis cache holds the metadata bytes needed to rebuild the dataset
+        xr_engine = xarray_engine(src_path)
+        data_bytes = cache_client.get(cache_key)
+        entries = metadata.loads(data_bytes, xr_engine) if data_bytes else None
+        file_handler = get_cached_filesystem(
+            src_path,
+            parse_protocol(src_path, reference=reference),
+            xr_engine,
+            entries=entries,
+        )
+
+    ds = open_dataset(
+        src_path,
+        group=group,
+        reference=reference,
+        decode_times=decode_times,
+        consolidated=consolidated,
+        file_handler=file_handler,
+    )
+    if file_handler is not None and file_handler.recording:
+        # Stop recording once the dataset is opened, data reads are not cached
+        file_handler.recording = False
+        cache_client.set(
+            cache_key,
+            metadata.dumps(xr_engine, file_handler.entries),
+            ex=api_settings.cache_ttl or None,
+        )
+
+    if api_settings.enable_dataset_cache:
+        dataset_cache.set_dataset(cache_key, ds)
     return ds
 
 
@@ -145,53 +270,398 @@ def arrange_coordinates(da: xarray.DataArray) -> xarray.DataArray:
         if "longitude" in da.dims:
             longitude_var_name = "longitude"
         da = da.rename({latitude_var_name: "y", longitude_var_name: "x"})
+    # Other dimensions (e.g. a `drop_dim` one) are kept between time and y
     if "time" in da.dims:
-        da = da.transpose("time", "y", "x")
+        da = da.transpose("time", ..., "y", "x")
     else:
-        da = da.transpose("y", "x")
+        da = da.transpose(..., "y", "x")
     return da
 
 
+class LonWrapArray(ExplicitlyIndexedNDArrayMixin):
+    """
+    Lazy array with its x axis rolled by `split`: the columns `split:` of the
+    source array, then the columns `:split`.
+
+    A contiguous range of columns is read as at most two contiguous ranges of
+    the source, instead of an integer array gather.
+    """
+
+    __slots__ = ("array", "axis", "split")
+
+    def __init__(self, array: Any, axis: int, split: int):
+        """Wrap a lazily indexed array."""
+        self.array = array
+        self.axis = axis
+        self.split = split
+
+    def source_keys(self, key: ExplicitIndexer) -> List[ExplicitIndexer]:
+        """Keys of the source array read for `key`, in order along x."""
+        n = self.shape[self.axis]
+        x_key = key.tuple[self.axis]
+        if isinstance(x_key, slice) and x_key.indices(n)[2] == 1:
+            start, stop, _ = x_key.indices(n)
+            if stop <= start:
+                ranges = [slice(0, 0)]
+            elif stop <= n - self.split:
+                ranges = [slice(start + self.split, stop + self.split)]
+            elif start >= n - self.split:
+                ranges = [slice(start - n + self.split, stop - n + self.split)]
+            else:
+                ranges = [slice(start + self.split, n), slice(0, stop - n + self.split)]
+            return [self._with_x(key, x) for x in ranges]
+
+        if isinstance(x_key, (int, numpy.integer)):
+            return [self._with_x(key, (int(x_key) + self.split) % n)]
+
+        if isinstance(x_key, slice):
+            x_key = numpy.arange(n)[x_key]
+        indexer = type(key) if isinstance(key, VectorizedIndexer) else OuterIndexer
+        return [
+            self._with_x(
+                indexer(key.tuple), (numpy.asarray(x_key) + self.split) % n, indexer
+            )
+        ]
+
+    def _with_x(self, key: ExplicitIndexer, x: Any, indexer: Any = None) -> Any:
+        values = list(key.tuple)
+        values[self.axis] = x
+        return (indexer or type(key))(tuple(values))
+
+    def __getitem__(self, key: ExplicitIndexer) -> numpy.ndarray:
+        """Read the columns of `key`."""
+        arrays = []
+        for source_key in self.source_keys(key):
+            array = self.array[source_key]
+            if isinstance(array, ExplicitlyIndexed):
+                array = array.get_duck_array()
+            arrays.append(array)
+
+        if len(arrays) == 1:
+            return arrays[0]
+
+        # scalar keys before x drop their axes
+        axis = self.axis - sum(
+            not isinstance(k, (slice, numpy.ndarray)) for k in key.tuple[: self.axis]
+        )
+        return numpy.concatenate(arrays, axis=axis)
+
+
+def get_lon_wrap(
+    ds: xarray.Dataset,
+    variable: str,
+    da: xarray.DataArray,
+) -> Optional[Tuple[Union[int, numpy.ndarray], numpy.ndarray]]:
+    """
+    Get the remapping of 0-360 longitudes to the -180 to 180 range.
+
+    The remapping and the new longitudes are computed once and kept in the
+    dataset encoding, so they are shared by all the requests using the same
+    dataset handle. For longitudes sorted once wrapped around (e.g. regular
+    grids), the remapping is the column where the source is split, so that it
+    is read as two contiguous ranges (see `LonWrapArray`); for other grids, it
+    is the index sorting the wrapped longitudes.
+    """
+    lon_wraps = ds.encoding.setdefault(LON_WRAP_ENCODING, {})
+    if variable not in lon_wraps:
+        x = da.x.values
+        lon_wrap: Optional[Tuple[Union[int, numpy.ndarray], numpy.ndarray]] = None
+        if (x > 180).any():
+            wrapped = (x + 180) % 360 - 180
+            index = numpy.argsort(wrapped, kind="stable")
+            split = int(index[0])
+            if numpy.array_equal(index, numpy.roll(numpy.arange(x.size), -split)):
+                lon_wrap = (split, wrapped[index])
+            else:
+                lon_wrap = (index, wrapped[index])
+        lon_wraps[variable] = lon_wrap
+
+    return lon_wraps[variable]
+
+
+def wrap_lon(da: xarray.DataArray, split: int) -> xarray.DataArray:
+    """Roll the x axis of a lazy DataArray by `split` columns (see `LonWrapArray`)."""
+    if split == 0:
+        return da
+
+    data = da.variable._data
+    if not isinstance(data, ExplicitlyIndexed):
+        # in memory data
+        return da.roll(x=-split)
+
+    array = LonWrapArray(data, da.dims.index("x"), split)
+    return da.copy(data=LazilyIndexedArray(array))
+
+
+def get_time_index(ds: xarray.Dataset, da: xarray.DataArray) -> Optional[TimeIndex]:
+    """
+    Get the sorted index of the time coordinate.
+
+    Like the longitude remapping, the index is built once and kept in the
+    dataset encoding, so it is shared by the requests using the same dataset.
+    """
+    if TIME_INDEX_ENCODING not in ds.encoding:
+        ds.encoding[TIME_INDEX_ENCODING] = TimeIndex.from_coord(da["time"])
+    return ds.encoding[TIME_INDEX_ENCODING]
+
+
 def get_variable(
     ds: xarray.Dataset,
     variable: str,
     datetime: Optional[str] = None,
     drop_dim: Optional[str] = None,
+    time_series: bool = False,
 ) -> xarray.DataArray:
-    """Get Xarray variable as DataArray."""
+    """
+    Get Xarray variable as DataArray.
+
+    The time dimension is reduced to the time nearest `datetime` or, unless
+    `time_series` is set, to the first time.
+    """
     da = ds[variable]
     da = arrange_coordinates(da)
-    # TODO: add test
     if drop_dim:
         dim_to_drop, dim_val = drop_dim.split("=")
-        da = da.sel({dim_to_drop: dim_val}).drop(dim_to_drop)
+        da = da.sel({dim_to_drop: dim_val}).drop_vars(dim_to_drop)
     da = arrange_coordinates(da)
 
     # Make sure we have a valid CRS
     crs = da.rio.crs or "epsg:4326"
     da.rio.write_crs(crs, inplace=True)
 
-    if crs == "epsg:4326" and (da.x > 180).any():
-        # Adjust the longitude coordinates to the -180 to 180 range
-        da = da.assign_coords(x=(da.x + 180) % 360 - 180)
-
-        # Sort the dataset by the updated longitude coordinates
-        da = da.sortby(da.x)
+    if crs == "epsg:4326":
+        lon_wrap = get_lon_wrap(ds, variable, da)
+        if lon_wrap is not None:
+            # Adjust the longitude coordinates to the -180 to 180 range
+            index, x = lon_wrap
+            if isinstance(index, int):
+                da = wrap_lon(da, index)
+            else:
+                da = da.isel(x=index)
+            da = da.assign_coords(x=x)
 
     if "time" in da.dims:
         if datetime:
             time_as_str = datetime.split("T")[0]
-            if da["time"].dtype == "O":
-                da["time"] = da["time"].astype("datetime64[ns]")
-            da = da.sel(
-                time=numpy.array(time_as_str, dtype=numpy.datetime64), method="nearest"
-            )
-        else:
+            time_index = get_time_index(ds, da)
+            if time_index is not None:
+                da = da.isel(time=time_index.nearest(time_as_str))
+            else:
+                da = da.sel(
+                    time=numpy.array(time_as_str, dtype=numpy.datetime64),
+                    method="nearest",
+                )
+        elif not time_series:
             da = da.isel(time=0)
 
     return da
 
 
+@dataclass(frozen=True)
+class MultiscaleLevel:
+    """Group and grid of a level of a multiscale store."""
+
+    group: str
+    resolution: float
+    crs: CRS
+    size: int
+
+
+def multiscale_paths(ds: xarray.Dataset) -> List[str]:
+    """Paths of the levels listed in the `multiscales` attribute of the root group."""
+    multiscales = ds.attrs.get("multiscales") or []
+    if isinstance(multiscales, str):
+        multiscales = json.loads(multiscales)
+
+    return [
+        str(dataset["path"])
+        for multiscale in multiscales[:1]
+        for dataset in multiscale.get("datasets", [])
+    ]
+
+
+def multiscale_levels(
+    src_path: str,
+    variable: str,
+    reference: Optional[bool] = False,
+    consolidated: Optional[bool] = True,
+) -> List[MultiscaleLevel]:
+    """
+    Levels of a variable in a multiscale store, from the coarsest to the finest.
+
+    The levels are the paths of the `multiscales` attribute of the root group
+    or, without it, the groups `0`, `1`, ... The table of the levels and of
+    their resolutions is built once and kept in the encoding of the root
+    dataset, like the longitude remapping.
+    """
+    try:
+        root = xarray_open_dataset(
+            src_path, reference=reference, consolidated=consolidated
+        )
+    except (GroupNotFoundError, KeyError):
+        # Levels written without a root group, the table is not kept
+        root = xarray.Dataset()
+
+    tables = root.encoding.setdefault(MULTISCALE_ENCODING, {})
+    if variable in tables:
+        return tables[variable]
+
+    paths = multiscale_paths(root)
+    groups = paths if paths else map(str, itertools.count())
+
+    levels = []
+    for group in groups:
+        try:
+            ds = xarray_open_dataset(
+                src_path, group=group, reference=reference, consolidated=consolidated
+            )
+        except GroupNotFoundError:
+            if paths:
+                raise
+            break
+
+        da = get_variable(ds, variable)
+        levels.append(
+            MultiscaleLevel(
+                group=group,
+                resolution=abs(da.rio.resolution(recalc=True)[0]),
+                crs=da.rio.crs,
+                size=da.size,
+            )
+        )
+
+    levels.sort(key=lambda level: level.resolution, reverse=True)
+    tables[variable] = levels
+    return levels
+
+
+def multiscale_level(
+    levels: Sequence[MultiscaleLevel],
+    tms: TileMatrixSet,
+    tile: Tile,
+    tilesize: int = 256,
+) -> Optional[str]:
+    """
+    Group of the coarsest level at least as fine as a tile, or of the finest level.
+
+    The tile resolution is its width in the CRS of the level divided by
+    `tilesize`, so low zooms never read the full resolution levels.
+    """
+    if not levels:
+        return None
+
+    tile_bounds = tms.xy_bounds(tile)
+    for level in levels:
+        left, _, right, _ = transform_bounds(
+            tms.rasterio_crs, level.crs, *tile_bounds, densify_pts=21
+        )
+        if level.resolution <= (right - left) / tilesize * (1 + 1e-6):
+            return level.group
+
+    return levels[-1].group
+
+
+def multiscale_group(
+    src_path: str,
+    variable: str,
+    tms: TileMatrixSet,
+    tile: Tile,
+    tilesize: int = 256,
+    reference: Optional[bool] = False,
+    consolidated: Optional[bool] = True,
+) -> Optional[str]:
+    """Group of the multiscale level to read a tile from."""
+    levels = multiscale_levels(
+        src_path, variable, reference=reference, consolidated=consolidated
+    )
+    return multiscale_level(levels, tms, tile, tilesize=tilesize)
+
+
+def multiscale_sizes(
+    src_path: str,
+    variable: str,
+    max_group: Optional[Any] = None,
+    reference: Optional[bool] = False,
+    consolidated: Optional[bool] = True,
+) -> List[int]:
+    """
+    Size of a variable in each level of a multiscale store.
+
+    Levels are listed from the coarsest up to `max_group` or the finest level.
+    """
+    sizes: List[int] = []
+    for level in multiscale_levels(
+        src_path, variable, reference=reference, consolidated=consolidated
+    ):
+        sizes.append(level.size)
+        if max_group is not None and level.group == str(max_group):
+            break
+
+    return sizes
+
+
+def approx_level(sizes: List[int], size: int) -> int:
+    """Coarsest level with at least `size` elements, or the finest level."""
+    return next(
+        (level for level, level_size in enumerate(sizes) if level_size >= size),
+        len(sizes) - 1,
+    )
+
+
+def zarr_chunk_keys(
+    da: xarray.DataArray,
+) -> Tuple[Optional[ChunkCacheStore], List[str]]:
+    """
+    Find the zarr chunks a lazy DataArray will read.
+
+    Returns the chunk cache store of the zarr array and the chunk keys, or
+    `(None, [])` when the DataArray is not a lazily indexed zarr array read
+    through the chunk cache (e.g. NetCDF or already loaded data).
+    """
+    return _chunk_keys(da.variable._data)
+
+
+def _chunk_keys(array: Any) -> Tuple[Optional[ChunkCacheStore], List[str]]:
+    while not isinstance(array, LazilyIndexedArray) and hasattr(array, "array"):
+        array = array.array
+
+    if isinstance(array, LazilyIndexedArray) and isinstance(array.array, LonWrapArray):
+        # the chunks of the source ranges of the wrapped longitudes
+        wrapped = array.array
+        wrapped_store = None
+        keys: Dict[str, None] = {}
+        for source_key in wrapped.source_keys(array.key):
+            wrapped_store, source_keys = _chunk_keys(wrapped.array[source_key])
+            if wrapped_store is None:
+                return None, []
+            keys.update(dict.fromkeys(source_keys))
+        return wrapped_store, list(keys)
+
+    if not isinstance(array, LazilyIndexedArray) or not isinstance(
+        array.array, ZarrArrayWrapper
+    ):
+        return None, []
+
+    zarr_array = array.array.get_array()
+    store = zarr_array.chunk_store
+    while not isinstance(store, ChunkCacheStore) and hasattr(store, "store"):
+        store = store.store
+
+    if not isinstance(store, ChunkCacheStore):
+        return None, []
+
+    indexer = OrthogonalIndexer(array.key.tuple, zarr_array)
+    return store, [zarr_array._chunk_key(c.chunk_coords) for c in indexer]
+
+
+async def aprefetch(da: xarray.DataArray) -> None:
+    """Fetch the zarr chunks of a lazy DataArray into the chunk cache, concurrently."""
+    # Indexing the chunks is CPU work, only the fetch runs on the event loop
+    store, keys = await run_in_threadpool(zarr_chunk_keys, da)
+    if store is not None and keys:
+        await store.agetitems(keys)
+
+
 @attr.s
 class ZarrReader(XarrayReader):
     """ZarrReader: Open Zarr file and access DataArray."""
@@ -212,6 +682,9 @@ class ZarrReader(XarrayReader):
     tms: TileMatrixSet = attr.ib(default=WEB_MERCATOR_TMS)
     geographic_crs: CRS = attr.ib(default=WGS84_CRS)
 
+    # Source pixels read around a tile for the resampling kernels
+    tile_halo: int = attr.ib(default=2)
+
     ds: xarray.Dataset = attr.ib(init=False)
     input: xarray.DataArray = attr.ib(init=False)
 
@@ -226,14 +699,15 @@ class ZarrReader(XarrayReader):
 
     def __attrs_post_init__(self):
         """Set bounds and CRS."""
-        self.ds = self._ctx_stack.enter_context(
-            xarray_open_dataset(
-                self.src_path,
-                group=self.group,
-                reference=self.reference,
-                consolidated=self.consolidated,
-            ),
+        self.ds = xarray_open_dataset(
+            self.src_path,
+            group=self.group,
+            reference=self.reference,
+            consolidated=self.consolidated,
         )
+        # Datasets held by the dataset cache are shared between requests
+        if not api_settings.enable_dataset_cache:
+            self._ctx_stack.enter_context(self.ds)
         self.input = get_variable(
             self.ds,
             self.variable,
@@ -250,6 +724,432 @@ class ZarrReader(XarrayReader):
             if d not in [self.input.rio.x_dim, self.input.rio.y_dim]
         ]
 
+    def tile_window(
+        self,
+        bounds: BBox,
+        bounds_crs: CRS,
+        auto_expand: bool = True,
+        da: Optional[xarray.DataArray] = None,
+    ) -> xarray.DataArray:
+        """
+        Select the source pixels intersecting bounds, plus `tile_halo` pixels.
+
+        The window is computed from the affine transform of the DataArray
+        (`input` by default) so that only the chunks overlapping the bounds
+        are read, and the halo keeps the neighbouring pixels used by the
+        resampling kernels.
+        """
+        da = self.input if da is None else da
+        x_dim, y_dim = da.rio.x_dim, da.rio.y_dim
+        height, width = da.sizes[y_dim], da.sizes[x_dim]
+
+        left, bottom, right, top = transform_bounds(
+            bounds_crs, self.crs, *bounds, densify_pts=21
+        )
+        inverse = ~da.rio.transform(recalc=True)
+        cols, rows = zip(
+            *[inverse * (x, y) for x in (left, right) for y in (bottom, top)]
+        )
+        col_start = max(math.floor(min(cols)) - self.tile_halo, 0)
+        col_stop = min(math.ceil(max(cols)) + self.tile_halo, width)
+        row_start = max(math.floor(min(rows)) - self.tile_halo, 0)
+        row_stop = min(math.ceil(max(rows)) + self.tile_halo, height)
+        if col_start >= col_stop or row_start >= row_stop:
+            raise NoDataInBounds(f"No data found in bounds: {bounds}")
+
+        if col_stop - col_start < 2 or row_stop - row_start < 2:
+            if not auto_expand:
+                raise OneDimensionalRaster(
+                    "At least one of the clipped raster x,y coordinates has only one point."
+                )
+            col_start, col_stop = max(col_start - 1, 0), min(col_stop + 1, width)
+            row_start, row_stop = max(row_start - 1, 0), min(row_stop + 1, height)
+
+        da = da.isel(
+            {x_dim: slice(col_start, col_stop), y_dim: slice(row_start, row_stop)}
+        )
+        return da.rio.write_transform(da.rio.transform(recalc=True))
+
+    def tile(
+        self,
+        tile_x: int,
+        tile_y: int,
+        tile_z: int,
+        tilesize: int = 256,
+        resampling_method: WarpResampling = "nearest",
+        auto_expand: bool = True,
+        nodata: Optional[NoData] = None,
+    ) -> ImageData:
+        """Read a Web Map tile, only reading the source window of the tile."""
+        if not self.tile_exists(tile_x, tile_y, tile_z):
+            raise TileOutsideBounds(
+                f"Tile {tile_z}/{tile_x}/{tile_y} is outside bounds"
+            )
+
+        tile_bounds = self.tms.xy_bounds(Tile(x=tile_x, y=tile_y, z=tile_z))
+        ds = self.tile_window(
+            tile_bounds, self.tms.rasterio_crs, auto_expand=auto_expand
+        )
+        ds = self._reproject_tile(ds, tile_bounds, tilesize, resampling_method, nodata)
+        return self._tile_image(ds, tile_bounds, nodata)
+
+    def _reproject_tile(
+        self,
+        ds: xarray.DataArray,
+        tile_bounds: BBox,
+        tilesize: int,
+        resampling_method: WarpResampling,
+        nodata: Optional[NoData],
+    ) -> xarray.DataArray:
+        """
+        Reproject a source window to the tile grid.
+
+        Regular lon/lat grids are regridded with index lookups for the
+        `nearest` resampling, other grids and resamplings are warped by GDAL.
+        """
+        if nodata is not None:
+            ds = ds.rio.write_nodata(nodata)
+
+        dst_crs = self.tms.rasterio_crs
+        dst_transform = from_bounds(*tile_bounds, height=tilesize, width=tilesize)
+        if (
+            resampling_method == "nearest"
+            and api_settings.enable_fast_regrid
+            and regrid.is_separable(ds, dst_crs)
+        ):
+            return regrid.regrid_nearest(
+                ds, dst_crs, dst_transform, tilesize, tilesize, nodata=nodata
+            )
+
+        return ds.rio.reproject(
+            dst_crs,
+            shape=(tilesize, tilesize),
+            transform=dst_transform,
+            resampling=Resampling[resampling_method],
+            nodata=nodata,
+        )
+
+    def _tile_image(
+        self,
+        ds: xarray.DataArray,
+        tile_bounds: BBox,
+        nodata: Optional[NoData],
+    ) -> ImageData:
+        """Create the ImageData of a reprojected tile."""
+        # Forward valid_min/valid_max to the ImageData object
+        minv, maxv = ds.attrs.get("valid_min"), ds.attrs.get("valid_max")
+        stats = None
+        if minv is not None and maxv is not None and nodata not in [minv, maxv]:
+            stats = ((minv, maxv),) * ds.rio.count
+
+        arr = ds.to_masked_array()
+        arr.mask |= arr.data == ds.rio.nodata
+
+        return ImageData(
+            arr,
+            bounds=tile_bounds,
+            crs=self.tms.rasterio_crs,
+            dataset_statistics=stats,
+            band_names=self.band_names,
+        )
+
+    def time_series(self) -> xarray.DataArray:
+        """Lazy DataArray of the variable with all its time steps."""
+        return get_variable(
+            self.ds, self.variable, drop_dim=self.drop_dim, time_series=True
+        )
+
+    def stack_times(
+        self,
+        datetimes: Optional[Sequence[str]] = None,
+        start_datetime: Optional[str] = None,
+        end_datetime: Optional[str] = None,
+    ) -> numpy.ndarray:
+        """
+        Positions of the time steps of a tile stack.
+
+        The steps are the times nearest to `datetimes`, in the given order, or
+        all the times between `start_datetime` and `end_datetime` (all the
+        times when none is given).
+        """
+        da = self.time_series()
+        if "time" not in da.dims:
+            raise ValueError(f"Variable {self.variable} has no time dimension")
+
+        if not datetimes and not start_datetime and not end_datetime:
+            return numpy.arange(da.sizes["time"])
+
+        time_index = get_time_index(self.ds, da)
+        if time_index is None:
+            raise ValueError(f"Time coordinate of {self.variable} is not a datetime")
+
+        if datetimes:
+            return numpy.array([time_index.nearest(dt) for dt in datetimes])
+
+        return time_index.range(start_datetime, end_datetime)
+
+    def tile_stack_window(
+        self,
+        tile_x: int,
+        tile_y: int,
+        tile_z: int,
+        times: Union[Sequence[int], numpy.ndarray],
+        auto_expand: bool = True,
+    ) -> xarray.DataArray:
+        """Lazy source window of a tile for the time steps at positions `times`."""
+        if not self.tile_exists(tile_x, tile_y, tile_z):
+            raise TileOutsideBounds(
+                f"Tile {tile_z}/{tile_x}/{tile_y} is outside bounds"
+            )
+
+        tile_bounds = self.tms.xy_bounds(Tile(x=tile_x, y=tile_y, z=tile_z))
+        da = self.tile_window(
+            tile_bounds,
+            self.tms.rasterio_crs,
+            auto_expand=auto_expand,
+            da=self.time_series(),
+        )
+        return da.isel(time=numpy.asarray(times))
+
+    def tile_stack(
+        self,
+        tile_x: int,
+        tile_y: int,
+        tile_z: int,
+        times: Union[Sequence[int], numpy.ndarray],
+        tilesize: int = 256,
+        resampling_method: WarpResampling = "nearest",
+        auto_expand: bool = True,
+        nodata: Optional[NoData] = None,
+    ) -> List[ImageData]:
+        """
+        Read a Web Map tile for several time steps.
+
+        The source window is read once for all the time steps, so each chunk
+        is decoded once even when it holds many of them, and the steps are
+        reprojected together.
+        """
+        ds = self.tile_stack_window(
+            tile_x, tile_y, tile_z, times, auto_expand=auto_expand
+        ).load()
+        tile_bounds = self.tms.xy_bounds(Tile(x=tile_x, y=tile_y, z=tile_z))
+        ds = self._reproject_tile(ds, tile_bounds, tilesize, resampling_method, nodata)
+        return [
+            self._tile_image(ds.isel(time=index), tile_bounds, nodata)
+            for index in range(ds.sizes["time"])
+        ]
+
+    def tile_chunk_keys(
+        self,
+        tile_x: int,
+        tile_y: int,
+        tile_z: int,
+        auto_expand: bool = True,
+    ) -> Tuple[Optional[ChunkCacheStore], List[str]]:
+        """Chunk cache store and keys of the zarr chunks needed to read a tile."""
+        if not self.tile_exists(tile_x, tile_y, tile_z):
+            return None, []
+
+        tile_bounds = self.tms.xy_bounds(Tile(x=tile_x, y=tile_y, z=tile_z))
+        try:
+            da = self.tile_window(
+                tile_bounds, self.tms.rasterio_crs, auto_expand=auto_expand
+            )
+        except (NoDataInBounds, OneDimensionalRaster):
+            return None, []
+
+        return zarr_chunk_keys(da)
+
+    async def aprefetch_tile(
+        self,
+        tile_x: int,
+        tile_y: int,
+        tile_z: int,
+        auto_expand: bool = True,
+    ) -> None:
+        """
+        Fetch the zarr chunks needed to read a tile into the chunk cache.
+
+        The chunks are requested concurrently without blocking the event loop,
+        so that `tile()` (run in a worker thread) only decodes and reprojects.
+        """
+        await self.aprefetch_tiles([Tile(tile_x, tile_y, tile_z)], auto_expand)
+
+    def point_array(
+        self,
+        lon: float,
+        lat: float,
+        coord_crs: CRS = WGS84_CRS,
+    ) -> xarray.DataArray:
+        """
+        Lazy DataArray of the pixel nearest to a point.
+
+        Without `datetime`, the DataArray holds the time series of the pixel,
+        so reading it only touches the chunks of one spatial column.
+        """
+        x, y = transform_coords(coord_crs, self.crs, [lon], [lat])
+        minx, miny, maxx, maxy = self.bounds
+        if not (minx <= x[0] <= maxx and miny <= y[0] <= maxy):
+            raise PointOutsideBounds("Point is outside dataset bounds")
+
+        da = self.input
+        if self.datetime is None:
+            da = self.time_series()
+
+        x_dim, y_dim = da.rio.x_dim, da.rio.y_dim
+        col, row = ~da.rio.transform(recalc=True) * (x[0], y[0])
+        return da.isel(
+            {
+                x_dim: min(max(math.floor(col), 0), da.sizes[x_dim] - 1),
+                y_dim: min(max(math.floor(row), 0), da.sizes[y_dim] - 1),
+            }
+        )
+
+    def tiles_chunk_keys(
+        self,
+        tiles: Sequence[Tile],
+        auto_expand: bool = True,
+    ) -> Tuple[Optional[ChunkCacheStore], List[str]]:
+        """Chunk cache store and union of the zarr chunk keys needed to read tiles."""
+        store = None
+        keys: Set[str] = set()
+        for tile in tiles:
+            tile_store, tile_keys = self.tile_chunk_keys(
+                tile.x, tile.y, tile.z, auto_expand=auto_expand
+            )
+            store = store or tile_store
+            keys.update(tile_keys)
+
+        return store, sorted(keys)
+
+    async def aprefetch_tiles(
+        self,
+        tiles: Sequence[Tile],
+        auto_expand: bool = True,
+    ) -> None:
+        """
+        Fetch the union of the zarr chunks needed to read tiles, each chunk once.
+
+        The tile windows and chunk keys are computed in a worker thread, only
+        the chunk requests run on the event loop.
+        """
+        store, keys = await run_in_threadpool(self.tiles_chunk_keys, tiles, auto_expand)
+        if store is not None and keys:
+            await store.agetitems(keys)
+
+    def _cache_key(self, kind: str, **params: Any) -> str:
+        """Cache key of values computed from the selected variable."""
+        return cache_key(
+            kind,
+            self.src_path,
+            variable=self.variable,
+            group=self.group,
+            reference=bool(self.reference),
+            consolidated=self.consolidated,
+            datetime=self.datetime,
+            drop_dim=self.drop_dim,
+            **params,
+        )
+
+    def data_range(self) -> Optional[Tuple[float, float]]:
+        """
+        Minimum and maximum of the variable.
+
+        The range is read from the `actual_range` attribute when there is one,
+        otherwise it is computed chunk by chunk and kept in the cache.
+        """
+        actual_range = self.input.attrs.get("actual_range")
+        if actual_range is not None and len(actual_range) == 2:
+            return float(actual_range[0]), float(actual_range[1])
+
+        key = self._cache_key("range", version=dataset_version(self.ds))
+        if api_settings.enable_cache:
+            value = cache_client.get(key)
+            if value is not None:
+                data_range = json.loads(value)
+                return (data_range[0], data_range[1]) if data_range else None
+
+        data_range = stats.data_range(
+            self.input, max_workers=api_settings.stats_max_workers
+        )
+        if api_settings.enable_cache:
+            cache_client.set(
+                key, json.dumps(data_range), ex=api_settings.cache_ttl or None
+            )
+
+        return data_range
+
+    def histogram(
+        self,
+        bins: Union[int, List[float]] = 10,
+        range: Optional[Tuple[float, float]] = None,
+    ) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """Histogram of the variable, computed chunk by chunk."""
+        if isinstance(bins, int) and range is None:
+            range = self.data_range() or (0, 1)
+
+        return stats.histogram(
+            self.input,
+            bins=bins,
+            range=range,
+            max_workers=api_settings.stats_max_workers,
+        )
+
+    def approx_histogram(
+        self,
+        bins: Union[int, List[float]] = 10,
+        range: Optional[Tuple[float, float]] = None,
+    ) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        """Histogram of the variable estimated from a sample of its chunks."""
+        return stats.approx_histogram(
+            self.input,
+            bins=bins,
+            range=range,
+            size=api_settings.approx_size,
+            max_workers=api_settings.stats_max_workers,
+        )
+
+    def variable_statistics(
+        self,
+        percentiles: Optional[List[int]] = None,
+        approx: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Statistics of the variable, computed chunk by chunk.
+
+        The statistics are cached for the version of the dataset metadata.
+        With `approx`, they are estimated from a sample of the chunks.
+        """
+        key = self._cache_key(
+            "statistics",
+            percentiles=percentiles,
+            approx=approx,
+            version=dataset_version(self.ds),
+        )
+        if api_settings.enable_cache:
+            value = cache_client.get(key)
+            if value is not None:
+                return json.loads(value)
+
+        if approx:
+            result = stats.approx_statistics(
+                self.input,
+                percentiles=percentiles,
+                size=api_settings.approx_size,
+                max_workers=api_settings.stats_max_workers,
+            )
+        else:
+            result = stats.statistics(
+                self.input,
+                percentiles=percentiles,
+                max_workers=api_settings.stats_max_workers,
+            )
+
+        if api_settings.enable_cache:
+            cache_client.set(key, json.dumps(result), ex=api_settings.cache_ttl or None)
+
+        return result
+
     @classmethod
     def list_variables(
         cls,
@@ -259,10 +1159,14 @@ class ZarrReader(XarrayReader):
         consolidated: Optional[bool] = True,
     ) -> List[str]:
         """List available variable in a dataset."""
-        with xarray_open_dataset(
+        ds = xarray_open_dataset(
             src_path,
             group=group,
             reference=reference,
             consolidated=consolidated,
-        ) as ds:
+        )
+        if api_settings.enable_dataset_cache:
+            return list(ds.data_vars)  # type: ignore
+
+        with ds:
             return list(ds.data_vars)  # type: ignore
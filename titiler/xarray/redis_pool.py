@@ -9,6 +9,19 @@ from titiler.xarray.settings import ApiSettings
 api_settings = ApiSettings()
 
 
+class FakeRedisServer:
+    """Fake redis server singleton class, shared by all the test connections."""
+
+    _instance = None
+
+    @classmethod
+    def get_instance(cls):
+        """Get the fake redis server."""
+        if cls._instance is None:
+            cls._instance = fakeredis.FakeServer()
+        return cls._instance
+
+
 class RedisCache:
     """Redis connection pool singleton class."""
 
@@ -27,7 +40,7 @@ class RedisCache:
 def get_redis():
     """Get a redis connection."""
     if os.getenv("TEST_ENVIRONMENT"):
-        server = fakeredis.FakeServer()
+        server = FakeRedisServer.get_instance()
         # Use fakeredis in a test environment
         return fakeredis.FakeRedis(server=server)
 
@@ -0,0 +1,264 @@
+"""Nearest neighbour regridding of regular geographic grids.
+
+For a regular longitude/latitude grid and a tile in WebMercator (or in
+longitude/latitude), the longitude of a tile pixel only depends on its
+column and its latitude only on its row. The source pixel of each tile
+pixel is then found with one index per column and one per row, and the tile
+is gathered with two 1-D lookups instead of a general warp.
+
+These index maps only depend on the source grid and the tile, so they are
+kept in a per-worker LRU (`warp_maps`) shared by the requests rendering the
+same tile for other times, variables or colormaps.
+"""
+
+import threading
+from typing import Dict, Hashable, Optional, Tuple
+
+import numpy
+import xarray
+from affine import Affine
+from cachetools import LRUCache
+from rasterio.crs import CRS
+from rasterio.warp import transform as transform_coords
+from rio_tiler.types import NoData
+from rioxarray.raster_array import FILL_VALUE_NAMES, UNWANTED_RIO_ATTRS
+
+from titiler.xarray.settings import ApiSettings
+
+api_settings = ApiSettings()
+
+# Tile CRSs whose axes are separable from longitude/latitude
+SEPARABLE_CRS = (CRS.from_epsg(3857), CRS.from_epsg(4326))
+
+
+IndexMap = Tuple[numpy.ndarray, numpy.ndarray]
+
+
+class WarpMapCache:
+    """Per-worker LRU of the index maps (`source_indices`), bounded to `maxsize` bytes."""
+
+    def __init__(self, maxsize: int):
+        """Create a warp map cache."""
+        self.memory: LRUCache = LRUCache(
+            maxsize=maxsize, getsizeof=lambda value: value[0].nbytes + value[1].nbytes
+        )
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[IndexMap]:
+        """Return a cached index map."""
+        with self.lock:
+            value = self.memory.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: IndexMap) -> None:
+        """Cache an index map."""
+        with self.lock:
+            try:
+                self.memory[key] = value
+            except ValueError:
+                # value too large
+                pass
+
+    def clear(self) -> None:
+        """Remove all the index maps."""
+        with self.lock:
+            self.memory.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Cache hits, misses and size."""
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": int(self.memory.currsize),
+                "maxsize": int(self.memory.maxsize),
+            }
+
+
+warp_maps = WarpMapCache(maxsize=api_settings.warp_map_cache_maxsize)
+
+
+def is_separable(da: xarray.DataArray, dst_crs: CRS) -> bool:
+    """Whether the grid of a DataArray is a regular lon/lat grid, separable in `dst_crs`."""
+    src_crs = da.rio.crs
+    if src_crs is None or src_crs != CRS.from_epsg(4326):
+        return False
+
+    if dst_crs not in SEPARABLE_CRS:
+        return False
+
+    transform = da.rio.transform(recalc=True)
+    return transform.b == 0 and transform.d == 0
+
+
+def is_same_value(a: Optional[float], b: Optional[float]) -> bool:
+    """Whether two nodata values are the same, NaN being equal to NaN."""
+    if a is None or b is None:
+        return a is b
+    return a == b or (numpy.isnan(a) and numpy.isnan(b))
+
+
+def axis_indices(
+    centers: numpy.ndarray,
+    origin: float,
+    step: float,
+    size: int,
+    wrap: bool = False,
+) -> numpy.ndarray:
+    """
+    Index of the source pixels containing coordinates, -1 outside the grid.
+
+    With `wrap`, the axis is periodic (longitudes of a global grid).
+    """
+    index = numpy.floor((centers - origin) / step).astype("int64")
+    if wrap:
+        return index % size
+    index[(index < 0) | (index >= size)] = -1
+    return index
+
+
+def is_global(transform: Affine, width: int) -> bool:
+    """Whether a lon/lat grid covers all longitudes (as GDAL, which wraps it)."""
+    return abs(abs(transform.a) * width - 360) < abs(transform.a) * 1e-6
+
+
+def warp_map_key(
+    da: xarray.DataArray,
+    dst_crs: CRS,
+    dst_transform: Affine,
+    width: int,
+    height: int,
+) -> Hashable:
+    """Key of an index map: the source grid (transform, shape, CRS) and the tile."""
+    return (
+        tuple(da.rio.transform(recalc=True))[:6],
+        da.sizes[da.rio.y_dim],
+        da.sizes[da.rio.x_dim],
+        da.rio.crs.to_string(),
+        dst_crs.to_string(),
+        tuple(dst_transform)[:6],
+        width,
+        height,
+    )
+
+
+def source_indices(
+    da: xarray.DataArray,
+    dst_crs: CRS,
+    dst_transform: Affine,
+    width: int,
+    height: int,
+) -> IndexMap:
+    """
+    Source row of each tile row and source column of each tile column.
+
+    The index maps are read from and added to `warp_maps`.
+    """
+    key = warp_map_key(da, dst_crs, dst_transform, width, height)
+    index_map = warp_maps.get(key)
+    if index_map is None:
+        index_map = compute_source_indices(da, dst_crs, dst_transform, width, height)
+        # shared by the requests, never modified
+        for index in index_map:
+            index.flags.writeable = False
+        warp_maps.set(key, index_map)
+
+    return index_map
+
+
+def compute_source_indices(
+    da: xarray.DataArray,
+    dst_crs: CRS,
+    dst_transform: Affine,
+    width: int,
+    height: int,
+) -> IndexMap:
+    """Source row of each tile row and source column of each tile column."""
+    xs = dst_transform.c + (numpy.arange(width) + 0.5) * dst_transform.a
+    ys = dst_transform.f + (numpy.arange(height) + 0.5) * dst_transform.e
+    src_crs = da.rio.crs
+    lons, _ = transform_coords(dst_crs, src_crs, xs, numpy.zeros(width))
+    _, lats = transform_coords(dst_crs, src_crs, numpy.zeros(height), ys)
+
+    transform = da.rio.transform(recalc=True)
+    src_width = da.sizes[da.rio.x_dim]
+    cols = axis_indices(
+        numpy.asarray(lons),
+        transform.c,
+        transform.a,
+        src_width,
+        wrap=is_global(transform, src_width),
+    )
+    rows = axis_indices(
+        numpy.asarray(lats), transform.f, transform.e, da.sizes[da.rio.y_dim]
+    )
+    return rows, cols
+
+
+def regrid_nearest(
+    da: xarray.DataArray,
+    dst_crs: CRS,
+    dst_transform: Affine,
+    width: int,
+    height: int,
+    nodata: Optional[NoData] = None,
+) -> xarray.DataArray:
+    """
+    Nearest neighbour regridding of a separable grid (see `is_separable`).
+
+    The result matches `da.rio.reproject(..., resampling=Resampling.nearest)`:
+    same values, nodata, attributes and georeferencing.
+    """
+    rows, cols = source_indices(da, dst_crs, dst_transform, width, height)
+    x_dim, y_dim = da.rio.x_dim, da.rio.y_dim
+
+    src_nodata = da.rio.nodata
+    dst_nodata = da.rio._get_dst_nodata(nodata)
+
+    data = numpy.take(
+        numpy.take(da.values, numpy.maximum(rows, 0), axis=da.dims.index(y_dim)),
+        numpy.maximum(cols, 0),
+        axis=da.dims.index(x_dim),
+    )
+    invalid = numpy.broadcast_to((rows < 0)[:, None] | (cols < 0)[None, :], data.shape)
+    if src_nodata is not None and not is_same_value(src_nodata, dst_nodata):
+        # source nodata pixels are written with the destination nodata
+        invalid = invalid | (
+            numpy.isnan(data) if numpy.isnan(src_nodata) else data == src_nodata
+        )
+
+    if dst_nodata is not None:
+        data[invalid] = dst_nodata
+
+    attrs = {
+        key: value
+        for key, value in da.attrs.items()
+        if key not in FILL_VALUE_NAMES + UNWANTED_RIO_ATTRS
+    }
+    fill_value = src_nodata if src_nodata is not None else dst_nodata
+    if da.rio.encoded_nodata is None and fill_value is not None:
+        attrs["_FillValue"] = fill_value
+
+    dims = tuple(
+        "x" if dim == x_dim else "y" if dim == y_dim else dim for dim in da.dims
+    )
+    coords = {
+        name: coord
+        for name, coord in da.coords.items()
+        if x_dim not in coord.dims and y_dim not in coord.dims
+    }
+    coords["x"] = dst_transform.c + (numpy.arange(width) + 0.5) * dst_transform.a
+    coords["y"] = dst_transform.f + (numpy.arange(height) + 0.5) * dst_transform.e
+
+    xda = xarray.DataArray(data, dims=dims, coords=coords, attrs=attrs, name=da.name)
+    xda.encoding = da.encoding
+    xda.rio.write_transform(dst_transform, inplace=True)
+    xda.rio.write_crs(dst_crs, inplace=True)
+    xda.rio.write_coordinate_system(inplace=True)
+    return xda
@@ -0,0 +1,504 @@
+"""Pre-render the tiles of a layer into the tile cache or an MBTiles archive.
+
+A layer is a dataset URL and the query parameters of its tile requests
+(variable, datetime, rescale, colormap...). Its tiles are rendered as the
+tiles endpoint of `ZarrTilerFactory` renders them, without the HTTP layer,
+and stored under the keys the endpoint reads, so that the requests of the
+layer are served from the tile cache. The tiles are grouped by the dataset
+chunk they read (tiles under the same ancestor tile of about one chunk) and
+each group is rendered by one worker process, so that a worker reads a chunk
+once.
+
+Usage: `titiler-xarray-seed URL "variable=tas&colormap_name=viridis" --maxzoom 6`
+"""
+
+import argparse
+import contextlib
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from itertools import groupby
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Type
+from urllib.parse import parse_qsl
+
+import morecantile
+from morecantile import Tile, TileMatrixSet
+from rasterio.warp import transform as transform_coords
+
+from titiler.core.dependencies import ColorFormulaParams, ColorMapName
+from titiler.core.resources.enums import ImageType
+from titiler.xarray import reader
+from titiler.xarray.cache import TileCache, get_tile_cache, tile_cache_key
+from titiler.xarray.factory import ZarrTilerFactory, nodata_dependency, render_tile
+from titiler.xarray.overviews import tile_overview
+from titiler.xarray.settings import ApiSettings
+from titiler.xarray.stats import chunk_sizes
+
+api_settings = ApiSettings()
+
+TRUE_VALUES = ("1", "true", "on", "yes")
+
+RenderedTile = Tuple[Tile, bytes, str]
+
+# Formats picked for the tiles requested without extension (TileJSON and map URLs)
+AUTO_FORMATS = {t.mediatype: t for t in (ImageType.png, ImageType.jpeg)}
+
+# MBTiles `format` metadata of the tile formats an archive can hold
+MBTILES_FORMATS: Dict[Optional[ImageType], str] = {
+    ImageType.png: "png",
+    ImageType.pngraw: "png",
+    ImageType.jpeg: "jpg",
+    ImageType.jpg: "jpg",
+    ImageType.webp: "webp",
+}
+
+
+@dataclass
+class Layer:
+    """A dataset and the query parameters of its tile requests, resolved."""
+
+    url: str
+    reader: Type[reader.ZarrReader]
+    reader_options: Dict[str, Any]
+    multiscale: bool = False
+    tms: str = "WebMercatorQuad"
+    scale: int = 1
+    format: Optional[ImageType] = None  # None: JPEG or PNG, picked per tile
+    nodata: Optional[float] = None
+    render_options: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def tilesize(self) -> int:
+        """Size of the tiles."""
+        return self.scale * 256
+
+    def cache_key(self, tile: Tile, format: Optional[ImageType]) -> str:
+        """Key of a tile in the tile cache, as computed by the tiles endpoint."""
+        return tile_cache_key(
+            self.url,
+            tile=[
+                ("tileMatrixSetId", self.tms),
+                ("z", tile.z),
+                ("x", tile.x),
+                ("y", tile.y),
+                ("scale", self.scale),
+                ("format", format.value if format else None),
+            ],
+            options={
+                **self.reader_options,
+                "multiscale": self.multiscale,
+                "nodata": self.nodata,
+                **self.render_options,
+            },
+        )
+
+    def cache_keys(self, tile: Tile, media_type: str) -> List[str]:
+        """
+        Keys of a rendered tile: the key of the layer format and, when the
+        format is picked per tile, the key of the picked format too.
+        """
+        keys = [self.cache_key(tile, self.format)]
+        if self.format is None:
+            keys.append(self.cache_key(tile, AUTO_FORMATS[media_type]))
+        return keys
+
+
+def layer(
+    factory: ZarrTilerFactory,
+    url: str,
+    query: str,
+    tms: str = "WebMercatorQuad",
+    scale: int = 1,
+    format: Optional[ImageType] = None,
+) -> Layer:
+    """Resolve the query parameters of a layer with the factory dependencies."""
+    items = parse_qsl(query)
+    values: Dict[str, List[str]] = {}
+    for key, value in items:
+        values.setdefault(key, []).append(value)
+
+    def get(name: str, default: Optional[str] = None) -> Optional[str]:
+        return values[name][-1] if name in values else default
+
+    def get_bool(name: str, default: bool) -> bool:
+        value = get(name)
+        return default if value is None else value.lower() in TRUE_VALUES
+
+    if get("variable") is None:
+        raise ValueError("The layer query must have a `variable` parameter")
+
+    colormap_name = get("colormap_name")
+    return Layer(
+        url=url,
+        reader=factory.reader,
+        reader_options={
+            "variable": get("variable"),
+            "reference": get_bool("reference", False),
+            "decode_times": get_bool("decode_times", True),
+            "drop_dim": get("drop_dim"),
+            "datetime": get("datetime"),
+            "consolidated": get_bool("consolidated", True),
+        },
+        multiscale=get_bool("multiscale", False),
+        tms=tms,
+        scale=scale,
+        format=format,
+        nodata=nodata_dependency(get("nodata")),
+        render_options={
+            "post_process": factory.process_dependency(
+                algorithm=get("algorithm"), algorithm_params=get("algorithm_params")
+            ),
+            "rescale": factory.rescale_dependency(rescale=values.get("rescale")),
+            "color_formula": ColorFormulaParams(color_formula=get("color_formula")),
+            "colormap": factory.colormap_dependency(
+                colormap_name=ColorMapName(colormap_name) if colormap_name else None,
+                colormap=get("colormap"),
+            ),
+            "render_params": factory.render_dependency(
+                add_mask=get_bool("return_mask", True)
+            ),
+        },
+    )
+
+
+@contextlib.contextmanager
+def open_tile_reader(
+    layer: Layer, tms: TileMatrixSet, tile: Tile
+) -> Iterator[reader.ZarrReader]:
+    """Reader of a tile: multiscale level or overview, as in the tiles endpoint."""
+    group = None
+    if layer.multiscale:
+        group = reader.multiscale_group(
+            layer.url,
+            layer.reader_options["variable"],
+            tms,
+            tile,
+            tilesize=layer.tilesize,
+            reference=layer.reader_options["reference"],
+            consolidated=layer.reader_options["consolidated"],
+        )
+
+    with contextlib.ExitStack() as readers:
+        src_dst = readers.enter_context(
+            layer.reader(layer.url, group=group, tms=tms, **layer.reader_options)
+        )
+        if api_settings.enable_overviews and group is None:
+            overview_url = tile_overview(
+                src_dst, tile, tilesize=layer.tilesize, wait=True
+            )
+            if overview_url:
+                src_dst = readers.enter_context(
+                    layer.reader(
+                        overview_url, variable=layer.reader_options["variable"], tms=tms
+                    )
+                )
+
+        yield src_dst
+
+
+def render(layer: Layer, tms: TileMatrixSet, tile: Tile) -> Optional[RenderedTile]:
+    """Render a tile of a layer, None when the tile is outside of the dataset."""
+    with open_tile_reader(layer, tms, tile) as src_dst:
+        if not src_dst.tile_exists(tile.x, tile.y, tile.z):
+            return None
+
+        image = src_dst.tile(
+            tile.x,
+            tile.y,
+            tile.z,
+            tilesize=layer.tilesize,
+            nodata=(
+                layer.nodata if layer.nodata is not None else src_dst.input.rio.nodata
+            ),
+        )
+
+    content, media_type = render_tile(image, layer.format, **layer.render_options)
+    return tile, content, media_type
+
+
+def _init_worker() -> None:
+    """Read the datasets without the shared cache (there may be no redis)."""
+    reader.api_settings.enable_cache = False
+
+
+def render_group(task: Tuple[Layer, Sequence[Tile]]) -> List[RenderedTile]:
+    """Render a group of tiles, in a worker process."""
+    layer, tiles = task
+    tms = morecantile.tms.get(layer.tms)
+    rendered = (render(layer, tms, tile) for tile in tiles)
+    return [tile for tile in rendered if tile is not None]
+
+
+def chunk_zoom(src_dst: reader.ZarrReader, tilesize: int) -> int:
+    """Zoom of the tiles about as wide as a chunk of the dataset."""
+    da = src_dst.input
+    width = chunk_sizes(da)[da.rio.x_dim] * abs(da.rio.resolution(recalc=True)[0])
+    left, bottom, right, top = src_dst.bounds
+    y = (bottom + top) / 2
+    xs, _ = transform_coords(
+        src_dst.crs, src_dst.tms.rasterio_crs, [left, min(left + width, right)], [y, y]
+    )
+    return src_dst.tms.zoom_for_res(
+        abs(xs[1] - xs[0]) / tilesize, zoom_level_strategy="upper"
+    )
+
+
+def tile_groups(
+    tms: TileMatrixSet,
+    bounds: Tuple[float, float, float, float],
+    zooms: Sequence[int],
+    group_zoom: int,
+) -> Iterator[List[Tile]]:
+    """
+    Tiles intersecting geographic bounds, grouped by ancestor at `group_zoom`.
+
+    Tiles at or above `group_zoom` are groups of their own.
+    """
+
+    def group(tile: Tile) -> Tuple[int, ...]:
+        if tile.z <= group_zoom:
+            return tuple(tile)
+        return (tile.z, *tms.parent(tile, zoom=group_zoom)[0])
+
+    for zoom in zooms:
+        tiles = sorted(tms.tiles(*bounds, zooms=[zoom]), key=group)
+        for _, tiles_group in groupby(tiles, key=group):
+            yield list(tiles_group)
+
+
+class MBTiles:
+    """Minimal MBTiles (1.3) writer of WebMercatorQuad tiles, rows are flipped (TMS scheme)."""
+
+    def __init__(self, path: str, metadata: Dict[str, str]):
+        """Create (or replace the tiles of) an MBTiles archive."""
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS tiles (
+                zoom_level INTEGER,
+                tile_column INTEGER,
+                tile_row INTEGER,
+                tile_data BLOB,
+                PRIMARY KEY (zoom_level, tile_column, tile_row)
+            );
+            """)
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO metadata VALUES (?, ?)", metadata.items()
+        )
+
+    def set_many(self, tiles: Sequence[RenderedTile]) -> None:
+        """Write tiles."""
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)",
+            [
+                (tile.z, tile.x, (1 << tile.z) - 1 - tile.y, sqlite3.Binary(content))
+                for tile, content, _ in tiles
+            ],
+        )
+        self.connection.commit()
+
+    def close(self) -> None:
+        """Close the archive."""
+        self.connection.close()
+
+
+def prepare(
+    layer: Layer,
+    tms: TileMatrixSet,
+    zooms: Sequence[int],
+    bbox: Optional[Tuple[float, float, float, float]] = None,
+) -> Tuple[Tuple[float, float, float, float], int]:
+    """
+    Geographic bounds of the tiles to seed and zoom of the tile groups.
+
+    The overviews of the zooms are built, once, before the workers read them.
+    """
+    with layer.reader(layer.url, tms=tms, **layer.reader_options) as src_dst:
+        west, south, east, north = bbox or src_dst.geographic_bounds
+        bounds = (west, south, east, north)
+        if api_settings.enable_overviews and not layer.multiscale:
+            for zoom in zooms:
+                tile = next(iter(tms.tiles(*bounds, zooms=[zoom])))
+                tile_overview(src_dst, tile, tilesize=layer.tilesize, wait=True)
+
+        return bounds, chunk_zoom(src_dst, layer.tilesize)
+
+
+def write(
+    layer: Layer,
+    rendered: Sequence[RenderedTile],
+    tile_cache: Optional[TileCache] = None,
+    archive: Optional[MBTiles] = None,
+) -> None:
+    """Write rendered tiles to the tile cache and/or an MBTiles archive."""
+    if tile_cache is not None:
+        for tile, content, media_type in rendered:
+            for key in layer.cache_keys(tile, media_type):
+                tile_cache.set(key, content, media_type)
+
+    if archive is not None:
+        archive.set_many(rendered)
+
+
+def seed(
+    layer: Layer,
+    minzoom: int,
+    maxzoom: int,
+    bbox: Optional[Tuple[float, float, float, float]] = None,
+    tile_cache: Optional[TileCache] = None,
+    mbtiles: Optional[str] = None,
+    workers: int = 1,
+    log: Optional[Callable[[str], None]] = None,
+) -> int:
+    """
+    Render the tiles of a layer from `minzoom` to `maxzoom` within `bbox`.
+
+    The tiles are written to the tile cache and/or to an MBTiles archive.
+    `bbox` (west, south, east, north) defaults to the dataset bounds. Returns
+    the number of tiles rendered.
+    """
+    if tile_cache is None and mbtiles is None:
+        raise ValueError("Seeding needs a tile cache or an MBTiles archive")
+
+    if mbtiles is not None and layer.tms != "WebMercatorQuad":
+        raise ValueError("MBTiles archives only hold WebMercatorQuad tiles")
+
+    if mbtiles is not None and layer.format not in MBTILES_FORMATS:
+        raise ValueError("MBTiles archives only hold PNG, JPEG or WebP tiles")
+
+    tms = morecantile.tms.get(layer.tms)
+    zooms = range(minzoom, maxzoom + 1)
+    bounds, group_zoom = prepare(layer, tms, zooms, bbox)
+
+    archive = None
+    if mbtiles is not None:
+        west, south, east, north = bounds
+        archive = MBTiles(
+            mbtiles,
+            {
+                "name": layer.reader_options["variable"],
+                "format": MBTILES_FORMATS[layer.format],
+                "bounds": f"{west},{south},{east},{north}",
+                "minzoom": str(minzoom),
+                "maxzoom": str(maxzoom),
+                "type": "overlay",
+            },
+        )
+
+    total = sum(len(list(tms.tiles(*bounds, zooms=[zoom]))) for zoom in zooms)
+    tasks = ((layer, tiles) for tiles in tile_groups(tms, bounds, zooms, group_zoom))
+
+    executor = (
+        ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+        if workers > 1
+        else None
+    )
+    start = last_log = time.time()
+    count = 0
+    try:
+        results = (
+            executor.map(render_group, tasks)
+            if executor is not None
+            else map(render_group, tasks)
+        )
+        for rendered in results:
+            write(layer, rendered, tile_cache, archive)
+            count += len(rendered)
+            if log and time.time() - last_log >= 5:
+                last_log = time.time()
+                log(_progress(count, total, last_log - start))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if archive is not None:
+            archive.close()
+
+    if log:
+        log(_progress(count, total, time.time() - start))
+
+    return count
+
+
+def _progress(count: int, total: int, elapsed: float) -> str:
+    return (
+        f"{count}/{total} tiles in {elapsed:.1f}s "
+        f"({count / max(elapsed, 1e-6):.1f} tiles/s)"
+    )
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    """Command line interface of the tile seeder."""
+    parser = argparse.ArgumentParser(
+        prog="titiler-xarray-seed",
+        description="Render the tiles of a layer into the tile cache or an MBTiles archive.",
+    )
+    parser.add_argument("url", help="Dataset URL")
+    parser.add_argument(
+        "query",
+        help="Query parameters of the layer tile requests, e.g. `variable=tas&colormap_name=viridis`",
+    )
+    parser.add_argument(
+        "--tms", default="WebMercatorQuad", help="TileMatrixSet identifier"
+    )
+    parser.add_argument("--minzoom", type=int, default=0)
+    parser.add_argument("--maxzoom", type=int, required=True)
+    parser.add_argument(
+        "--bbox",
+        type=lambda value: tuple(float(v) for v in value.split(",")),
+        help="west,south,east,north (default: dataset bounds)",
+    )
+    parser.add_argument("--scale", type=int, default=1, choices=[1, 2, 3, 4])
+    parser.add_argument(
+        "--format",
+        choices=[t.name for t in ImageType],
+        help="Tile format (default: JPEG or PNG per tile as the TileJSON tiles, PNG for --mbtiles)",
+    )
+    parser.add_argument("--mbtiles", help="MBTiles archive to write the tiles to")
+    parser.add_argument(
+        "--no-tile-cache",
+        action="store_true",
+        help="Do not write to the tile cache (TITILER_XARRAY_TILE_CACHE)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1, help="Worker processes"
+    )
+    options = parser.parse_args(args)
+
+    tile_cache = None if options.no_tile_cache else get_tile_cache()
+    if tile_cache is None and options.mbtiles is None:
+        parser.error("set TITILER_XARRAY_TILE_CACHE or --mbtiles")
+
+    if options.format:
+        format: Optional[ImageType] = ImageType[options.format]
+    else:
+        format = ImageType.png if options.mbtiles else None
+
+    if api_settings.tile_cache != "redis":
+        # the bounds and overviews are read in this process too
+        _init_worker()
+
+    count = seed(
+        layer(
+            ZarrTilerFactory(),
+            options.url,
+            options.query,
+            tms=options.tms,
+            scale=options.scale,
+            format=format,
+        ),
+        options.minzoom,
+        options.maxzoom,
+        bbox=options.bbox,
+        tile_cache=tile_cache,
+        mbtiles=options.mbtiles,
+        workers=options.workers,
+        log=lambda message: print(message, file=sys.stderr),
+    )
+    print(f"{options.url}: {count} tiles", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
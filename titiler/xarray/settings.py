@@ -1,5 +1,7 @@
 """Titiler-xarray API settings."""
 
+from typing import Literal, Optional
+
 from pydantic import field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -17,6 +19,55 @@ class ApiSettings(BaseSettings):
     model_config = SettingsConfigDict(env_prefix="TITILER_XARRAY_", env_file=".env")
     cache_host: str = "127.0.0.1"
     enable_cache: bool = True
+    cache_namespace: str = "titiler-xarray"
+    cache_ttl: int = 86400  # seconds, 0 to never expire
+
+    # In-process cache of opened datasets (per worker)
+    enable_dataset_cache: bool = True
+    dataset_cache_maxsize: int = 64 * 1024 * 1024  # bytes
+    dataset_cache_ttl: int = 300  # seconds
+
+    # Rendered tiles cache
+    tile_cache: Optional[Literal["redis", "disk"]] = None
+    tile_cache_ttl: int = 3600  # seconds, 0 to never expire
+    tile_cache_maxsize: int = 512 * 1024 * 1024  # bytes, disk cache only
+    tile_cache_max_item_size: int = 1024 * 1024  # bytes
+    tile_cache_directory: str = "/tmp/titiler-xarray-tiles"
+
+    # Zarr chunks cache, in memory (per worker, for `dataset_cache_ttl`) with an
+    # optional shared tier
+    enable_chunk_cache: bool = True
+    chunk_cache_maxsize: int = 128 * 1024 * 1024  # bytes
+    chunk_cache: Optional[Literal["redis", "disk"]] = None
+    chunk_cache_ttl: int = 3600  # seconds, 0 to never expire
+    chunk_cache_shared_maxsize: int = 2 * 1024 * 1024 * 1024  # bytes, disk cache only
+    chunk_cache_max_item_size: int = 16 * 1024 * 1024  # bytes
+    chunk_cache_directory: str = "/tmp/titiler-xarray-chunks"
+
+    # Regrid regular lon/lat grids with index lookups for the nearest resampling
+    enable_fast_regrid: bool = True
+    warp_map_cache_maxsize: int = 16 * 1024 * 1024  # bytes, index maps (per worker)
+
+    # Background prefetch of the neighbours and children of the served tiles
+    enable_prefetch: bool = False
+    prefetch_max_queue: int = 64  # queued tiles (per worker)
+    prefetch_max_concurrency: int = 4  # tiles prefetched at a time (per worker)
+    prefetch_max_load: int = 8  # tile requests in flight above which prefetch stops
+
+    # Overviews of single resolution datasets, built when low zooms are requested
+    enable_overviews: bool = False
+    overviews_directory: str = "/tmp/titiler-xarray-overviews"  # local path or URL
+    overviews_method: Literal["mean", "nearest"] = "mean"
+
+    # Maximum number of tiles of a batch tiles request
+    batch_max_tiles: int = 64
+    # Maximum number of time steps of a tile stack request
+    stack_max_times: int = 366
+
+    # Threads computing the chunk-wise statistics of a request
+    stats_max_workers: int = 4
+    # Elements read by the approximate statistics
+    approx_size: int = 1024 * 1024
 
     @field_validator("cors_origins")
     def parse_cors_origin(cls, v):
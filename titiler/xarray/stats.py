@@ -0,0 +1,517 @@
+"""Chunk-wise statistics of DataArrays.
+
+The statistics are computed block by block, the blocks following the chunks
+of the dataset, so that at most one block per worker thread is loaded in
+memory, and the partial results are merged.
+"""
+
+import functools
+import itertools
+import math
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+import numpy
+import xarray
+
+T = TypeVar("T")
+
+# Maximum number of elements of a block, when the dataset chunks are larger
+MAX_BLOCK_SIZE = 2**24
+
+# Bins of the histograms the percentiles are interpolated from
+PERCENTILE_BINS = 10000
+
+# Dimensions renamed by `titiler.xarray.reader.arrange_coordinates`
+RENAMED_DIMS = {"lat": "y", "latitude": "y", "lon": "x", "longitude": "x"}
+
+
+def chunk_sizes(da: xarray.DataArray) -> Dict[Hashable, int]:
+    """Size of the dataset chunks along each dimension of the DataArray."""
+    preferred = {
+        RENAMED_DIMS.get(dim, dim) if dim not in da.dims else dim: size
+        for dim, size in (da.encoding.get("preferred_chunks") or {}).items()
+    }
+    sizes = {
+        dim: max(1, min(preferred.get(dim) or da.sizes[dim], da.sizes[dim]))
+        for dim in da.dims
+    }
+
+    # Split the first dimensions of blocks which are too large
+    for dim in da.dims:
+        size = math.prod(sizes.values())
+        if size <= MAX_BLOCK_SIZE:
+            break
+        sizes[dim] = max(1, sizes[dim] * MAX_BLOCK_SIZE // size)
+
+    return sizes
+
+
+def iter_blocks(da: xarray.DataArray) -> Iterator[Dict[Hashable, slice]]:
+    """Iterate over the blocks of a DataArray, as `isel` indexers."""
+    sizes = chunk_sizes(da)
+    ranges = [
+        [
+            slice(start, start + sizes[dim])
+            for start in range(0, da.sizes[dim], sizes[dim])
+        ]
+        for dim in da.dims
+    ]
+    for block in itertools.product(*ranges):
+        yield dict(zip(da.dims, block))
+
+
+def block_size(da: xarray.DataArray, block: Dict[Hashable, slice]) -> int:
+    """Number of elements of a block."""
+    return math.prod(len(range(da.sizes[dim])[sl]) for dim, sl in block.items())
+
+
+def sample_blocks(
+    da: xarray.DataArray,
+    size: int,
+    seed: int = 0,
+) -> Tuple[List[Dict[Hashable, slice]], int]:
+    """
+    Deterministic random sample of blocks with at least `size` elements.
+
+    Returns the sampled blocks and the total number of blocks.
+    """
+    blocks = list(iter_blocks(da))
+    sample: List[Dict[Hashable, slice]] = []
+    sample_size = 0
+    for idx in numpy.random.default_rng(seed).permutation(len(blocks)):
+        if sample_size >= size:
+            break
+        sample.append(blocks[idx])
+        sample_size += block_size(da, blocks[idx])
+
+    return sample, len(blocks)
+
+
+def map_blocks(
+    func: Callable[[numpy.ndarray], T],
+    da: xarray.DataArray,
+    max_workers: int = 1,
+    blocks: Optional[Iterable[Dict[Hashable, slice]]] = None,
+) -> Iterator[T]:
+    """Apply `func` to the values of each block of a DataArray, in a thread pool."""
+    blocks = iter_blocks(da) if blocks is None else blocks
+
+    def _apply(block: Dict[Hashable, slice]) -> T:
+        return func(da.isel(block).values)
+
+    if max_workers <= 1:
+        yield from map(_apply, blocks)
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        yield from executor.map(_apply, blocks)
+
+
+def valid_values(data: numpy.ndarray, nodata: Optional[float] = None) -> numpy.ndarray:
+    """Flat array of the values which are not NaN (or nodata)."""
+    data = data.ravel()
+    mask = ~numpy.isnan(data) if data.dtype.kind == "f" else None
+    if nodata is not None and not numpy.isnan(nodata):
+        nodata_mask = data != nodata
+        mask = nodata_mask if mask is None else mask & nodata_mask
+    return data if mask is None else data[mask]
+
+
+def data_range(
+    da: xarray.DataArray,
+    nodata: Optional[float] = None,
+    max_workers: int = 1,
+    blocks: Optional[Iterable[Dict[Hashable, slice]]] = None,
+) -> Optional[Tuple[float, float]]:
+    """Minimum and maximum of the valid values, None if there are none."""
+
+    def _range(data: numpy.ndarray) -> Optional[Tuple[float, float]]:
+        values = valid_values(data, nodata)
+        if not values.size:
+            return None
+        return values.min().item(), values.max().item()
+
+    ranges = [r for r in map_blocks(_range, da, max_workers, blocks) if r is not None]
+    if not ranges:
+        return None
+
+    minimums, maximums = zip(*ranges)
+    return min(minimums), max(maximums)
+
+
+def histogram(
+    da: xarray.DataArray,
+    bins: Union[int, Sequence[float]] = 10,
+    range: Optional[Tuple[float, float]] = None,
+    nodata: Optional[float] = None,
+    max_workers: int = 1,
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Histogram of the valid values, like `numpy.histogram`.
+
+    The bin edges are computed first, from `range` or the data range when
+    `bins` is a number of bins, then the counts are accumulated block by block.
+    """
+    edges = histogram_edges(da, bins, range, nodata=nodata, max_workers=max_workers)
+
+    def _histogram(data: numpy.ndarray) -> numpy.ndarray:
+        counts, _ = numpy.histogram(valid_values(data, nodata), bins=edges)
+        return counts
+
+    counts = numpy.zeros(len(edges) - 1, dtype="int64")
+    for block_counts in map_blocks(_histogram, da, max_workers):
+        counts += block_counts
+
+    return counts, edges
+
+
+def histogram_edges(
+    da: xarray.DataArray,
+    bins: Union[int, Sequence[float]] = 10,
+    range: Optional[Tuple[float, float]] = None,
+    nodata: Optional[float] = None,
+    max_workers: int = 1,
+    blocks: Optional[Sequence[Dict[Hashable, slice]]] = None,
+) -> numpy.ndarray:
+    """Histogram bin edges, the range defaults to the range of the blocks."""
+    if not isinstance(bins, int):
+        return numpy.asarray(bins, dtype="float64")
+
+    if range is None:
+        range = data_range(da, nodata, max_workers, blocks) or (0, 1)
+
+    # the edges have the precision of the data, like numpy.histogram
+    return numpy.histogram_bin_edges(
+        numpy.empty(0, dtype=da.dtype), bins=bins, range=range
+    )
+
+
+def approx_histogram(
+    da: xarray.DataArray,
+    bins: Union[int, Sequence[float]] = 10,
+    range: Optional[Tuple[float, float]] = None,
+    size: int = 2**20,
+    seed: int = 0,
+    nodata: Optional[float] = None,
+    max_workers: int = 1,
+) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    """
+    Histogram estimated from a random sample of blocks with about `size` elements.
+
+    The counts of the whole DataArray are estimated with a ratio estimator over
+    the sampled blocks (cluster sampling), returned with their standard errors,
+    which are zero when all the blocks are sampled.
+    """
+    blocks, n_blocks = sample_blocks(da, size, seed=seed)
+    edges = histogram_edges(da, bins, range, nodata, max_workers, blocks)
+
+    def _histogram(data: numpy.ndarray) -> numpy.ndarray:
+        counts, _ = numpy.histogram(valid_values(data, nodata), bins=edges)
+        return counts
+
+    block_counts = numpy.array(list(map_blocks(_histogram, da, max_workers, blocks)))
+    block_sizes = numpy.array([block_size(da, block) for block in blocks])
+
+    # counts per element, scaled to the size of the DataArray
+    ratio, ratio_error = ratio_estimate(block_counts, block_sizes, n_blocks)
+    if ratio_error is None:
+        # a single block, the errors of a simple random sample of its elements
+        return ratio * da.size, edges, multinomial_errors(block_counts[0], da.size)
+
+    return ratio * da.size, edges, ratio_error * da.size
+
+
+def ratio_estimate(
+    numerators: numpy.ndarray,
+    denominators: numpy.ndarray,
+    n_blocks: int,
+) -> Tuple[numpy.ndarray, Optional[numpy.ndarray]]:
+    """
+    Ratio estimator over a sample of blocks, with its standard error.
+
+    `numerators` (e.g. counts or sums) and `denominators` (e.g. sizes) are the
+    values of the sampled blocks, out of `n_blocks`. The standard error is None
+    when it can not be estimated (a single block out of many).
+    """
+    ratio = numerators.sum(axis=0) / denominators.sum()
+    n = len(denominators)
+    if n == n_blocks:
+        return ratio, numpy.zeros_like(ratio)
+    if n < 2:
+        return ratio, None
+
+    residuals = numerators - numpy.multiply.outer(denominators, ratio)
+    variance = (1 - n / n_blocks) * residuals.var(axis=0, ddof=1) / n
+    return ratio, numpy.sqrt(variance) / denominators.mean()
+
+
+def multinomial_errors(counts: numpy.ndarray, total: int) -> numpy.ndarray:
+    """
+    Standard errors of counts scaled to `total` elements.
+
+    The counts are assumed to be from a simple random sample of the elements,
+    e.g. a coarser level of a pyramid.
+    """
+    n = counts.sum()
+    if not n:
+        return numpy.zeros(len(counts))
+
+    proportions = counts / n
+    fpc = max(1 - n / total, 0)
+    return total * numpy.sqrt(fpc * proportions * (1 - proportions) / n)
+
+
+def block_moments(data: numpy.ndarray, nodata: Optional[float] = None) -> Dict:
+    """Size, count, sum, sum of squared deviations, min and max of a block."""
+    values = valid_values(data, nodata)
+    moments = {"size": data.size, "count": values.size, "sum": 0.0, "m2": 0.0}
+    if values.size:
+        values = values.astype("float64")
+        mean = values.mean()
+        moments.update(
+            sum=values.sum(),
+            m2=((values - mean) ** 2).sum(),
+            min=values.min(),
+            max=values.max(),
+        )
+    return moments
+
+
+def merge_moments(a: Dict, b: Dict) -> Dict:
+    """Merge the moments of two blocks (Chan et al. parallel algorithm)."""
+    if not a["count"] or not b["count"]:
+        merged = a if a["count"] else b
+        return {**merged, "size": a["size"] + b["size"]}
+
+    count = a["count"] + b["count"]
+    delta = b["sum"] / b["count"] - a["sum"] / a["count"]
+    return {
+        "size": a["size"] + b["size"],
+        "count": count,
+        "sum": a["sum"] + b["sum"],
+        "m2": a["m2"] + b["m2"] + delta**2 * a["count"] * b["count"] / count,
+        "min": min(a["min"], b["min"]),
+        "max": max(a["max"], b["max"]),
+    }
+
+
+def percentile_edges(data_range: Tuple[float, float], integers: bool) -> numpy.ndarray:
+    """
+    Bin edges of the histogram used to compute percentiles.
+
+    Integers are counted one value per bin (exact percentiles), other values
+    in `PERCENTILE_BINS` bins.
+    """
+    minimum, maximum = data_range
+    if integers:
+        return numpy.arange(minimum, maximum + 2) - 0.5
+
+    return numpy.histogram_bin_edges(
+        numpy.empty(0, dtype="float64"), bins=PERCENTILE_BINS, range=data_range
+    )
+
+
+def histogram_percentiles(
+    counts: numpy.ndarray,
+    edges: numpy.ndarray,
+    percentiles: Sequence[float],
+    integers: bool = False,
+) -> List[float]:
+    """
+    Percentiles from a histogram, like `numpy.percentile` (linear method).
+
+    With `integers` (one value per bin), the order statistics are the bin
+    centers and the percentiles are exact. Otherwise values are interpolated
+    within the bins.
+    """
+    cumulative = numpy.cumsum(counts)
+
+    def _bin(rank: float) -> int:
+        idx = int(numpy.searchsorted(cumulative, rank, side="right"))
+        return min(idx, len(counts) - 1)
+
+    values = []
+    for percentile in percentiles:
+        rank = percentile / 100 * (cumulative[-1] - 1)
+        if integers:
+            lower, upper = _bin(math.floor(rank)), _bin(math.ceil(rank))
+            fraction = rank - math.floor(rank)
+            values.append(edges[lower] + 0.5 + fraction * (upper - lower))
+        else:
+            idx = _bin(rank)
+            before = cumulative[idx - 1] if idx else 0
+            fraction = (rank - before + 0.5) / counts[idx] if counts[idx] else 0.5
+            values.append(edges[idx] + fraction * (edges[idx + 1] - edges[idx]))
+
+    return values
+
+
+def statistics(
+    da: xarray.DataArray,
+    percentiles: Optional[Sequence[float]] = None,
+    nodata: Optional[float] = None,
+    max_workers: int = 1,
+) -> Dict[str, Any]:
+    """
+    Statistics of the valid values.
+
+    A first pass merges the moments, min and max of the blocks, a second pass
+    accumulates the histogram the percentiles are interpolated from (exact for
+    integers, within `(max - min) / PERCENTILE_BINS` otherwise).
+    """
+    result, _ = _statistics(da, percentiles, nodata, max_workers)
+    return result
+
+
+def _statistics(
+    da: xarray.DataArray,
+    percentiles: Optional[Sequence[float]] = None,
+    nodata: Optional[float] = None,
+    max_workers: int = 1,
+    blocks: Optional[Sequence[Dict[Hashable, slice]]] = None,
+) -> Tuple[Dict[str, Any], List[Dict]]:
+    """Statistics of the blocks, and the moments of each block."""
+    percentiles = [2, 98] if percentiles is None else percentiles
+    parts = list(
+        map_blocks(lambda data: block_moments(data, nodata), da, max_workers, blocks)
+    )
+    moments = functools.reduce(merge_moments, parts, block_moments(numpy.empty(0)))
+
+    count = moments["count"]
+    result: Dict[str, Any] = {
+        "min": None,
+        "max": None,
+        "mean": None,
+        "std": None,
+        "count": count,
+        "valid_percent": (
+            round(count / moments["size"] * 100, 2) if moments["size"] else 0.0
+        ),
+        **{f"percentile_{p}": None for p in percentiles},
+    }
+    if not count:
+        return result, parts
+
+    result.update(
+        min=float(moments["min"]),
+        max=float(moments["max"]),
+        mean=float(moments["sum"] / count),
+        std=float(numpy.sqrt(moments["m2"] / count)),
+    )
+    if percentiles:
+        data_range = (moments["min"], moments["max"])
+        integers = (
+            da.dtype.kind in "iub" and data_range[1] - data_range[0] < PERCENTILE_BINS
+        )
+        edges = percentile_edges(data_range, integers)
+
+        def _histogram(data: numpy.ndarray) -> numpy.ndarray:
+            counts, _ = numpy.histogram(valid_values(data, nodata), bins=edges)
+            return counts
+
+        counts = sum(
+            map_blocks(_histogram, da, max_workers, blocks),
+            numpy.zeros(len(edges) - 1, dtype="int64"),
+        )
+        values = histogram_percentiles(counts, edges, percentiles, integers)
+        for p, value in zip(percentiles, values):
+            result[f"percentile_{p}"] = float(value)
+
+    return result, parts
+
+
+def approx_statistics(
+    da: xarray.DataArray,
+    percentiles: Optional[Sequence[float]] = None,
+    size: int = 2**20,
+    seed: int = 0,
+    nodata: Optional[float] = None,
+    max_workers: int = 1,
+) -> Dict[str, Any]:
+    """
+    Statistics estimated from a random sample of blocks with about `size` elements.
+
+    The count is scaled to the size of the DataArray, and the standard errors
+    of the mean and of the count are returned in `error`.
+    """
+    blocks, n_blocks = sample_blocks(da, size, seed=seed)
+    result, parts = _statistics(da, percentiles, nodata, max_workers, blocks)
+    if not parts:
+        # an empty DataArray, its statistics are exact
+        result["error"] = {"mean": None, "count": 0.0}
+        return result
+
+    sizes = numpy.array([part["size"] for part in parts])
+    counts = numpy.array([part["count"] for part in parts])
+    sums = numpy.array([part["sum"] for part in parts])
+
+    count, count_error = ratio_estimate(counts, sizes, n_blocks)
+    if count_error is None:
+        # a single block, the errors of a simple random sample of its elements
+        return scale_statistics(result, int(sizes.sum()), da.size)
+
+    mean_error = ratio_estimate(sums, counts, n_blocks)[1] if counts.sum() else None
+    result["count"] = float(count * da.size)
+    result["error"] = {
+        "mean": None if mean_error is None else float(mean_error),
+        "count": float(count_error * da.size),
+    }
+    return result
+
+
+def scale_statistics(result: Dict[str, Any], size: int, total: int) -> Dict[str, Any]:
+    """
+    Scale statistics of a simple random sample of `size` out of `total` elements.
+
+    Used for coarser levels of pyramids, the count is scaled to `total` and the
+    standard errors of the mean and of the count are returned in `error`.
+    """
+    count = result["count"]
+    result["count"] = count * total / size
+    mean_error = None
+    if count:
+        fpc = max(1 - count / result["count"], 0)
+        mean_error = result["std"] * numpy.sqrt(fpc / count)
+
+    count_error = multinomial_errors(numpy.array([count, size - count]), total)[0]
+    result["error"] = {
+        "mean": None if mean_error is None else float(mean_error),
+        "count": float(count_error),
+    }
+    return result
+
+
+def histogram_buckets(
+    counts: numpy.ndarray,
+    edges: numpy.ndarray,
+    errors: Optional[numpy.ndarray] = None,
+) -> List[Dict]:
+    """
+    Histogram as a list of `{"bucket": (lower, upper), "value": count}`.
+
+    Estimated counts are rounded, and their standard `error` is added.
+    """
+    edges = edges.tolist()
+    buckets = [
+        {"bucket": (edges[idx], edges[idx + 1]), "value": round(count)}
+        for idx, count in enumerate(counts.tolist())
+    ]
+    if errors is not None:
+        for bucket, error in zip(buckets, errors.tolist()):
+            bucket["error"] = error
+
+    return buckets
@@ -0,0 +1,118 @@
+"""Sorted time index for datetime selection."""
+
+import datetime as pydatetime
+from typing import Optional
+
+import cftime
+import numpy
+import xarray
+
+# Units of the numeric values of cftime coordinates
+CFTIME_UNITS = "days since 0001-01-01"
+
+
+class TimeIndex:
+    """
+    Sorted numeric view of a time coordinate.
+
+    The coordinate is converted once to numbers (nanoseconds for datetime64,
+    days in the coordinate calendar for cftime objects, or the raw values of
+    not decoded CF times) and datetimes are converted to the same numbers at
+    lookup time. Lookups return positions in the coordinate, for `isel`.
+    """
+
+    def __init__(
+        self,
+        values: numpy.ndarray,
+        units: Optional[str] = None,
+        calendar: Optional[str] = None,
+    ):
+        """Index numeric `values`, datetimes are converted with `units` and `calendar`."""
+        self.units = units
+        self.calendar = calendar
+        self.order = numpy.argsort(values, kind="stable")
+        self.values = values[self.order]
+
+    @classmethod
+    def from_coord(cls, time: xarray.DataArray) -> Optional["TimeIndex"]:
+        """Build the index of a time coordinate, returns None for non-time values."""
+        values = time.values
+        if numpy.issubdtype(values.dtype, numpy.datetime64):
+            return cls(values.astype("datetime64[ns]").view("int64"))
+
+        if values.dtype == "O" and values.size:
+            first = values.flat[0]
+            if isinstance(first, cftime.datetime):
+                calendar = first.calendar
+                return cls(
+                    cftime.date2num(values, CFTIME_UNITS, calendar=calendar),
+                    units=CFTIME_UNITS,
+                    calendar=calendar,
+                )
+            if isinstance(first, pydatetime.datetime):
+                return cls(values.astype("datetime64[ns]").view("int64"))
+
+        # CF times which were not decoded
+        units = time.attrs.get("units", "")
+        if numpy.issubdtype(values.dtype, numpy.number) and " since " in units:
+            return cls(
+                values,
+                units=units,
+                calendar=time.attrs.get("calendar", "standard"),
+            )
+
+        return None
+
+    def to_value(self, dt: str) -> float:
+        """Convert an ISO datetime to the index numbers."""
+        value = numpy.datetime64(dt, "ns")
+        if self.units is None:
+            return value.view("int64")
+
+        date = value.astype("datetime64[us]").item()
+        return cftime.date2num(
+            cftime.datetime(
+                date.year,
+                date.month,
+                date.day,
+                date.hour,
+                date.minute,
+                date.second,
+                date.microsecond,
+                calendar=self.calendar,
+            ),
+            self.units,
+            calendar=self.calendar,
+        )
+
+    def nearest(self, dt: str) -> int:
+        """Position of the time nearest to `dt`."""
+        value = self.to_value(dt)
+        idx = int(numpy.searchsorted(self.values, value))
+        if idx == len(self.values) or (
+            idx > 0 and value - self.values[idx - 1] <= self.values[idx] - value
+        ):
+            idx -= 1
+        return int(self.order[idx])
+
+    def exact(self, dt: str) -> int:
+        """Position of `dt`, raises KeyError when it is not in the index."""
+        value = self.to_value(dt)
+        idx = int(numpy.searchsorted(self.values, value))
+        if idx == len(self.values) or self.values[idx] != value:
+            raise KeyError(dt)
+        return int(self.order[idx])
+
+    def range(self, start: Optional[str], end: Optional[str]) -> numpy.ndarray:
+        """Sorted positions of the times between `start` and `end` (inclusive)."""
+        lower = (
+            numpy.searchsorted(self.values, self.to_value(start), side="left")
+            if start
+            else 0
+        )
+        upper = (
+            numpy.searchsorted(self.values, self.to_value(end), side="right")
+            if end
+            else len(self.values)
+        )
+        return numpy.sort(self.order[lower:upper])